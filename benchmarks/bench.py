@@ -0,0 +1,174 @@
+"""
+Benchmarks for trackopy against a local stand-in Trackobot server.
+
+Every scenario runs against a fresh ``tests.fakeserver.FakeTrackobot``
+with seeded data and a fixed per-request latency, so results from
+different runs and different machines can be compared. Run from the
+repository root::
+
+    python -m benchmarks.bench
+    python -m benchmarks.bench -o before.json
+    python -m benchmarks.bench -o after.json --compare before.json
+"""
+import concurrent.futures
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import click
+
+import trackopy
+from tests.fakeserver import FakeTrackobot
+
+
+GAME = {'result': {'hero': 'Mage', 'opponent': 'Warrior', 'mode': 'ranked', 'coin': False, 'win': True,
+                    'duration': 300, 'added': '2017-06-01T12:00:00.000Z',
+                    'card_history': [{'player': 'me', 'turn': 1, 'card_id': 'CS2_029'}]}}
+STATS_TYPES = ['classes', 'decks', 'arena']
+STATS_RANGES = ['current_month', 'all', 'last_3_days', 'last_24_hours']
+STATS_MODES = ['ranked', 'casual', 'arena', 'all']
+
+
+def history_sequential(trackobot, options):
+    """Page through the whole history one page at a time"""
+    return sum(1 for _ in trackobot.iter_history())
+
+
+def history_prefetch(trackobot, options):
+    """Page through the whole history with pages downloaded ahead of the consumer"""
+    return sum(1 for _ in trackobot.iter_history(prefetch=options['workers']))
+
+
+def history_concurrent(trackobot, options):
+    """Download every page of history over a pool of workers"""
+    return len(trackobot.fetch_history_pages(workers=options['workers']))
+
+
+def upload_bulk(trackobot, options):
+    """Upload many games concurrently"""
+    games = (GAME for _ in range(options['uploads']))
+    return sum(1 for result in trackobot.upload_games(games, workers=options['workers']) if result.ok)
+
+
+def stats_fanout(trackobot, options):
+    """Request every combination of stats type, time range and mode concurrently"""
+    combos = [(t, r, m) for t in STATS_TYPES for r in STATS_RANGES for m in STATS_MODES]
+    with concurrent.futures.ThreadPoolExecutor(max_workers=options['workers']) as pool:
+        results = list(pool.map(lambda c: trackobot.stats(stats_type=c[0], time_range=c[1], mode=c[2]), combos))
+    return len(results)
+
+
+def cli_history(fake, options):
+    """Run "tb history" end to end in a new interpreter, including start up and login"""
+    with tempfile.TemporaryDirectory() as tmp:
+        output = os.path.join(tmp, 'history.json')
+        subprocess.run([sys.executable, '-m', 'trackopy.scripts.tb', '--url', fake.url,
+                        '-u', fake.username, '-p', fake.password, '-l', os.devnull,
+                        'history', '-n', '0', '-w', str(options['workers']), '-o', output],
+                       check=True, stdout=subprocess.DEVNULL)
+        with open(output) as f:
+            return len(json.load(f))
+
+
+# Scenarios taking a client, and those taking the fake server to run the CLI against
+SCENARIOS = [history_sequential, history_prefetch, history_concurrent, upload_bulk, stats_fanout]
+CLI_SCENARIOS = [cli_history]
+
+
+def _percentile(ordered, fraction):
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] if ordered else None
+
+
+def _run(scenario, options):
+    """Run one scenario warmup + repeats times, each against a fresh server and client"""
+    times, durations, items, requests = [], [], 0, 0
+    for repeat in range(options['warmup'] + options['repeats']):
+        measured = repeat >= options['warmup']
+        with FakeTrackobot(games=options['games'], latency=options['latency'], seed=options['seed']) as fake:
+            if scenario in CLI_SCENARIOS:
+                start = time.perf_counter()
+                count = scenario(fake, options)
+                elapsed = time.perf_counter() - start
+                sent = sum(fake.requests.values())
+            else:
+                events = []
+                with trackopy.Trackobot(fake.username, fake.password, url=fake.url) as trackobot:
+                    trackobot.login()
+                    trackobot.add_hook(events.append)
+                    start = time.perf_counter()
+                    count = scenario(trackobot, options)
+                    elapsed = time.perf_counter() - start
+                sent = len(events)
+                if measured:
+                    durations.extend(e.total for e in events if e.total is not None)
+        if measured:
+            times.append(elapsed)
+            items, requests = count, sent
+    durations.sort()
+    median = statistics.median(times)
+    return {
+        'items': items,
+        'requests': requests,
+        'median': median,
+        'min': min(times),
+        'max': max(times),
+        'stdev': statistics.stdev(times) if len(times) > 1 else 0.0,
+        'items_per_second': items / median,
+        'request_p50': _percentile(durations, 0.5),
+        'request_p99': _percentile(durations, 0.99),
+    }
+
+
+@click.command()
+@click.option('-s', '--scenario', 'names', multiple=True,
+              type=click.Choice([s.__name__ for s in SCENARIOS + CLI_SCENARIOS]),
+              help='Run only this scenario. May be given more than once')
+@click.option('-r', '--repeats', default=5, type=click.IntRange(min=1), help='Measured runs of each scenario')
+@click.option('--warmup', default=1, type=click.IntRange(min=0), help='Unmeasured runs before the measured ones')
+@click.option('-g', '--games', default=600, type=click.IntRange(min=1), help='Games in the fake account')
+@click.option('-u', '--uploads', default=100, type=click.IntRange(min=1), help='Games uploaded by upload_bulk')
+@click.option('-w', '--workers', default=4, type=click.IntRange(min=1), help='Workers for concurrent scenarios')
+@click.option('-l', '--latency', default=0.02, type=click.FloatRange(min=0),
+              help='Seconds the fake server waits before answering each request')
+@click.option('--seed', default=0, help='Seed for the fake account')
+@click.option('-o', '--output', default=None, help='A file to write the results to as JSON')
+@click.option('-c', '--compare', default=None, type=click.Path(exists=True, dir_okay=False),
+              help='Results written by an earlier run to compare against')
+def main(names, repeats, warmup, games, uploads, workers, latency, seed, output, compare):
+    """Benchmark trackopy against a local fake Trackobot server"""
+    options = {'repeats': repeats, 'warmup': warmup, 'games': games, 'uploads': uploads,
+               'workers': workers, 'latency': latency, 'seed': seed}
+    baseline = None
+    if compare is not None:
+        with open(compare) as f:
+            baseline = json.load(f)
+        if baseline['options'] != options:
+            click.secho('Warning: {} was run with different options: {}'.format(compare, baseline['options']),
+                        fg='yellow', err=True)
+    scenarios = [s for s in SCENARIOS + CLI_SCENARIOS if not names or s.__name__ in names]
+    click.echo('{:<20} {:>7} {:>8} {:>10} {:>10} {:>10} {:>11} {:>9}'.format(
+        'scenario', 'items', 'requests', 'median ms', 'min ms', 'stdev ms', 'items/s', 'change'))
+    results = {}
+    for scenario in scenarios:
+        name = scenario.__name__
+        result = results[name] = _run(scenario, options)
+        change = ''
+        if baseline is not None and name in baseline['results']:
+            change = '{:+.1f}%'.format((result['median'] / baseline['results'][name]['median'] - 1) * 100)
+        click.echo('{:<20} {:>7} {:>8} {:>10.1f} {:>10.1f} {:>10.1f} {:>11.1f} {:>9}'.format(
+            name, result['items'], result['requests'], result['median'] * 1000, result['min'] * 1000,
+            result['stdev'] * 1000, result['items_per_second'], change))
+    if output is not None:
+        report = {'trackopy': trackopy.__version__, 'python': platform.python_version(),
+                  'platform': platform.platform(), 'options': options, 'results': results}
+        with open(output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -18,7 +18,7 @@ setup(
     author_email='seanmckaybeck@gmail.com',
     description='Python wrapper for the Trackobot API',
     long_description=readme,
-    packages=find_packages(),#['trackopy'],
+    packages=find_packages(exclude=['benchmarks', 'benchmarks.*', 'tests', 'tests.*']),
     zip_safe=False,
     include_package_data=True,
     platforms='any',
@@ -26,6 +26,11 @@ setup(
         'requests',
         'click'
     ],
+    extras_require={
+        'async': ['aiohttp'],
+        'fast': ['orjson'],
+        'export': ['pyarrow'],
+    },
     classifiers=[
         'Environment :: Web Environment',
         'Intended Audience :: Developers',
@@ -0,0 +1,319 @@
+"""
+A stand-in Trackobot server for offline tests and benchmarks.
+
+It listens on localhost and implements the endpoints used by trackopy over
+real HTTP, so connection handling, keep-alive and JSON encoding are all
+exercised. Games are generated from a seed, so every run serves the same
+data.
+"""
+import base64
+import datetime
+import hashlib
+import http.server
+import json
+import random
+import re
+import threading
+import time
+import urllib.parse
+
+from trackopy import LocalStats
+
+
+HEROES = ['Druid', 'Hunter', 'Mage', 'Paladin', 'Priest', 'Rogue', 'Shaman', 'Warlock', 'Warrior']
+MODES = ['ranked', 'casual', 'arena', 'friendly']
+DECKS = ['Aggro', 'Midrange', 'Control', 'Tempo', None]
+CARDS = [('CS2_029', 'Fireball', 4), ('EX1_277', 'Arcane Missiles', 1), ('CS2_032', 'Flamestrike', 7),
+         ('CS2_124', 'Wolfrider', 3), ('EX1_066', 'Acidic Swamp Ooze', 2), ('CS2_182', 'Chillwind Yeti', 4)]
+USER_ID = 4242
+# Deck ID to name, as listed by /profile/settings/decks.json and named in games
+DECK_NAMES = {i * 10 + j: '{} {}'.format(deck, hero)
+              for i, hero in enumerate(HEROES) for j, deck in enumerate(DECKS) if deck}
+
+_RESULT_PATH = re.compile(r'^/profile/results/(\d+)$')
+_RENAME_PATH = re.compile(r'^/users/(\d+)/rename$')
+_STATS_PATH = re.compile(r'^/profile/stats/(classes|decks|arena)\.json$')
+
+
+def make_game(rng, game_id, added):
+    """A game as returned by /profile.json, with a short card history"""
+    mode = rng.choice(MODES)
+    hero, hero_deck = rng.choice(HEROES), rng.choice(DECKS)
+    opponent, opponent_deck = rng.choice(HEROES), rng.choice(DECKS)
+    return {
+        'id': game_id,
+        'mode': mode,
+        'hero': hero,
+        'hero_deck': '{} {}'.format(hero_deck, hero) if hero_deck else None,
+        'opponent': opponent,
+        'opponent_deck': '{} {}'.format(opponent_deck, opponent) if opponent_deck else None,
+        'coin': rng.random() < 0.5,
+        'result': 'win' if rng.random() < 0.5 else 'loss',
+        'duration': rng.randint(120, 1200),
+        'rank': rng.randint(1, 25) if mode == 'ranked' else None,
+        'legend': None,
+        'note': None,
+        'added': added.strftime('%Y-%m-%dT%H:%M:%S.000Z'),
+        'card_history': [
+            {'player': rng.choice(['me', 'opponent']), 'turn': turn,
+             'card': dict(zip(('id', 'name', 'mana'), rng.choice(CARDS)))}
+            for turn in range(1, rng.randint(4, 12))
+        ],
+    }
+
+
+class FakeTrackobot:
+    """
+    Serve a fake Trackobot account on localhost.
+
+    Every request sleeps for ``latency`` seconds before it is answered.
+    With ``error_rate`` set, that fraction of requests, chosen by a seeded
+    random number generator, is answered with ``error_status`` instead.
+    ``fail_next()`` makes the next requests fail for deterministic tests.
+    ``requests`` counts the requests received by method and path.
+
+    :param int games: The number of games in the account
+    :param int per_page: The number of games on each page of history
+    :param float latency: Seconds to wait before answering each request
+    :param float error_rate: The fraction of requests to fail, from 0 to 1
+    :param int error_status: The status code failed requests are answered with
+    :param int seed: Seed for the games and for choosing failed requests
+    :param str username: The username that may log in
+    :param str password: The password that may log in
+    :param dict accounts: Other usernames and passwords that may log in, all to the same games
+    """
+    def __init__(self, games: int=150, per_page: int=15, latency: float=0.0, error_rate: float=0.0,
+                 error_status: int=503, seed: int=0, username: str='fake-user-1234', password: str='password',
+                 accounts: dict=None):
+        self.per_page = per_page
+        self.latency = latency
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.username = username
+        self.password = password
+        self.displayname = username
+        self.accounts = dict(accounts or {}, **{username: password})
+        self.tracking = True
+        self.requests = {}
+        self.not_modified = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._failures = []
+        self._sessions = set()
+        now = datetime.datetime(2017, 6, 1, tzinfo=datetime.timezone.utc)
+        self.games = {}
+        for game_id in range(1, games + 1):
+            added = now - datetime.timedelta(hours=games - game_id)
+            self.games[game_id] = make_game(self._rng, game_id, added)
+        self._next_id = games + 1
+        self._server = None
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        """The base URL to pass to Trackobot(url=...)"""
+        host, port = self._server.server_address[:2]
+        return 'http://{}:{}'.format(host, port)
+
+    def start(self) -> 'FakeTrackobot':
+        """Start serving on a free port in a background thread"""
+        handler = type('Handler', (_Handler,), {'fake': self})
+        self._server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, args=(0.05,), daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop serving and close the listening socket"""
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def fail_next(self, count: int=1, status: int=None):
+        """Answer the next count requests with status, which defaults to error_status"""
+        with self._lock:
+            self._failures.extend([status or self.error_status] * count)
+
+    def _injected_failure(self):
+        with self._lock:
+            if self._failures:
+                return self._failures.pop(0)
+            if self.error_rate and self._rng.random() < self.error_rate:
+                return self.error_status
+        return None
+
+    def _count(self, method, path):
+        key = (method, _RESULT_PATH.sub('/profile/results/:id', path))
+        with self._lock:
+            self.requests[key] = self.requests.get(key, 0) + 1
+
+    def _conditional(self, handler, payload, etag=None):
+        """Answer a GET with an ETag, or with 304 Not Modified if the client already has that ETag"""
+        if etag is None:
+            etag = '"{}"'.format(hashlib.sha1(json.dumps(payload, sort_keys=True).encode()).hexdigest()[:16])
+        if handler.headers.get('If-None-Match') == etag:
+            with self._lock:
+                self.not_modified += 1
+            return 304, b'', {'ETag': etag}
+        return 200, payload, {'ETag': etag}
+
+    def _history_page(self, key, games, page):
+        total = max(1, -(-len(games) // self.per_page))
+        chunk = games[(page - 1) * self.per_page:page * self.per_page]
+        meta = {'current_page': page, 'next_page': page + 1 if page < total else None,
+                'prev_page': page - 1 if page > 1 else None, 'total_pages': total, 'total_items': len(games)}
+        return {key: chunk, 'meta': meta}
+
+    def _newest_first(self):
+        with self._lock:
+            return [self.games[game_id] for game_id in sorted(self.games, reverse=True)]
+
+    def _stats(self, stats_type, query):
+        def date(name):
+            value = query.get(name)
+            if value is None:
+                return None
+            return datetime.datetime.strptime(value, '%Y-%m-%d').replace(tzinfo=datetime.timezone.utc)
+
+        def number(name):
+            return int(query[name]) if name in query else None
+
+        time_range = query.get('time_range', 'all')
+        start, end = date('start'), date('end')
+        games = self._newest_first()
+        latest = max((g['added'] for g in games), default=None)
+        now = datetime.datetime.fromisoformat(latest.replace('Z', '+00:00')) if latest else None
+        return LocalStats(games, DECK_NAMES).stats(stats_type, time_range, query.get('mode', 'all'), start, end,
+                                       query.get('as_hero'), query.get('vs_hero'),
+                                       number('as_deck'), number('vs_deck'), now=now)
+
+    def handle(self, handler, method, path, query, body):
+        """Route one request, returning its status, body and extra headers"""
+        if path == '/users.json' and method == 'POST':
+            return 200, {'username': self.username, 'password': self.password}, {}
+        if path == '/sessions' and method == 'POST':
+            form = urllib.parse.parse_qs(body.decode())
+            username, password = form.get('username', [None])[0], form.get('password', [None])[0]
+            if username not in self.accounts or self.accounts[username] != password:
+                return 200, b'<html>Invalid credentials</html>', {}
+            token = '{:032x}'.format(self._rng.getrandbits(128))
+            with self._lock:
+                self._sessions.add(token)
+            return 200, b'<html>Welcome</html>', {'Set-Cookie': '_trackobot_session={}; Path=/'.format(token)}
+        if not self._authorized(handler):
+            return 401, {'error': 'You need to sign in or sign up before continuing.'}, {}
+        if path == '/profile' and method == 'GET':
+            page = '<html><form id="edit_user_{}" class="edit_user"></form></html>'.format(USER_ID)
+            return 200, page.encode(), {'Content-Type': 'text/html'}
+        match = _RENAME_PATH.match(path)
+        if match and method == 'POST':
+            form = urllib.parse.parse_qs(body.decode())
+            self.displayname = form.get('user[displayname]', [self.displayname])[0]
+            return 200, b'<html>Renamed</html>', {'Content-Type': 'text/html'}
+        if path == '/one_time_auth.json' and method == 'POST':
+            return 200, {'url': '{}/one_time_auth/{:x}'.format(self.url, self._rng.getrandbits(64))}, {}
+        if path == '/profile.json' and method == 'GET':
+            games = self._newest_first()
+            if 'query' in query:
+                needle = query['query'].lower()
+                games = [g for g in games if any(needle in str(g[k]).lower() for k in ('hero', 'opponent', 'note'))]
+            return 200, self._history_page('history', games, int(query.get('page', 1))), {}
+        if path == '/profile/arena.json' and method == 'GET':
+            games = [g for g in self._newest_first() if g['mode'] == 'arena']
+            return 200, self._history_page('arena', games, int(query.get('page', 1))), {}
+        match = _STATS_PATH.match(path)
+        if match and method == 'GET':
+            return self._conditional(handler, self._stats(match.group(1), query))
+        if path == '/profile/settings/decks.json' and method == 'GET':
+            decks = {hero.lower(): [{'id': i * 10 + j, 'name': DECK_NAMES[i * 10 + j]}
+                                    for j, deck in enumerate(DECKS) if deck]
+                     for i, hero in enumerate(HEROES)}
+            return self._conditional(handler, {'decks': decks}, '"decks-v1"')
+        if path == '/profile/settings/account/reset' and method == 'POST':
+            modes = urllib.parse.parse_qs(body.decode()).get('reset_modes[]', [])
+            with self._lock:
+                for game_id in [i for i, g in self.games.items() if g['mode'] in modes]:
+                    del self.games[game_id]
+            return 200, b'<html>Reset</html>', {'Content-Type': 'text/html'}
+        if path == '/profile/settings/decks/toggle' and method == 'POST':
+            self.tracking = urllib.parse.parse_qs(body.decode()).get('user[deck_tracking]') == ['true']
+            return 200, b'<html>Saved</html>', {'Content-Type': 'text/html'}
+        if path == '/profile/results.json' and method == 'POST':
+            try:
+                result = json.loads(body.decode())['result']
+            except (ValueError, KeyError, TypeError):
+                return 422, {'error': 'result is missing'}, {}
+            with self._lock:
+                game_id = self._next_id
+                self._next_id += 1
+                game = dict(result, id=game_id)
+                game.setdefault('added', datetime.datetime.now(datetime.timezone.utc)
+                                .strftime('%Y-%m-%dT%H:%M:%S.000Z'))
+                if 'win' in game:
+                    game['result'] = 'win' if game.pop('win') else 'loss'
+                self.games[game_id] = game
+            return 201, {'result': game}, {}
+        match = _RESULT_PATH.match(path)
+        if match and method in ('PUT', 'DELETE'):
+            game_id = int(match.group(1))
+            with self._lock:
+                if game_id not in self.games:
+                    return 404, {'error': 'not found'}, {}
+                if method == 'DELETE':
+                    del self.games[game_id]
+                else:
+                    self.games[game_id].update(json.loads(body.decode()))
+            return 204, b'', {}
+        return 404, {'error': 'not found'}, {}
+
+    def _authorized(self, handler):
+        cookie = handler.headers.get('Cookie', '')
+        for part in cookie.split(';'):
+            name, _, value = part.strip().partition('=')
+            if name == '_trackobot_session' and value in self._sessions:
+                return True
+        auth = handler.headers.get('Authorization', '')
+        if auth.startswith('Basic '):
+            username, _, password = base64.b64decode(auth[6:]).decode().partition(':')
+            return self.accounts.get(username) == password
+        return False
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+    fake = None
+
+    def _dispatch(self):
+        url = urllib.parse.urlsplit(self.path)
+        query = dict(urllib.parse.parse_qsl(url.query))
+        body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        self.fake._count(self.command, url.path)
+        if self.fake.latency:
+            time.sleep(self.fake.latency)
+        status = self.fake._injected_failure()
+        if status is not None:
+            status, payload, headers = status, {'error': 'injected failure'}, {}
+        else:
+            status, payload, headers = self.fake.handle(self, self.command, url.path, query, body)
+        if not isinstance(payload, bytes):
+            payload = json.dumps(payload).encode()
+            headers.setdefault('Content-Type', 'application/json')
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    do_GET = do_POST = do_PUT = do_DELETE = _dispatch
+
+    def log_message(self, format, *args):
+        pass
@@ -0,0 +1,95 @@
+import asyncio
+import unittest
+
+from trackopy import AsyncTrackobot
+from trackopy import aio
+
+from .fakeserver import FakeTrackobot
+from .test_trackobot import USERNAME, PASSWORD
+
+
+@unittest.skipIf(aio.aiohttp is None, 'aiohttp is not installed')
+class TestAsyncTB(unittest.TestCase):
+    def run_async(self, coro):
+        return asyncio.run(coro)
+
+    def test_history(self):
+        async def go():
+            async with AsyncTrackobot(USERNAME, PASSWORD) as t:
+                return await asyncio.gather(t.history(page=1), t.arena_history(page=1))
+        history, arena = self.run_async(go())
+        assert 'history' in history
+        assert 'arena' in arena
+
+    def test_stats(self):
+        async def go():
+            async with AsyncTrackobot(USERNAME, PASSWORD) as t:
+                return await t.stats(stats_type='classes', as_hero='shaman')
+        stats = self.run_async(go())
+        assert 'stats' in stats
+
+    def test_validation(self):
+        async def go():
+            async with AsyncTrackobot(USERNAME, PASSWORD) as t:
+                with self.assertRaises(ValueError):
+                    await t.stats(stats_type='badstr')
+                with self.assertRaises(ValueError):
+                    await t.modify_metadata(111, 'foo', 'bar')
+                with self.assertRaises(ValueError):
+                    await t.reset(modes=['foobar'])
+        self.run_async(go())
+
+    def test_bad_login(self):
+        async def go():
+            async with AsyncTrackobot(USERNAME, 'wrong'):
+                pass
+        with self.assertRaises(ValueError):
+            self.run_async(go())
+
+
+@unittest.skipIf(aio.aiohttp is None, 'aiohttp is not installed')
+class TestAsyncOffline(unittest.TestCase):
+    """Offline tests against a local stand-in for trackobot.com"""
+    def setUp(self):
+        self.fake = FakeTrackobot(games=40, per_page=15, accounts={'other': 'other-password'}).start()
+
+    def tearDown(self):
+        self.fake.stop()
+
+    def test_requests(self):
+        t = AsyncTrackobot(self.fake.username, self.fake.password, url=self.fake.url)
+
+        async def go():
+            async with t:
+                return await asyncio.gather(t.history(page=3), t.stats(stats_type='classes', mode='all'),
+                                            t.decks(), t.upload_game({'result': {'hero': 'Mage', 'win': True}}))
+        history, stats, decks, game = asyncio.run(go())
+        assert [g['id'] for g in history['history']] == list(range(10, 0, -1))
+        assert stats['stats']['overall']['total'] == 40
+        assert 'decks' in decks
+        assert self.fake.games[game['result']['id']]['hero'] == 'Mage'
+
+    def test_shared_connector(self):
+        async def go():
+            connector = aio.aiohttp.TCPConnector(limit=2)
+            try:
+                async with AsyncTrackobot(self.fake.username, self.fake.password, connector=connector,
+                                          url=self.fake.url) as a, \
+                        AsyncTrackobot('other', 'other-password', connector=connector, url=self.fake.url) as b:
+                    pages = await asyncio.gather(a.history(), b.history())
+                assert not connector.closed
+                return pages
+            finally:
+                await connector.close()
+        assert all(len(page['history']) == 15 for page in asyncio.run(go()))
+
+    def test_bad_login(self):
+        async def go():
+            async with AsyncTrackobot(self.fake.username, 'wrong', url=self.fake.url):
+                pass
+        with self.assertRaises(ValueError):
+            asyncio.run(go())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+import datetime
+import json
+import os
+import tempfile
+import unittest
+
+from trackopy import Game, HistoryArchive
+
+
+def game(game_id, hours, **fields):
+    added = datetime.datetime(2017, 3, 1, tzinfo=datetime.timezone.utc) + datetime.timedelta(hours=hours)
+    return dict({'id': game_id, 'added': added.strftime('%Y-%m-%dT%H:%M:%S.000Z'), 'mode': 'ranked',
+                 'hero': 'Mage', 'opponent': 'Rogue', 'result': 'win', 'card_history': []}, **fields)
+
+
+class TestArchive(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'history.archive')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_append_and_get(self):
+        with HistoryArchive(self.path) as archive:
+            assert archive.append([game(3, 2), game(2, 1), game(1, 0)]) == 3
+            assert archive.append([game(3, 2), game(2, 1)]) == 0
+            assert archive.append([game(2, 1, note='changed')]) == 1
+            assert archive.get(2)['note'] == 'changed'
+            assert archive.get(4) is None
+            assert isinstance(archive.get(1, typed=True), Game)
+        with HistoryArchive(self.path) as archive:
+            assert len(archive) == 3 and 2 in archive
+            assert archive.get(2)['note'] == 'changed'
+
+    def test_between(self):
+        with HistoryArchive(self.path) as archive:
+            archive.append([game(i, i) for i in range(10, 0, -1)])
+            archive.append([{'id': 99, 'mode': 'arena'}])
+            start = datetime.datetime(2017, 3, 1, 3)
+            end = datetime.datetime(2017, 3, 1, 6)
+            assert [g['id'] for g in archive.between(start, end)] == [3, 4, 5]
+            assert [g['id'] for g in archive.between(start=datetime.datetime(2017, 3, 1, 9))] == [9, 10]
+            assert [g['id'] for g in archive.between(end=datetime.datetime(2017, 3, 1, 2))] == [1]
+            assert [g['id'] for g in archive][0] == 99
+            assert len(list(archive)) == 11
+
+    def test_recovery(self):
+        with HistoryArchive(self.path) as archive:
+            archive.append([game(1, 0), game(2, 1)])
+        with open(self.path, 'ab') as f:
+            f.write(b'{"id": 3, "add')
+        with HistoryArchive(self.path) as archive:
+            assert archive.ids() == [1, 2]
+            archive.append([game(3, 2)])
+        os.remove(self.path + '.idx')
+        with HistoryArchive(self.path) as archive:
+            assert sorted(archive.ids()) == [1, 2, 3]
+            assert archive.get(3)['id'] == 3
+
+    def test_readers_do_not_write(self):
+        with HistoryArchive(self.path) as archive:
+            archive.append([game(1, 0), game(2, 1)])
+        with open(self.path + '.idx', 'rb') as f:
+            index = f.read()
+        with open(self.path, 'ab') as f:
+            f.write((json.dumps(game(3, 2)) + '\n').encode() + b'{"id": 4, "add')
+        size = os.path.getsize(self.path)
+        with HistoryArchive(self.path) as archive:
+            assert archive.ids() == [1, 2, 3]
+            assert [g['id'] for g in archive] == [1, 2, 3]
+        assert os.path.getsize(self.path) == size
+        with open(self.path + '.idx', 'rb') as f:
+            assert f.read() == index
+        with HistoryArchive(self.path) as archive:
+            archive.append([game(5, 4)])
+        with HistoryArchive(self.path) as archive:
+            assert archive.ids() == [1, 2, 3, 5]
+        assert os.path.getsize(self.path + '.idx') == 2 * len(index)
+
+
+if __name__ == '__main__':
+    unittest.main()
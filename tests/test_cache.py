@@ -0,0 +1,56 @@
+import os
+import tempfile
+import time
+import unittest
+
+from trackopy import ResponseCache
+from trackopy.cache import CacheEntry
+
+
+class TestResponseCache(unittest.TestCase):
+    def test_ttl(self):
+        cache = ResponseCache(ttls={'/profile/': 10, '/profile/stats/': 60})
+        assert cache.ttl('/profile/stats/decks.json') == 60
+        assert cache.ttl('/profile/settings/decks.json') == 10
+        assert cache.ttl('/users.json') == 0
+
+    def test_lru(self):
+        cache = ResponseCache(max_entries=2)
+        cache.set('a', CacheEntry('1', time.time() + 60))
+        cache.set('b', CacheEntry('2', time.time() + 60))
+        cache.get('a')
+        cache.set('c', CacheEntry('3', time.time() + 60))
+        assert len(cache) == 2
+        assert cache.get('b') is None
+        assert cache.get('a').body == '1'
+
+    def test_entry(self):
+        entry = CacheEntry('{}', time.time() - 1, etag='"abc"', last_modified='Wed, 01 Mar 2017 10:00:00 GMT')
+        assert not entry.fresh()
+        assert entry.validators() == {'If-None-Match': '"abc"',
+                                      'If-Modified-Since': 'Wed, 01 Mar 2017 10:00:00 GMT'}
+        assert CacheEntry('{}', time.time() + 60).validators() == {}
+
+    def test_invalidate(self):
+        cache = ResponseCache()
+        cache.set('user /profile/stats/decks.json?mode=all', CacheEntry('1', time.time() + 60))
+        cache.set('user /profile/settings/decks.json?', CacheEntry('2', time.time() + 60))
+        cache.invalidate('user /profile/stats/')
+        assert len(cache) == 1
+        cache.invalidate()
+        assert len(cache) == 0
+
+    def test_persistence(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'cache.json')
+            cache = ResponseCache(path=path)
+            cache.set('a', CacheEntry('{"decks": []}', time.time() + 60, etag='"x"'))
+            cache.save()
+            entry = ResponseCache(path=path).get('a')
+            assert entry.body == '{"decks": []}'
+            assert entry.etag == '"x"'
+            assert entry.fresh()
+
+
+if __name__ == '__main__':
+    unittest.main()
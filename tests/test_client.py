@@ -0,0 +1,283 @@
+import concurrent.futures
+import datetime
+import json
+import os
+import tempfile
+import time
+import unittest
+
+from click.testing import CliRunner
+
+from trackopy import Game, HistoryArchive, RequestScheduler, ResponseCache, RetryPolicy, Trackobot
+from trackopy.scripts.tb import cli
+from tests.fakeserver import FakeTrackobot
+
+
+class TestClient(unittest.TestCase):
+    """Offline tests against a local stand-in for trackobot.com"""
+    def setUp(self):
+        self.fake = FakeTrackobot(games=100, per_page=15).start()
+        scheduler = RequestScheduler(retry=RetryPolicy(backoff=0.01))
+        self.t = Trackobot(self.fake.username, self.fake.password, url=self.fake.url, scheduler=scheduler)
+
+    def tearDown(self):
+        self.t.close()
+        self.fake.stop()
+
+    def test_login(self):
+        t = Trackobot(self.fake.username, 'wrong', url=self.fake.url)
+        with self.assertRaises(ValueError):
+            t.login()
+        t.close()
+        self.t.decks()
+        self.t.history()
+        assert self.fake.requests[('POST', '/sessions')] == 2
+
+    def test_history_pages(self):
+        games = self.t.fetch_history_pages(workers=4)
+        assert [g['id'] for g in games] == list(range(100, 0, -1))
+        assert [g['id'] for g in self.t.iter_history(prefetch=2)] == list(range(100, 0, -1))
+        typed = list(self.t.iter_history(typed=True, count=2))
+        assert [g.id for g in typed] == list(range(100, 70, -1))
+        assert typed[0] == Game.from_dict(self.fake.games[100])
+        assert self.fake.requests[('GET', '/profile.json')] == 16
+        assert list(self.t.iter_history_pages(count=0, prefetch=2)) == []
+        assert list(self.t.iter_history_pages(count=0)) == []
+        assert self.fake.requests[('GET', '/profile.json')] == 16
+
+    @unittest.skipIf(os.name != 'posix', 'file modes are POSIX only')
+    def test_save_session_mode(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'session.json')
+            with open(path, 'w') as f:
+                f.write('{}')
+            os.chmod(path, 0o644)
+            self.t.login()
+            self.t.save_session(path)
+            assert os.stat(path).st_mode & 0o777 == 0o600
+            assert os.listdir(tmp) == ['session.json']
+            with Trackobot.from_saved_session(path, url=self.fake.url) as t:
+                assert 'decks' in t.decks()
+
+    def test_retry(self):
+        self.t.login()
+        self.fake.fail_next(2)
+        assert len(self.t.history()['history']) == 15
+        assert self.fake.requests[('GET', '/profile.json')] == 3
+
+    def test_bulk(self):
+        games = [{'result': {'hero': 'Mage', 'opponent': 'Rogue', 'win': True, 'mode': 'ranked'}}] * 5
+        results = list(self.t.upload_games(games, workers=3))
+        assert all(r.ok for r in results)
+        ids = [r.result['result']['id'] for r in results]
+        assert all(r.ok for r in self.t.patch_metadata_many([(i, {'note': 'bulk'}) for i in ids]))
+        assert all(self.fake.games[i]['note'] == 'bulk' for i in ids)
+        assert all(r.ok for r in self.t.delete_games(ids))
+        assert not any(i in self.fake.games for i in ids)
+
+    def test_stats(self):
+        stats = self.t.stats(stats_type='classes', mode='all')['stats']
+        assert stats['overall']['total'] == 100
+        assert sum(r['total'] for r in stats['as_class'].values()) == 100
+
+    def test_custom_range(self):
+        stats = self.t.stats(stats_type='classes', time_range='custom', start=datetime.datetime(2017, 5, 29),
+                             end=datetime.datetime(2017, 5, 30))['stats']
+        assert stats['overall']['total'] == 48
+
+    def test_stats_timeseries(self):
+        series = self.t.stats_timeseries(datetime.date(2017, 5, 27), datetime.date(2017, 5, 31))
+        assert [r['start'] for r in series] == ['2017-05-27', '2017-05-28', '2017-05-29', '2017-05-30', '2017-05-31']
+        assert [r['total'] for r in series] == [3, 24, 24, 24, 24]
+        weeks = self.t.stats_timeseries(datetime.date(2017, 5, 27), datetime.date(2017, 5, 31), bucket='week')
+        assert [(r['start'], r['end'], r['total']) for r in weeks] == [('2017-05-22', '2017-05-28', 27),
+                                                                      ('2017-05-29', '2017-06-04', 73)]
+        with self.assertRaises(ValueError):
+            self.t.stats_timeseries(datetime.date(2017, 5, 27), datetime.date(2017, 5, 31), bucket='month')
+
+    def test_stats_timeseries_cache(self):
+        now = datetime.datetime(2017, 5, 31, 12, tzinfo=datetime.timezone.utc)
+        with Trackobot(self.fake.username, self.fake.password, url=self.fake.url, cache=ResponseCache(ttls={})) as t:
+            first = t.stats_timeseries(datetime.date(2017, 5, 27), datetime.date(2017, 5, 31), now=now)
+            assert self.fake.requests[('GET', '/profile/stats/classes.json')] == 5
+            assert t.stats_timeseries(datetime.date(2017, 5, 27), datetime.date(2017, 5, 31), now=now) == first
+            assert self.fake.requests[('GET', '/profile/stats/classes.json')] == 7
+
+    def test_stats_matrix(self):
+        result = self.t.stats_matrix(mode='all')
+        assert len(result['matrix']) == 9
+        assert sum(row['total'] for row in result['overall'].values()) == 100
+        assert sum(cell['total'] for row in result['matrix'].values() for cell in row.values()) == 100
+        shaman = self.t.stats(stats_type='classes', as_hero='shaman')['stats']
+        assert result['matrix']['Shaman'] == shaman['vs_class']
+        assert self.fake.requests[('GET', '/profile/stats/classes.json')] == 10
+        decks = self.t.stats_matrix(stats_type='decks', rows=[60, 61])
+        assert set(decks['matrix']) <= {'Aggro Shaman', 'Midrange Shaman'}
+        with self.assertRaises(ValueError):
+            self.t.stats_matrix(stats_type='arena')
+
+    def test_inflight_dedup(self):
+        self.t.login()
+        self.fake.latency = 0.1
+        with concurrent.futures.ThreadPoolExecutor(max_workers=4) as pool:
+            results = list(pool.map(lambda _: self.t.stats(stats_type='classes'), range(4)))
+        assert self.fake.requests[('GET', '/profile/stats/classes.json')] == 1
+        assert all(r == results[0] for r in results)
+        assert len({id(r) for r in results}) == 4
+
+    def test_cache_hits(self):
+        with Trackobot(self.fake.username, self.fake.password, url=self.fake.url, cache=ResponseCache()) as t:
+            assert t.decks() == t.decks()
+            first = t.stats(stats_type='classes', mode='all')
+            assert t.stats(stats_type='classes', mode='all') == first
+            t.stats(stats_type='classes', mode='ranked')
+        assert self.fake.requests[('GET', '/profile/settings/decks.json')] == 1
+        assert self.fake.requests[('GET', '/profile/stats/classes.json')] == 2
+
+    def test_cache_invalidation(self):
+        def total():
+            return t.stats(stats_type='classes', mode='all')['stats']['overall']['total']
+
+        with Trackobot(self.fake.username, self.fake.password, url=self.fake.url, cache=ResponseCache()) as t:
+            t.decks()
+            assert total() == 100
+            t.upload_game({'result': {'hero': 'Mage', 'opponent': 'Rogue', 'mode': 'arena', 'win': True}})
+            assert total() == 101
+            t.modify_metadata(101, 'mode', 'ranked')
+            assert total() == 101
+            t.delete_game(101)
+            assert total() == 100
+            remaining = sum(g['mode'] != 'arena' for g in self.fake.games.values())
+            t.reset(modes=['arena'])
+            assert total() == remaining < 100
+            t.decks()
+        assert self.fake.requests[('GET', '/profile/stats/classes.json')] == 5
+        assert self.fake.requests[('GET', '/profile/settings/decks.json')] == 1
+
+    def test_cache_revalidation(self):
+        cache = ResponseCache(ttls={'/profile/settings/decks.json': 0.05, '/profile/stats/': 0.05})
+        with Trackobot(self.fake.username, self.fake.password, url=self.fake.url, cache=cache) as t:
+            decks = t.decks()
+            stats = t.stats(stats_type='decks')
+            time.sleep(0.1)
+            assert t.decks() == decks
+            assert t.stats(stats_type='decks') == stats
+            assert t.decks() == decks
+            assert self.fake.not_modified == 2
+            time.sleep(0.1)
+            t.upload_game({'result': {'hero': 'Mage', 'opponent': 'Rogue', 'win': True}})
+            assert t.stats(stats_type='decks') != stats
+        assert self.fake.not_modified == 2
+        assert self.fake.requests[('GET', '/profile/settings/decks.json')] == 2
+        assert self.fake.requests[('GET', '/profile/stats/decks.json')] == 3
+
+    def test_stdlib_codec(self):
+        with Trackobot(self.fake.username, self.fake.password, url=self.fake.url, codec='json') as t:
+            assert t.one_time_auth().startswith(self.fake.url)
+            game = t.upload_game({'result': {'hero': 'Mage', 'opponent': 'Rogue', 'win': False, 'note': 'café'}})
+            assert self.fake.games[game['result']['id']]['note'] == 'café'
+
+    def test_cli(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            output = os.path.join(tmp, 'history.json')
+            result = CliRunner().invoke(cli, ['-u', self.fake.username, '-p', self.fake.password,
+                                              '--url', self.fake.url, '-l', os.path.join(tmp, 'tb.log'),
+                                              'history', '-n', '0', '-o', output])
+            assert result.exit_code == 0, result.output
+            with open(output) as f:
+                assert len(json.load(f)) == 100
+            output = os.path.join(tmp, 'matrix.json')
+            result = CliRunner().invoke(cli, ['-u', self.fake.username, '-p', self.fake.password,
+                                              '--url', self.fake.url, '-l', os.path.join(tmp, 'tb.log'),
+                                              'stats', '--matrix', '-t', 'classes', '-r', 'all', '-m', 'all',
+                                              '-f', output])
+            assert result.exit_code == 0, result.output
+            assert 'Warrior' in result.output.splitlines()[0]
+            with open(output) as f:
+                assert len(json.load(f)['matrix']) == 9
+            result = CliRunner().invoke(cli, ['-u', self.fake.username, '-p', self.fake.password,
+                                              '--url', self.fake.url, '-l', os.path.join(tmp, 'tb.log'),
+                                              'stats', '--matrix', '-t', 'classes', '-r', 'custom', '-m', 'all',
+                                              '--since', '2017-05-29', '--until', '2017-05-30', '-f', output])
+            assert result.exit_code == 0, result.output
+            with open(output) as f:
+                assert sum(row['total'] for row in json.load(f)['overall'].values()) == 48
+            result = CliRunner().invoke(cli, ['-u', self.fake.username, '-p', self.fake.password,
+                                              '--url', self.fake.url, '-l', os.path.join(tmp, 'tb.log'),
+                                              'stats', '--matrix', '-r', 'custom', '-f', output])
+            assert result.exit_code == 1
+            assert '-r custom needs --since and --until' in result.output
+            output = os.path.join(tmp, 'series.json')
+            result = CliRunner().invoke(cli, ['-u', self.fake.username, '-p', self.fake.password,
+                                              '--url', self.fake.url, '-l', os.path.join(tmp, 'tb.log'),
+                                              'stats', '--series', '--since', '2017-05-30', '--until', '2017-05-31',
+                                              '-m', 'all', '-f', output])
+            assert result.exit_code == 0, result.output
+            assert '2017-05-31' in result.output
+            with open(output) as f:
+                assert [r['total'] for r in json.load(f)] == [24, 24]
+
+    def test_cli_login_on_demand(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            base = ['-u', self.fake.username, '-p', 'wrong', '--url', self.fake.url, '-l', os.path.join(tmp, 'tb.log')]
+            archive = os.path.join(tmp, 'history.archive')
+            with HistoryArchive(archive) as games:
+                games.append(self.t.history()['history'])
+            logins = self.fake.requests[('POST', '/sessions')]
+            result = CliRunner().invoke(cli, base + ['show', '100', '-a', archive])
+            assert result.exit_code == 0, result.output
+            assert self.fake.requests[('POST', '/sessions')] == logins
+            result = CliRunner().invoke(cli, base + ['decks', '-o', os.path.join(tmp, 'decks.json')])
+            assert result.exit_code == 1
+            assert self.fake.requests[('POST', '/sessions')] == logins + 1
+
+    def test_cli_stats_report(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            result = CliRunner().invoke(cli, ['-u', self.fake.username, '-p', self.fake.password, '--url',
+                                              self.fake.url, '-l', os.path.join(tmp, 'tb.log'), '--stats-report',
+                                              'decks', '-o', os.path.join(tmp, 'decks.json')])
+            assert result.exit_code == 0, result.output
+            assert 'POST /sessions' in result.output
+            assert 'GET /profile/settings/decks.json' in result.output
+
+    def test_cli_upload_errors(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            base = ['-u', self.fake.username, '-p', self.fake.password, '--url', self.fake.url,
+                    '-l', os.path.join(tmp, 'tb.log')]
+            output = os.path.join(tmp, 'uploaded.ndjson')
+            for missing in ('typo.json', 'typo.ndjson', os.path.join(tmp, '*.json')):
+                result = CliRunner().invoke(cli, base + ['upload', missing, '-o', output])
+                assert result.exit_code == 1, result.output
+                assert not os.path.exists(output)
+            game = json.dumps({'result': {'hero': 'Mage', 'opponent': 'Rogue', 'win': True}})
+            games = os.path.join(tmp, 'games.ndjson')
+            with open(games, 'w') as f:
+                f.write('\n'.join([game, '{"result": ', game]) + '\n')
+            result = CliRunner().invoke(cli, base + ['upload', games, '-o', output])
+            assert result.exit_code == 1
+            assert 'Failed to upload line 2' in result.output
+            with open(output) as f:
+                assert len(f.readlines()) == 2
+
+    def test_batch_and_shell(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            base = ['-u', self.fake.username, '-p', self.fake.password, '--url', self.fake.url,
+                    '-l', os.path.join(tmp, 'tb.log')]
+            script = '\n'.join(['# comment', 'decks -o {0}/decks.json', 'stats -t classes -f {0}/stats.json',
+                                 'wait', 'history -n 0 -o {0}/history.json']).format(tmp)
+            result = CliRunner().invoke(cli, base + ['batch', '-j', '2', '-'], input=script)
+            assert result.exit_code == 0, result.output
+            assert all(os.path.exists(os.path.join(tmp, name))
+                       for name in ('decks.json', 'stats.json', 'history.json'))
+            assert self.fake.requests[('POST', '/sessions')] == 1
+            failing = 'stats -t nope\ndecks -o {}/d.json\n'.format(tmp)
+            result = CliRunner().invoke(cli, base + ['batch', '-'], input=failing)
+            assert result.exit_code == 1
+            assert not os.path.exists(os.path.join(tmp, 'd.json'))
+            result = CliRunner().invoke(cli, base + ['shell'], input='batch x\n' + failing)
+            assert result.exit_code == 0, result.output
+            assert os.path.exists(os.path.join(tmp, 'd.json'))
+
+
+if __name__ == '__main__':
+    unittest.main()
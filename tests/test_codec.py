@@ -0,0 +1,66 @@
+import collections
+import datetime
+import io
+import json
+import unittest
+
+from trackopy.codec import BACKENDS, get_codec
+
+
+GAMES = [{'id': 2, 'hero': 'Mage', 'note': 'café "quoted"', 'coin': True, 'rank': None},
+         {'id': 1, 'hero': 'Rogue', 'card_history': [{'turn': 1, 'card': {'id': 'CS2_029'}}]}]
+
+
+def installed():
+    for name in BACKENDS:
+        try:
+            yield get_codec(name)
+        except ImportError:
+            pass
+
+
+class TestCodec(unittest.TestCase):
+    def test_round_trip(self):
+        for codec in installed():
+            assert codec.loads(codec.dumps(GAMES)) == GAMES
+            assert codec.loads(codec.dumps(GAMES).encode()) == GAMES
+
+    def test_dump_array(self):
+        for codec in installed():
+            f = io.StringIO()
+            assert codec.dump_array(iter([GAMES[:1], [], GAMES[1:]]), f) == 2
+            assert codec.loads(f.getvalue()) == GAMES
+            f = io.StringIO()
+            assert codec.dump_array([], f) == 0
+            assert f.getvalue() == '[]'
+
+    def test_dump_lines(self):
+        for codec in installed():
+            f = io.StringIO()
+            assert codec.dump_lines([GAMES, GAMES[0]], f) == 3
+            lines = f.getvalue().splitlines()
+            assert [codec.loads(line) for line in lines] == GAMES + GAMES[:1]
+
+    def test_same_inputs(self):
+        point = collections.namedtuple('Point', 'x y')
+        added = datetime.datetime(2017, 3, 1, 10, 30, 5, 250000, tzinfo=datetime.timezone.utc)
+        payloads = [{1: 'a', 2.5: 'b', True: 'c', None: 'd'}, {'added': added, 'day': added.date()},
+                    {'naive': datetime.datetime(2017, 3, 1, 10)}, [point(1, 2), (3, 4)], {'nested': {7: [added]}}]
+        expected = [json.loads(get_codec('json').dumps(payload)) for payload in payloads]
+        assert expected[1] == {'added': '2017-03-01T10:30:05.250000+00:00', 'day': '2017-03-01'}
+        for codec in installed():
+            for payload, decoded in zip(payloads, expected):
+                assert codec.loads(codec.dumps(payload)) == decoded, codec
+            for bad in ({1, 2}, object(), {(1, 2): 'tuple key'}, b'bytes'):
+                with self.assertRaises(TypeError, msg=codec.name):
+                    codec.dumps(bad)
+
+    def test_get_codec(self):
+        assert get_codec().name in BACKENDS
+        assert get_codec('json').name == 'json'
+        with self.assertRaises(ValueError):
+            get_codec('yaml')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+import csv
+import datetime
+import os
+import tempfile
+import unittest
+
+from trackopy import HistoryExporter, export_history
+from trackopy import export
+
+
+GAMES = [
+    {'id': 2, 'added': '2017-03-02T12:00:00.000Z', 'mode': 'ranked', 'hero': 'Mage', 'hero_deck': 'Tempo',
+     'opponent': 'Rogue', 'opponent_deck': None, 'coin': True, 'result': 'win', 'duration': 300, 'rank': 5,
+     'legend': None, 'note': None,
+     'card_history': [{'player': 'me', 'turn': 1, 'card': {'id': 'CS2_029', 'name': 'Fireball', 'mana': 4}},
+                      {'player': 'opponent', 'turn': 1, 'card': {'id': 'EX1_066', 'name': 'Ooze', 'mana': 2}}]},
+    {'id': 1, 'added': '2017-03-01T12:00:00.000Z', 'mode': 'arena', 'hero': 'Rogue', 'opponent': 'Mage',
+     'win': False, 'coin': False, 'deck_id': 7, 'card_history': [{'player': 'me', 'turn': 2, 'card_id': 'CS2_072'}]},
+]
+
+
+class TestExport(unittest.TestCase):
+    def test_rows(self):
+        row = export.game_row(GAMES[0])
+        assert row['win'] is True
+        assert row['added'] == datetime.datetime(2017, 3, 2, 12, tzinfo=datetime.timezone.utc)
+        assert row['rank'] == 5 and row['hero_deck_id'] is None
+        row = export.game_row(GAMES[1])
+        assert row['win'] is False and row['hero_deck_id'] == 7 and row['note'] is None
+        cards = export.card_rows(GAMES[1])
+        assert cards == [{'game_id': 1, 'index': 0, 'turn': 2, 'player': 'me', 'card_id': 'CS2_072',
+                          'card_name': None, 'mana': None}]
+
+    def test_csv(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'history.csv')
+            assert export_history([GAMES[:1], [], GAMES[1:]], path) == (2, 3)
+            with open(path) as f:
+                games = list(csv.DictReader(f))
+            with open(os.path.join(tmp, 'history.cards.csv')) as f:
+                cards = list(csv.DictReader(f))
+        assert [g['id'] for g in games] == ['2', '1']
+        assert games[0]['added'] == '2017-03-02T12:00:00+00:00'
+        assert games[0]['opponent_deck'] == ''
+        assert [c['card_id'] for c in cards] == ['CS2_029', 'EX1_066', 'CS2_072']
+
+    def test_format(self):
+        with self.assertRaises(ValueError):
+            HistoryExporter('history.xlsx')
+
+    @unittest.skipIf(export._import_pyarrow() is None, 'pyarrow is not installed')
+    def test_arrow(self):
+        import pyarrow.ipc
+        import pyarrow.parquet
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'history.parquet')
+            export_history([GAMES[:1], GAMES[1:]], path)
+            games = pyarrow.parquet.read_table(path)
+            assert games.column('id').to_pylist() == [2, 1]
+            assert str(games.schema.field('added').type) == 'timestamp[ms, tz=UTC]'
+            path = os.path.join(tmp, 'history.arrow')
+            export_history([GAMES], path, cards=os.path.join(tmp, 'cards.arrow'))
+            cards = pyarrow.ipc.open_file(os.path.join(tmp, 'cards.arrow')).read_all()
+            assert cards.column('mana').to_pylist() == [4, 2, None]
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+import datetime
+import unittest
+
+from trackopy import LocalStats
+
+
+def game(gid, added, mode='ranked', hero='Shaman', opponent='Warrior', result='win',
+         hero_deck='Aggro', opponent_deck=None):
+    return {'id': gid, 'added': added, 'mode': mode, 'hero': hero, 'opponent': opponent,
+            'result': result, 'coin': False, 'hero_deck': hero_deck, 'opponent_deck': opponent_deck}
+
+
+GAMES = [
+    game(1, '2017-02-27T10:00:00.000Z'),
+    game(2, '2017-03-01T10:00:00.000Z', result='loss'),
+    game(3, '2017-03-02T10:00:00.000Z', hero='Mage', hero_deck='Freeze'),
+    game(4, '2017-03-03T10:00:00.000Z', mode='arena', opponent='Priest', hero_deck=None),
+    game(5, '2017-03-04T09:00:00.000Z', mode='casual', result='loss', opponent_deck='Pirate'),
+]
+NOW = datetime.datetime(2017, 3, 4, 12, tzinfo=datetime.timezone.utc)
+
+
+class TestLocalStats(unittest.TestCase):
+    def setUp(self):
+        self.local = LocalStats(GAMES, deck_names={1: 'Aggro', 2: 'Pirate'})
+
+    def test_overall(self):
+        stats = self.local.stats(stats_type='classes')['stats']
+        assert stats['overall'] == {'wins': 3, 'losses': 2, 'total': 5, 'winrate': 60.0}
+        assert stats['as_class']['Shaman'] == {'wins': 2, 'losses': 2, 'total': 4, 'winrate': 50.0}
+        assert stats['vs_class']['Priest']['total'] == 1
+
+    def test_filters(self):
+        stats = self.local.stats(stats_type='classes', mode='ranked', as_hero='shaman')['stats']
+        assert stats['overall']['total'] == 2
+        assert list(stats['as_class']) == ['Shaman']
+        stats = self.local.stats(stats_type='arena')['stats']
+        assert stats['overall']['total'] == 1
+        stats = self.local.stats(stats_type='decks', as_deck=1)['stats']
+        assert set(stats['as_deck']) == {'Aggro'}
+        assert stats['overall']['total'] == 3
+        stats = self.local.stats(stats_type='decks', vs_deck=2)['stats']
+        assert stats['overall']['total'] == 1
+        with self.assertRaises(ValueError):
+            self.local.stats(stats_type='decks', as_deck=99)
+
+    def test_time_ranges(self):
+        def total(**kwargs):
+            return self.local.stats(stats_type='classes', now=NOW, **kwargs)['stats']['overall']['total']
+        assert total(time_range='current_month') == 4
+        assert total(time_range='last_3_days') == 3
+        assert total(time_range='last_24_hours') == 1
+        assert total(time_range='custom', start=datetime.datetime(2017, 2, 27),
+                     end=datetime.datetime(2017, 3, 1)) == 2
+
+    def test_result_cache(self):
+        first = self.local.stats(stats_type='classes', mode='ranked')
+        first['stats']['as_class']['Shaman']['total'] = -1
+        assert self.local.stats(stats_type='classes', mode='ranked')['stats']['as_class']['Shaman']['total'] == 2
+        local = LocalStats(GAMES, cache_size=1)
+        assert local.stats(mode='ranked') == self.local.stats(mode='ranked')
+        local.stats(mode='casual')
+        assert len(local._results) == 1
+        assert LocalStats(GAMES, cache_size=0).stats(mode='ranked') == local.stats(mode='ranked')
+
+    def test_validation(self):
+        with self.assertRaises(ValueError):
+            self.local.stats(stats_type='badstr')
+        with self.assertRaises(TypeError):
+            self.local.stats(time_range='custom', start=NOW)
+
+
+if __name__ == '__main__':
+    unittest.main()
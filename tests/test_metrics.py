@@ -0,0 +1,59 @@
+import unittest
+
+from trackopy import LatencySummary, PrometheusCollector
+from trackopy.metrics import RequestEvent, endpoint_template
+
+
+def event(method='GET', endpoint='/profile.json', status=200, total=0.1, size=100, retries=0):
+    e = RequestEvent(method, endpoint)
+    e.status = status
+    e.total = total
+    e.ttfb = total / 2
+    e.connect = 0.0
+    e.size = size
+    e.retries = retries
+    return e
+
+
+class TestMetrics(unittest.TestCase):
+    def test_endpoint_template(self):
+        assert endpoint_template('/profile/results/1234') == '/profile/results/:id'
+        assert endpoint_template('/users/12/rename') == '/users/:id/rename'
+        assert endpoint_template('/profile/stats/decks.json') == '/profile/stats/decks.json'
+
+    def test_latency_summary(self):
+        summary = LatencySummary()
+        for i in range(1, 101):
+            summary(event(total=i / 1000.0))
+        summary(event('DELETE', '/profile/results/5', status=404))
+        rows = summary.summary()
+        row = rows['GET /profile.json']
+        assert row['count'] == 100
+        assert row['errors'] == 0
+        assert row['bytes'] == 10000
+        assert abs(row['p50'] - 0.051) < 1e-9
+        assert abs(row['p99'] - 0.1) < 1e-9
+        assert rows['DELETE /profile/results/:id']['errors'] == 1
+        assert 'GET /profile.json' in summary.report()
+
+    def test_prometheus(self):
+        collector = PrometheusCollector(buckets=(0.05, 0.5))
+        collector(event(total=0.01))
+        collector(event(total=0.2, retries=2))
+        collector(event(total=2.0))
+        failed = RequestEvent('GET', '/profile.json')
+        failed.error = Exception('boom')
+        collector(failed)
+        text = collector.exposition()
+        labels = 'method="GET",endpoint="/profile.json"'
+        assert 'trackopy_requests_total{%s,status="200"} 3' % labels in text
+        assert 'trackopy_requests_total{%s,status="error"} 1' % labels in text
+        assert 'trackopy_request_duration_seconds_bucket{%s,le="0.05"} 1' % labels in text
+        assert 'trackopy_request_duration_seconds_bucket{%s,le="0.5"} 2' % labels in text
+        assert 'trackopy_request_duration_seconds_bucket{%s,le="+Inf"} 3' % labels in text
+        assert 'trackopy_request_duration_seconds_count{%s} 3' % labels in text
+        assert 'trackopy_request_retries_total{%s} 2' % labels in text
+
+
+if __name__ == '__main__':
+    unittest.main()
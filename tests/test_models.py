@@ -0,0 +1,41 @@
+import datetime
+import unittest
+
+from trackopy import CardPlay, Game
+
+
+GAME = {'id': 7, 'added': '2017-03-02T12:30:00.250Z', 'mode': 'ranked', 'hero': 'Mage', 'hero_deck': 'Tempo',
+        'opponent': 'Rogue', 'opponent_deck': None, 'coin': True, 'result': 'win', 'duration': 300, 'rank': 5,
+        'legend': None, 'note': 'close one',
+        'card_history': [{'player': 'me', 'turn': 1, 'card': {'id': 'CS2_029', 'name': 'Fireball', 'mana': 4}},
+                         {'player': 'opponent', 'turn': 1, 'card': {'id': 'EX1_066', 'name': 'Ooze', 'mana': 2}}]}
+
+
+class TestModels(unittest.TestCase):
+    def test_from_dict(self):
+        game = Game.from_dict(GAME)
+        assert game.id == 7 and game.win is True and game.coin is True
+        assert game.added == datetime.datetime(2017, 3, 2, 12, 30, 0, 250000, tzinfo=datetime.timezone.utc)
+        assert game.card_history[0] == CardPlay(1, 'me', 'CS2_029', 'Fireball', 4)
+        assert not hasattr(game, '__dict__')
+
+    def test_interned(self):
+        first = Game.from_dict(GAME)
+        second = Game.from_dict(dict(GAME, hero=''.join(['Ma', 'ge'])))
+        assert first.hero is second.hero
+        assert first.card_history[0].card_name is second.card_history[0].card_name
+
+    def test_round_trip(self):
+        game = Game.from_dict(GAME)
+        assert game.to_dict() == dict(GAME)
+        assert Game.from_dict(game.to_dict()) == game
+
+    def test_upload_format(self):
+        game = Game.from_dict({'id': 1, 'hero': 'Rogue', 'opponent': 'Mage', 'win': False,
+                               'card_history': [{'player': 'me', 'turn': 2, 'card_id': 'CS2_072'}]})
+        assert game.win is False and game.added is None
+        assert game.card_history == (CardPlay(2, 'me', 'CS2_072'),)
+
+
+if __name__ == '__main__':
+    unittest.main()
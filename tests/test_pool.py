@@ -0,0 +1,98 @@
+import json
+import os
+import tempfile
+import time
+import unittest
+
+from click.testing import CliRunner
+
+from trackopy import TrackobotPool
+from trackopy.scripts.tb import cli
+from tests.fakeserver import FakeTrackobot
+
+
+ACCOUNTS = {'alice': 'a-password', 'bob': 'b-password', 'carol': 'c-password'}
+
+
+class TestTrackobotPool(unittest.TestCase):
+    """Offline tests of TrackobotPool against a local stand-in for trackobot.com"""
+    def setUp(self):
+        self.fake = FakeTrackobot(games=40, per_page=15, latency=0.05, accounts=ACCOUNTS).start()
+        self.pool = TrackobotPool(ACCOUNTS, concurrency=3, url=self.fake.url)
+
+    def tearDown(self):
+        self.pool.close()
+        self.fake.stop()
+
+    def test_login(self):
+        self.fake.latency = 0.1
+        began = time.perf_counter()
+        results = self.pool.login()
+        assert time.perf_counter() - began < 0.2
+        self.fake.latency = 0.05
+        assert list(results) == ['alice', 'bob', 'carol']
+        assert all(result.ok for result in results.values())
+        with TrackobotPool({'alice': 'wrong', 'bob': 'b-password'}, url=self.fake.url) as pool:
+            results = pool.login()
+        assert isinstance(results['alice'].error, ValueError)
+        assert results['bob'].ok
+
+    def test_map_stats(self):
+        results = self.pool.map_stats(stats_type='classes', accounts=['alice', 'carol'])
+        assert list(results) == ['alice', 'carol']
+        assert all(r.result['stats']['overall']['total'] == 40 for r in results.values())
+        with self.assertRaises(ValueError):
+            self.pool.map_stats(stats_type='nope')
+        with self.assertRaises(ValueError):
+            self.pool.map_stats(accounts=['dave'])
+
+    def test_iter_history_all(self):
+        pages = {}
+        for result in self.pool.iter_history_all():
+            assert result.ok
+            pages.setdefault(result.item, []).extend(g['id'] for g in result.result)
+        assert pages == {username: list(range(40, 0, -1)) for username in ACCOUNTS}
+        first = next(self.pool.iter_history_all(count=1, typed=True))
+        assert len(first.result) == 15 and first.result[0].id == 40
+
+    def test_history_error(self):
+        self.pool.login()
+        self.fake.fail_next(40, status=404)
+        results = list(self.pool.iter_history_all())
+        assert len(results) == 3
+        assert not any(result.ok for result in results)
+
+    def test_shared_connections(self):
+        self.pool.login()
+        self.pool.map_stats()
+        self.pool.map(lambda t: t.decks())
+        assert len(self.pool._adapter.poolmanager.pools) == 1
+
+
+class TestPoolCLI(unittest.TestCase):
+    def test_accounts(self):
+        with FakeTrackobot(games=20, accounts=ACCOUNTS) as fake, tempfile.TemporaryDirectory() as tmp:
+            creds = os.path.join(tmp, 'creds.csv')
+            with open(creds, 'w') as f:
+                f.write('username,password\nalice,a-password\nbob,b-password\nmallory,wrong\n')
+            runner = CliRunner()
+            base = ['--url', fake.url, '-l', os.path.join(tmp, 'tb.log'), '--accounts', creds]
+            stats = os.path.join(tmp, 'stats.json')
+            result = runner.invoke(cli, base + ['stats', '-r', 'all', '-m', 'all', '-f', stats])
+            assert result.exit_code == 1, result.output
+            assert 'mallory' in result.output
+            with open(stats) as f:
+                assert set(json.load(f)) == {'alice', 'bob'}
+            output = os.path.join(tmp, 'history.ndjson')
+            result = runner.invoke(cli, base + ['history', '-n', '0', '-f', 'ndjson', '-o', output])
+            assert result.exit_code == 1, result.output
+            with open(os.path.join(tmp, 'history.bob.ndjson')) as f:
+                assert len(f.readlines()) == 20
+            result = runner.invoke(cli, base + ['stats', '--matrix', '-f', stats])
+            assert result.exit_code == 1, result.output
+            with open(creds, 'w') as f:
+                f.write('username,password\nalice,a-password\nbob,b-password\n')
+            result = runner.invoke(cli, base + ['stats', '-r', 'all', '-m', 'all', '-f', stats])
+            assert result.exit_code == 0, result.output
+            result = runner.invoke(cli, base + ['decks'])
+            assert result.exit_code == 1
@@ -0,0 +1,97 @@
+import datetime
+import os
+import random
+import tempfile
+import time
+import unittest
+
+from trackopy import Game, HistoryArchive, LocalQuery
+
+
+def game(gid, added, mode='ranked', hero='Shaman', opponent='Warrior', result='win', coin=False,
+         hero_deck='Aggro', **extra):
+    g = {'id': gid, 'added': added, 'mode': mode, 'hero': hero, 'opponent': opponent,
+         'result': result, 'coin': coin, 'hero_deck': hero_deck, 'opponent_deck': None}
+    g.update(extra)
+    return g
+
+
+GAMES = [
+    game(1, '2017-02-01T10:00:00.000Z', coin=True),
+    game(2, '2017-03-01T10:00:00.000Z', result='loss', coin=True, hero_deck_id=7),
+    game(3, '2017-03-02T10:00:00.000Z', hero='Mage', hero_deck='Freeze'),
+    game(4, '2017-03-03T10:00:00.000Z', mode='arena', opponent='Priest', hero_deck=None),
+    game(5, '2017-03-04T09:00:00.000Z', mode='casual', result='loss', coin=True),
+]
+NOW = datetime.datetime(2017, 3, 4, 12, tzinfo=datetime.timezone.utc)
+
+
+class TestLocalQuery(unittest.TestCase):
+    def setUp(self):
+        self.query = LocalQuery(GAMES, deck_names={1: 'Freeze'})
+
+    def test_filters(self):
+        assert self.query.count() == 5
+        assert self.query.count(mode='ranked', hero='shaman', opponent='WARRIOR', coin=True) == 2
+        assert self.query.count(mode=['ranked', 'arena']) == 4
+        assert self.query.count(win=False) == 2
+        assert self.query.count(coin=False) == 2
+        assert self.query.count(hero='Druid') == 0
+
+    def test_decks(self):
+        assert [g['id'] for g in self.query.find(as_deck=7)] == [2]
+        assert [g['id'] for g in self.query.find(as_deck=[1, 7])] == [3, 2]
+        assert self.query.count(hero_deck='aggro') == 3
+
+    def test_dates(self):
+        assert self.query.count(days=30, now=NOW) == 4
+        assert self.query.count(start=datetime.datetime(2017, 3, 2), end=datetime.datetime(2017, 3, 4)) == 2
+        with self.assertRaises(ValueError):
+            self.query.count(days=1, start=NOW)
+
+    def test_find(self):
+        assert [g['id'] for g in self.query.find()] == [5, 4, 3, 2, 1]
+        assert [g['id'] for g in self.query.find(limit=2, mode='ranked')] == [3, 2]
+        assert self.query.find(limit=0) == []
+        typed = self.query.find(typed=True, hero='Mage')
+        assert typed == [Game.from_dict(GAMES[2])]
+
+    def test_record(self):
+        assert self.query.record(mode='ranked') == {'wins': 2, 'losses': 1, 'total': 3, 'winrate': 66.7}
+        assert self.query.record(hero='Druid')['winrate'] == 0.0
+
+    def test_no_added_time(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            with HistoryArchive(os.path.join(tmp, 'history.archive')) as archive:
+                archive.append(GAMES + [{'id': 50, 'mode': 'ranked', 'result': 'win'}])
+                query = LocalQuery(archive)
+        assert query.count(mode='ranked') == 4
+        assert query.count(mode='ranked', days=30, now=NOW) == 2
+        assert query.count(end=datetime.datetime(2017, 3, 2)) == 2
+        assert [g['id'] for g in query.find()] == [5, 4, 3, 2, 1, 50]
+
+    def test_typed_games(self):
+        query = LocalQuery(Game.from_dict(g) for g in GAMES)
+        assert query.count(mode='ranked', win=True) == 2
+
+
+class TestLocalQuerySpeed(unittest.TestCase):
+    def test_large_history(self):
+        rng = random.Random(0)
+        heroes = ['Druid', 'Hunter', 'Mage', 'Paladin', 'Priest', 'Rogue', 'Shaman', 'Warlock', 'Warrior']
+        start = datetime.datetime(2016, 1, 1, tzinfo=datetime.timezone.utc)
+        games = [game(i, start + datetime.timedelta(minutes=10 * i), mode=rng.choice(['ranked', 'casual', 'arena']),
+                      hero=rng.choice(heroes), opponent=rng.choice(heroes), coin=rng.random() < 0.5,
+                      result=rng.choice(['win', 'loss'])) for i in range(100000)]
+        query = LocalQuery(games)
+        now = start + datetime.timedelta(minutes=10 * 100000)
+        filters = {'mode': 'ranked', 'hero': 'shaman', 'opponent': 'warrior', 'coin': True, 'days': 30, 'now': now}
+        expected = sum(1 for g in games if g['mode'] == 'ranked' and g['hero'] == 'Shaman' and
+                       g['opponent'] == 'Warrior' and g['coin'] and g['added'] >= now - datetime.timedelta(days=30))
+        assert query.count(**filters) == expected
+        best = float('inf')
+        for _ in range(20):
+            began = time.perf_counter()
+            query.record(**filters)
+            best = min(best, time.perf_counter() - began)
+        assert best < 0.001, best
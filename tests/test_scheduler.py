@@ -0,0 +1,87 @@
+import io
+import time
+import unittest
+
+import requests
+
+from trackopy import RequestScheduler, RetryPolicy
+from trackopy.scheduler import TokenBucket
+
+
+def response(status, headers=None):
+    r = requests.Response()
+    r.status_code = status
+    r.headers.update(headers or {})
+    r.raw = io.BytesIO(b'')
+    return r
+
+
+class Responses:
+    """Returns the given responses, or raises the given exceptions, in order"""
+    def __init__(self, *outcomes):
+        self.outcomes = list(outcomes)
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+
+class TestScheduler(unittest.TestCase):
+    def setUp(self):
+        self.retry = RetryPolicy(retries=2, backoff=0.001, max_backoff=0.01)
+        self.scheduler = RequestScheduler(retry=self.retry)
+
+    def test_retries_idempotent_requests(self):
+        send = Responses(response(503), response(429), response(200))
+        assert self.scheduler.send('GET', send).status_code == 200
+        assert send.calls == 3
+        send = Responses(requests.exceptions.ConnectionError(), response(204))
+        assert self.scheduler.send('DELETE', send).status_code == 204
+
+    def test_gives_up(self):
+        send = Responses(response(500), response(500), response(500))
+        assert self.scheduler.send('PUT', send).status_code == 500
+        assert send.calls == 3
+        send = Responses(*[requests.exceptions.Timeout()] * 3)
+        with self.assertRaises(requests.exceptions.Timeout):
+            self.scheduler.send('GET', send)
+
+    def test_post_not_retried(self):
+        send = Responses(response(503), response(201))
+        assert self.scheduler.send('POST', send).status_code == 503
+        send = Responses(response(503), response(201))
+        assert self.scheduler.send('POST', send, force_retry=True).status_code == 201
+        scheduler = RequestScheduler(retry=RetryPolicy(retries=1, backoff=0.001, retry_posts=True))
+        send = Responses(response(503), response(201))
+        assert scheduler.send('POST', send).status_code == 201
+
+    def test_client_errors_not_retried(self):
+        send = Responses(response(404), response(200))
+        assert self.scheduler.send('GET', send).status_code == 404
+
+    def test_delay(self):
+        retry = RetryPolicy(backoff=1, max_backoff=4)
+        for attempt in range(1, 6):
+            assert 0 <= retry.delay(attempt) <= min(4, 2 ** (attempt - 1))
+        assert retry.delay(1, response(429, {'Retry-After': '3'})) == 3
+        assert retry.delay(1, response(429, {'Retry-After': '120'})) == 4
+        assert retry.delay(1, response(429, {'Retry-After': 'Wed, 01 Mar 2017 10:00:00 GMT'})) == 0
+
+    def test_token_bucket(self):
+        bucket = TokenBucket(rate=50, burst=2)
+        start = time.monotonic()
+        for _ in range(7):
+            bucket.acquire()
+        assert time.monotonic() - start >= 0.09
+        with self.assertRaises(ValueError):
+            TokenBucket(rate=0)
+        with self.assertRaises(ValueError):
+            TokenBucket(rate=10, burst=0)
+
+
+if __name__ == '__main__':
+    unittest.main()
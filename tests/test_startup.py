@@ -0,0 +1,44 @@
+import os
+import subprocess
+import sys
+import unittest
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules that only commands talking to trackobot.com, or writing parquet and arrow files, should import
+HEAVY = ('requests', 'urllib3', 'aiohttp', 'pyarrow')
+
+
+def import_times(*args):
+    """Run python -X importtime with args and return a dictionary of module name to cumulative microseconds"""
+    result = subprocess.run([sys.executable, '-X', 'importtime'] + list(args), cwd=ROOT, stdout=subprocess.PIPE,
+                            stderr=subprocess.PIPE, universal_newlines=True, check=True)
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+class TestStartup(unittest.TestCase):
+    def test_import_trackopy(self):
+        times = import_times('-c', 'import trackopy')
+        assert not [name for name in times if name.split('.')[0] in HEAVY], sorted(times)
+        assert times['trackopy'] < 50000, times['trackopy']
+
+    def test_local_modules(self):
+        times = import_times('-c', 'import trackopy; trackopy.LocalQuery; trackopy.HistoryArchive; '
+                                   'trackopy.HistoryStore; trackopy.HistoryExporter')
+        assert not [name for name in times if name.split('.')[0] in HEAVY], sorted(times)
+
+    def test_tb_help(self):
+        times = import_times('-m', 'trackopy.scripts.tb', '--help')
+        assert not [name for name in times if name.split('.')[0] in HEAVY], sorted(times)
+        assert sum(time for name, time in times.items() if name.startswith('trackopy')) < 100000
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+import unittest
+
+from trackopy import HistoryStore
+
+
+class FakeTrackobot:
+    """Serves pages of games, newest first, 15 to a page, like Trackobot.iter_history_pages()"""
+    def __init__(self, ids):
+        self.ids = sorted(ids, reverse=True)
+        self.requests = 0
+
+    def iter_history_pages(self):
+        for i in range(0, len(self.ids), 15):
+            self.requests += 1
+            yield [game(gid) for gid in self.ids[i:i + 15]]
+
+
+def game(gid):
+    return {'id': gid, 'added': '2017-03-01T12:00:00.000Z', 'mode': 'ranked',
+            'hero': 'Shaman', 'opponent': 'Warrior', 'result': 'win'}
+
+
+class TestHistoryStore(unittest.TestCase):
+    def setUp(self):
+        self.store = HistoryStore(':memory:')
+
+    def tearDown(self):
+        self.store.close()
+
+    def test_upsert(self):
+        assert len(self.store) == 0
+        self.store.upsert([game(1), game(2)])
+        assert len(self.store) == 2
+        assert 1 in self.store
+        assert 3 not in self.store
+        assert self.store.get(2) == game(2)
+        assert self.store.get(3) is None
+        changed = dict(game(2), result='loss')
+        self.store.upsert([changed])
+        assert len(self.store) == 2
+        assert self.store.get(2)['result'] == 'loss'
+        assert [g['id'] for g in self.store] == [2, 1]
+        assert self.store.missing([1, 2, 3]) == {3}
+
+    def test_sync(self):
+        trackobot = FakeTrackobot(range(1, 101))
+        assert self.store.sync(trackobot) == 100
+        assert trackobot.requests == 7
+        trackobot = FakeTrackobot(range(1, 106))
+        assert self.store.sync(trackobot) == 5
+        assert trackobot.requests == 1
+        assert len(self.store) == 105
+
+    def test_sync_resumes_interrupted_backfill(self):
+        self.store.upsert(game(gid) for gid in range(80, 101))
+        trackobot = FakeTrackobot(range(1, 101))
+        assert self.store.sync(trackobot) == 79
+        assert trackobot.requests == 7
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,4 +1,6 @@
 import datetime
+import os
+import tempfile
 import unittest
 
 import requests
@@ -13,6 +15,37 @@ class TestTB(unittest.TestCase):
     def setUp(self):
         self.t = Trackobot(USERNAME, PASSWORD)
 
+    def tearDown(self):
+        self.t.close()
+
+    def test_context_manager(self):
+        with Trackobot(USERNAME, PASSWORD, pool_size=2) as t:
+            decks = t.decks()
+            assert 'decks' in decks
+            decks = t.decks()
+            assert 'decks' in decks
+
+    def test_login(self):
+        t = Trackobot(USERNAME, 'wrong')
+        with self.assertRaises(ValueError):
+            t.login()
+        with self.assertRaises(ValueError):
+            t.decks()
+        t.close()
+
+    def test_saved_session(self):
+        self.t.decks()
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'session.json')
+            self.t.save_session(path)
+            with Trackobot.from_saved_session(path) as t:
+                decks = t.decks()
+                assert 'decks' in decks
+            with open(path, 'w') as f:
+                f.write('{}')
+            with self.assertRaises(ValueError):
+                Trackobot.from_saved_session(path)
+
     def test_one_time_auth(self):
         url = self.t.one_time_auth()
         assert 'trackobot' in url
@@ -100,6 +133,22 @@ class TestTB(unittest.TestCase):
                 assert g['rank'] == value
                 break
 
+    def test_patch_metadata(self):
+        with self.assertRaises(ValueError):
+            self.t.patch_metadata(111, {'rank': 5, 'foo': 'bar'})
+        with self.assertRaises(ValueError):
+            self.t.patch_metadata(111, {})
+        game = self.upload()['result']
+        ret = self.t.patch_metadata(game['id'], {'rank': 12, 'opponent': 'Mage'})
+        assert ret is True
+        for g in self.t.history()['history']:
+            if g['id'] == game['id']:
+                assert g['rank'] == 12
+                assert g['opponent'] == 'Mage'
+                break
+        results = list(self.t.patch_metadata_many([(game['id'], {'rank': 3})]))
+        assert results[0].ok
+
     def test_history(self):
         self.upload(**{'deck_id': 'aggro', 'opponent_deck_id': 'pirate'})
         history = self.t.history()
@@ -108,6 +157,34 @@ class TestTB(unittest.TestCase):
         history = self.t.history(query='Shaman')
         assert 'history' in history
 
+    def test_fetch_history_pages(self):
+        self.upload()
+        games = self.t.fetch_history_pages(count=2, workers=2)
+        assert len(games) != 0
+        assert games == self.t.fetch_history_pages(count=2, workers=1)
+        games = self.t.fetch_history_pages(count=1, arena=True)
+        assert isinstance(games, list)
+        with self.assertRaises(ValueError):
+            self.t.fetch_history_pages(workers=0)
+        with self.assertRaises(ValueError):
+            self.t.fetch_history_pages(arena=True, query='Shaman')
+
+    def test_iter_history(self):
+        self.upload()
+        games = list(self.t.iter_history(count=1))
+        assert games == self.t.history()['history']
+        pages = list(self.t.iter_history_pages(count=2))
+        assert 1 <= len(pages) <= 2
+        assert pages[0] == games
+        assert list(self.t.iter_history(count=2, prefetch=2)) == list(self.t.iter_history(count=2))
+        pages = self.t.iter_history_pages(prefetch=3)
+        next(pages)
+        pages.close()
+        with self.assertRaises(ValueError):
+            self.t.iter_history(arena=True, query='Shaman')
+        with self.assertRaises(ValueError):
+            self.t.iter_history(prefetch=-1)
+
     def test_arena_history(self):
         self.upload(mode='arena')
         history = self.t.arena_history()
@@ -132,6 +209,21 @@ class TestTB(unittest.TestCase):
         ids = [g['id'] for g in history['history']]
         assert game['id'] not in ids
 
+    def test_delete_games(self):
+        ids = [self.upload()['result']['id'] for _ in range(3)]
+        results = list(self.t.delete_games(ids + [0], workers=2))
+        assert [r.item for r in results] == ids + [0]
+        assert [r.ok for r in results] == [True, True, True, False]
+        history = self.t.history()
+        assert not set(ids) & {g['id'] for g in history['history']}
+
+    def test_modify_metadata_many(self):
+        ids = [self.upload()['result']['id'] for _ in range(2)]
+        results = list(self.t.modify_metadata_many([(ids[0], 'rank', 10), (ids[1], 'rank', 12)]))
+        assert all(r.ok for r in results)
+        with self.assertRaises(ValueError):
+            self.t.modify_metadata_many([(ids[0], 'rank', 10), (ids[1], 'foo', 'bar')])
+
     def upload(self, mode='ranked', **kwargs):
         data = {'result': {'hero': 'Shaman', 'opponent': 'Warrior', 'mode': mode,
             'coin': False, 'win': True }}
@@ -145,6 +237,18 @@ class TestTB(unittest.TestCase):
         game = game['result']
         assert 'id' in game
 
+    def test_upload_games(self):
+        good = {'result': {'hero': 'Shaman', 'opponent': 'Warrior', 'mode': 'ranked',
+                           'coin': False, 'win': True}}
+        results = list(self.t.upload_games([good, {'foo': 'bar'}, good], workers=2))
+        assert [r.item for r in results] == [good, {'foo': 'bar'}, good]
+        assert results[0].ok and results[2].ok
+        assert 'id' in results[0].result['result']
+        assert not results[1].ok
+        assert isinstance(results[1].error, requests.exceptions.HTTPError)
+        with self.assertRaises(ValueError):
+            self.t.upload_games([good], workers=0)
+
     def test_create_user(self):
         data = Trackobot.create_user()
         assert 'username' in data
@@ -4,9 +4,37 @@ __author__ = 'Sean Beck'
 __license__ = 'MIT'
 __copyright__ = 'Copyright 2017 Sean Beck'
 
-from .trackobot import Trackobot
+# Submodules are imported the first time one of their names is used, so that importing trackopy, or
+# running a tb command that only reads local files, does not pay for importing requests or aiohttp
+_exports = {
+    'Trackobot': 'trackobot', 'BulkResult': 'trackobot', 'AsyncTrackobot': 'aio', 'HistoryStore': 'store',
+    'LocalStats': 'localstats', 'ResponseCache': 'cache', 'RequestScheduler': 'scheduler',
+    'RetryPolicy': 'scheduler', 'LatencySummary': 'metrics', 'PrometheusCollector': 'metrics',
+    'JSONCodec': 'codec', 'get_codec': 'codec', 'HistoryExporter': 'export', 'export_history': 'export',
+    'Game': 'models', 'CardPlay': 'models', 'HistoryArchive': 'archive', 'LocalQuery': 'query',
+    'TrackobotPool': 'pool',
+}
+_submodules = ('aio', 'archive', 'cache', 'codec', 'export', 'localstats', 'metrics', 'models', 'pool', 'query',
+               'scheduler', 'store', 'trackobot')
+
+__all__ = list(_exports)
+
+
+def __getattr__(name):
+    import importlib
+    if name in _exports:
+        value = getattr(importlib.import_module('.' + _exports[name], __name__), name)
+    elif name in _submodules:
+        value = importlib.import_module('.' + name, __name__)
+    else:
+        raise AttributeError('module {!r} has no attribute {!r}'.format(__name__, name))
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_exports) | set(_submodules))
 
-__all__ = ['Trackobot']
 
 import logging
 try:
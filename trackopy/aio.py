@@ -0,0 +1,323 @@
+import logging
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+from .codec import JSONCodec, get_codec
+from .trackobot import DEFAULT_URL, _check_patch, _reset_modes, _stats_request
+
+
+logger = logging.getLogger(__name__)
+
+
+def _drop_none(params):
+    """aiohttp refuses None query values, which requests silently drops"""
+    return {k: v for k, v in params.items() if v is not None}
+
+
+class AsyncTrackobot:
+    """
+    asyncio client for the Trackobot API.
+    Requires the optional ``aiohttp`` dependency.
+
+    Methods mirror those of ``Trackobot`` but are coroutines. Unlike
+    ``Trackobot``, creating an instance does not log in; call ``login()``
+    or use the instance as an async context manager, which logs in on
+    entry and closes the connections on exit.
+
+    The instance may be created outside of an event loop. Its HTTP session
+    is only created by the first request, which must be made from the
+    event loop that all later requests are made from.
+
+    Many instances can share one ``aiohttp.TCPConnector`` so that requests
+    for several accounts are drawn from the same connection pool. Each
+    instance still keeps its own cookies.
+
+    :param str username: Your Trackobot username
+    :param str password: Your Trackobot password
+    :param int limit: The maximum number of simultaneous connections when no connector is given
+    :param float timeout: Seconds to wait on the server before giving up. None waits forever
+    :param aiohttp.TCPConnector connector: A connection pool to share with other clients. It is not closed by close()
+    :param str url: The Trackobot server to talk to, such as a local stand-in for testing
+    :param codec: A trackopy.codec.JSONCodec, or the name of a JSON backend. Defaults to the fastest one installed
+    :raises: ImportError if aiohttp is not installed
+    """
+    def __init__(self, username, password, limit: int=100, timeout: float=None, connector=None,
+                 url: str=DEFAULT_URL, codec=None):
+        if aiohttp is None:
+            raise ImportError('AsyncTrackobot requires aiohttp. Install it with "pip install aiohttp"')
+        logger.info('Creating AsyncTrackobot instance')
+        self._url = url.rstrip('/')
+        self._codec = codec if isinstance(codec, JSONCodec) else get_codec(codec)
+        self._username = username
+        self._password = password
+        self._auth = aiohttp.BasicAuth(username, password)
+        self._limit = limit
+        self._timeout = timeout
+        self._connector = connector
+        self._session = None
+
+    def _http(self):
+        """The HTTP session, created on first use because aiohttp needs a running event loop to create it"""
+        if self._session is None:
+            if self._connector is None:
+                connector, owner = aiohttp.TCPConnector(limit=self._limit), True
+            else:
+                connector, owner = self._connector, False
+            self._session = aiohttp.ClientSession(connector=connector, connector_owner=owner,
+                                                  timeout=aiohttp.ClientTimeout(total=self._timeout),
+                                                  json_serialize=self._codec.dumps)
+        return self._session
+
+    async def __aenter__(self):
+        try:
+            await self.login()
+        except BaseException:
+            await self.close()
+            raise
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def close(self):
+        """
+        Close this client's HTTP session.
+
+        :return: None
+        """
+        logger.debug('Closing HTTP session')
+        if self._session is not None:
+            await self._http().close()
+            self._session = None
+
+    async def login(self):
+        """
+        Log in to Trackobot with the instance's credentials.
+
+        :return: None
+        :raises: aiohttp.ClientResponseError on error
+        :raises: ValueError if the credentials are rejected
+        """
+        logger.info('Called login()')
+        endpoint = '/sessions'
+        logger.debug('POST on %s', endpoint)
+        data = {'username': self._username, 'password': self._password}
+        async with self._http().post(self._url + endpoint, data=data) as r:
+            r.raise_for_status()
+            text = await r.text()
+        if 'Invalid credentials' in text:
+            logger.error('Invalid credentials supplied')
+            raise ValueError('Incorrect username or password. API token is not supported.')
+
+    async def _json(self, method, endpoint, **kwargs):
+        logger.debug('%s on %s', method, endpoint)
+        async with self._http().request(method, self._url + endpoint, auth=self._auth, **kwargs) as r:
+            r.raise_for_status()
+            return await r.json(content_type=None, loads=self._codec.loads)
+
+    async def _send(self, method, endpoint, **kwargs):
+        logger.debug('%s on %s', method, endpoint)
+        async with self._http().request(method, self._url + endpoint, auth=self._auth, **kwargs) as r:
+            r.raise_for_status()
+
+    @staticmethod
+    async def create_user(url: str=DEFAULT_URL) -> dict:
+        """
+        Create a new username and password in Trackobot.
+        Returns JSON of the format {'username': 'newuser', 'password': 'password}
+
+        :param str url: The Trackobot server to create the user on
+        :return: Dictionary of new user data
+        :raises: ImportError if aiohttp is not installed
+        :raises: aiohttp.ClientResponseError on error
+        """
+        if aiohttp is None:
+            raise ImportError('AsyncTrackobot requires aiohttp. Install it with "pip install aiohttp"')
+        logger.info('Called create_user()')
+        endpoint = '/users.json'
+        logger.debug('POST on %s', endpoint)
+        async with aiohttp.ClientSession() as session:
+            async with session.post(url.rstrip('/') + endpoint) as r:
+                r.raise_for_status()
+                return await r.json(content_type=None, loads=get_codec().loads)
+
+    async def rename_user(self, name: str):
+        """
+        Rename your user to something else.
+
+        :param str name: The new display name
+        :return: None
+        :raises: aiohttp.ClientResponseError on error
+        """
+        logger.info('Called rename_user()')
+        logger.debug('GET on /profile to get user\'s ID')
+        async with self._http().get(self._url + '/profile', auth=self._auth) as r:
+            text = await r.text()
+        user_id = text.split('edit_user_', 1)[1].split('"')[0]
+        logger.debug('User ID is %s', user_id)
+        endpoint = '/users/{}/rename'.format(user_id)
+        data = {'_method': 'patch', 'user[displayname]': name}
+        await self._send('POST', endpoint, data=data)
+
+    async def one_time_auth(self) -> str:
+        """
+        Generate a one-time URL for opening your profile
+
+        :return: Profile URL
+        :rtype: str
+        :raises: aiohttp.ClientResponseError on error
+        """
+        logger.info('Called one_time_auth()')
+        data = await self._json('POST', '/one_time_auth.json')
+        return data['url'] if 'error' not in data else data['error']
+
+    async def modify_metadata(self, game_id: int, param: str, value: str) -> bool:
+        """
+        Modify the metadata of a specified game.
+        See ``Trackobot.modify_metadata()`` for the parameters that can be changed.
+
+        :param int game_id: The ID of the game to be modified
+        :param str param: The name of the parameter to be modified
+        :param str value: The new value for the parameter
+        :return: True if successfully changed, False otherwise
+        :rtype: bool
+        :raises: ValueError
+        """
+        logger.info('Called modify_metadata()')
+        return await self.patch_metadata(game_id, {param: value})
+
+    async def patch_metadata(self, game_id: int, changes: dict) -> bool:
+        """
+        Modify several metadata fields of a specified game in one request.
+
+        :param int game_id: The ID of the game to be modified
+        :param dict changes: Mapping of parameter name to its new value
+        :return: True if successfully changed, False otherwise
+        :rtype: bool
+        :raises: ValueError
+        """
+        logger.info('Called patch_metadata()')
+        _check_patch(game_id, changes)
+        endpoint = '/profile/results/' + str(game_id)
+        logger.debug('PUT on %s', endpoint)
+        async with self._http().put(self._url + endpoint, auth=self._auth, json=dict(changes)) as r:
+            if r.status == 204:
+                logger.info('Modify succeeded')
+                return True
+            logger.info('Modify failed')
+            return False
+
+    async def stats(self, stats_type: str='decks', time_range: str='all', mode: str='all',
+                    start=None, end=None, as_hero: str=None, vs_hero: str=None,
+                    as_deck: int=None, vs_deck: int=None) -> dict:
+        """
+        Get the user's statistics by deck, class, or for arena.
+        Takes the same arguments as ``Trackobot.stats()``.
+
+        :return: Dictionary of stats
+        :rtype: dict
+        :raises: aiohttp.ClientResponseError on error
+        :raises: ValueError
+        :raises: TypeError
+        """
+        logger.info('Called stats()')
+        endpoint, params = _stats_request(stats_type, time_range, mode, start, end,
+                                          as_hero, vs_hero, as_deck, vs_deck)
+        return await self._json('GET', endpoint, params=_drop_none(params))
+
+    async def decks(self) -> dict:
+        """
+        Get the deck archetypes supported by Track-o-bot.
+
+        :return: Dictionary listing each archetype by class
+        :rtype: dict
+        :raises: aiohttp.ClientResponseError on error
+        """
+        logger.info('Called decks()')
+        return await self._json('GET', '/profile/settings/decks.json')
+
+    async def reset(self, modes: list=None):
+        """
+        Reset the user's account data for the specified game modes.
+        Supported modes values are "ranked", "casual", "practice",
+        "arena", and "friendly".
+
+        :param list modes: A list of the modes to reset
+        :return: None
+        :raises: aiohttp.ClientResponseError on error
+        :raises: ValueError
+        """
+        logger.info('Called reset()')
+        modes = _reset_modes(modes)
+        data = [('reset_modes[]', mode) for mode in modes]
+        await self._send('POST', '/profile/settings/account/reset', data=data)
+
+    async def history(self, page: int=1, query: str=None) -> dict:
+        """
+        Get game history for the user by page.
+        Each page contains 15 games.
+        Note that this will include arena matches.
+
+        :param int page: The page number
+        :param str query: A query string to narrow results
+        :return: Dictionary of game data
+        :rtype: dict
+        :raises: aiohttp.ClientResponseError on error
+        """
+        logger.info('Called history()')
+        params = {'page': page}
+        if query is not None:
+            params['query'] = query
+        return await self._json('GET', '/profile.json', params=params)
+
+    async def arena_history(self, page: int=1) -> dict:
+        """
+        Get arena game history for the user by page.
+
+        :param int page: The page number
+        :return: Dictionary of game data
+        :rtype: dict
+        :raises: aiohttp.ClientResponseError on error
+        """
+        logger.info('Called arena_history()')
+        return await self._json('GET', '/profile/arena.json', params={'page': page})
+
+    async def toggle_tracking(self, enabled: bool=True):
+        """
+        Enable or disable automatic deck tracking
+
+        :param bool enabled: If True, tracking is enabled, else it is disabled
+        :return: None
+        :raises: aiohttp.ClientResponseError on error
+        """
+        logger.info('Called toggle_tracking()')
+        val = 'true' if enabled else 'false'
+        data = {'user[deck_tracking]': val, '_method': 'put'}
+        await self._send('POST', '/profile/settings/decks/toggle', data=data)
+
+    async def delete_game(self, game_id: int):
+        """
+        Delete the specified game from Trackobot.
+
+        :param int game_id: The ID of the game to delete
+        :return: None
+        :raises: aiohttp.ClientResponseError on error
+        """
+        logger.info('Called delete_game()')
+        await self._send('DELETE', '/profile/results/' + str(game_id))
+
+    async def upload_game(self, game_data: dict) -> dict:
+        """
+        Upload a new game's data to Trackobot.
+        See ``Trackobot.upload_game()`` for the expected format.
+
+        :param dict game_data: The metadata and card data for the new game
+        :return: JSON dictionary of the newly created game
+        :rtype: dict
+        :raises: aiohttp.ClientResponseError on error
+        """
+        logger.info('Called upload_game()')
+        return await self._json('POST', '/profile/results.json', json=game_data)
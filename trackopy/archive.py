@@ -0,0 +1,262 @@
+import bisect
+import datetime
+import logging
+import mmap
+import os
+import struct
+
+from .codec import JSONCodec, get_codec
+from .models import Game, _parse_time
+
+
+logger = logging.getLogger(__name__)
+
+# One index record per appended game: game ID, added time in ms since the epoch, byte offset and length
+_RECORD = struct.Struct('<qqQI')
+# Stands in for the added time of games that have none, which are left out of time range queries
+_NO_TIME = -2 ** 63
+
+
+def _millis(value) -> int:
+    if not value:
+        return _NO_TIME
+    return int(_parse_time(value).timestamp() * 1000)
+
+
+class HistoryArchive:
+    """
+    Append-only file of downloaded games with an index for random access.
+
+    Games are stored one per line as JSON, so the archive is also a valid
+    NDJSON file. A side file, the archive path plus ".idx", holds a fixed
+    size record per game with its ID, its added time and the position of
+    its line. Only the index is read on opening. Games are read through
+    ``mmap``, so looking up one game or a time range only touches the
+    lines that are needed.
+
+    Appending a game that is already archived unchanged does nothing. A
+    changed game is appended again and the newer copy is the one read.
+
+    Opening an archive never writes to it, so an archive can be read while
+    another process appends to it. Games past the end of the index, or all
+    games if the index is missing or damaged, are indexed in memory, and a
+    partly written last line is skipped. The next ``append()``, or
+    ``reindex()``, saves the repaired index and removes the partial line.
+
+    :param str path: The archive file. It is created if it does not exist
+    :param codec: A trackopy.codec.JSONCodec, or the name of a JSON backend. Defaults to the fastest one installed
+    """
+    def __init__(self, path: str, codec=None):
+        logger.info('Opening history archive %s', path)
+        self.path = path
+        self.index_path = path + '.idx'
+        self._codec = codec if isinstance(codec, JSONCodec) else get_codec(codec)
+        self._file = open(path, 'ab+')
+        self._map = None
+        self._entries = {}
+        self._by_time = None
+        self._load_index()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, game_id):
+        return game_id in self._entries
+
+    def __iter__(self):
+        return self.between()
+
+    def close(self):
+        """
+        Close the archive.
+
+        :return: None
+        """
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self._file.close()
+
+    def _load_index(self):
+        size = os.path.getsize(self.path)
+        try:
+            with open(self.index_path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            data = b''
+        usable = len(data) - len(data) % _RECORD.size
+        entries = {}
+        end = 0
+        for game_id, added, offset, length in _RECORD.iter_unpack(data[:usable]):
+            entries[game_id] = (added, offset, length)
+            end = max(end, offset + length)
+        if end > size:
+            logger.info('Index of %s is past the end of the archive, reading the whole archive', self.path)
+            entries, end = {}, 0
+        self._entries = entries
+        self._end = self._scan(end)
+        if self._end != end:
+            logger.info('Indexed %d bytes of %s that were missing from its index', self._end - end, self.path)
+        # Whether the index file differs from self._entries, and so is rewritten by the next append()
+        self._stale = usable != len(data) or self._end != end
+
+    def _scan(self, offset) -> int:
+        """Index in memory the complete lines from offset to the end of the archive and return where they end"""
+        self._file.seek(offset)
+        for line in self._file:
+            if not line.endswith(b'\n'):
+                break
+            game = self._codec.loads(line)
+            self._entries[game['id']] = (_millis(game.get('added')), offset, len(line))
+            offset += len(line)
+        return offset
+
+    def _truncate(self, size):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        logger.info('Removing a partly written game from the end of %s', self.path)
+        self._file.truncate(size)
+
+    def reindex(self):
+        """
+        Rebuild the index by reading the whole archive.
+        A partly written last line, left by an interrupted append, is removed.
+
+        :return: None
+        """
+        logger.info('Called reindex()')
+        self._entries = {}
+        self._end = self._scan(0)
+        if self._file.seek(0, os.SEEK_END) != self._end:
+            self._truncate(self._end)
+        self._write_index(self._entries)
+        self._stale = False
+        self._by_time = None
+
+    def _repair(self):
+        """Before appending, index the lines appended since the archive was opened, remove a partly written
+        last line and save the index if it does not match the archive"""
+        size = self._file.seek(0, os.SEEK_END)
+        if size != self._end:
+            self._end = self._scan(self._end)
+            if size != self._end:
+                self._truncate(self._end)
+            self._stale = True
+            self._by_time = None
+        if self._stale:
+            self._write_index(self._entries)
+            self._stale = False
+
+    def _write_index(self, entries):
+        records = sorted(entries.items(), key=lambda item: item[1][1])
+        tmp = self.index_path + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(b''.join(_RECORD.pack(game_id, *entry) for game_id, entry in records))
+        os.replace(tmp, self.index_path)
+
+    def _view(self, end):
+        """A memory map of the archive that covers at least the first end bytes"""
+        if self._map is None or len(self._map) < end:
+            if self._map is not None:
+                self._map.close()
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._map
+
+    def _raw(self, entry):
+        _, offset, length = entry
+        return self._view(offset + length)[offset:offset + length]
+
+    def _load(self, entry, typed):
+        game = self._codec.loads(self._raw(entry))
+        return Game.from_dict(game) if typed else game
+
+    def get(self, game_id: int, typed: bool=False):
+        """
+        Get an archived game by ID.
+
+        :param int game_id: The ID of the game
+        :param bool typed: If True, return a trackopy.models.Game instead of a dictionary
+        :return: The game, or None if it is not archived
+        """
+        entry = self._entries.get(game_id)
+        return self._load(entry, typed) if entry is not None else None
+
+    def ids(self) -> list:
+        """
+        List the IDs of the archived games, in the order they were first appended.
+
+        :return: List of game IDs
+        :rtype: list
+        """
+        return list(self._entries)
+
+    def between(self, start: datetime.datetime=None, end: datetime.datetime=None, typed: bool=False):
+        """
+        Iterate over the games added from start, inclusive, to end, exclusive,
+        oldest first. With neither given, every game is yielded, and those
+        with no added time come first.
+
+        :param datetime.datetime start: The earliest time to include. Naive datetimes are taken as UTC
+        :param datetime.datetime end: The time to stop before. Naive datetimes are taken as UTC
+        :param bool typed: If True, yield trackopy.models.Game records instead of dictionaries
+        :return: Generator of games
+        """
+        if self._by_time is None:
+            self._by_time = sorted((added, offset, length) for added, offset, length in self._entries.values())
+        by_time = self._by_time
+        low = 0 if start is None and end is None else bisect.bisect_left(by_time, (_NO_TIME + 1,))
+        if start is not None:
+            low = bisect.bisect_left(by_time, (_millis(start),))
+        high = len(by_time) if end is None else bisect.bisect_left(by_time, (_millis(end),))
+        for i in range(low, high):
+            yield self._load(by_time[i], typed)
+
+    def append(self, games) -> int:
+        """
+        Append games to the archive, skipping games that are archived unchanged.
+
+        :param games: Iterable of game dictionaries or trackopy.models.Game records
+        :return: The number of games appended
+        :rtype: int
+        """
+        self._repair()
+        offset = self._end
+        lines, records = [], []
+        appended = {}
+        for game in games:
+            if isinstance(game, Game):
+                game = game.to_dict()
+            line = self._codec.dumps(game).encode() + b'\n'
+            game_id = game['id']
+            if game_id in appended:
+                if appended[game_id][1] == line:
+                    continue
+            elif game_id in self._entries:
+                current = self._entries[game_id]
+                if current[2] == len(line) and self._raw(current) == line:
+                    continue
+            entry = (_millis(game.get('added')), offset, len(line))
+            appended[game_id] = (entry, line)
+            lines.append(line)
+            records.append(_RECORD.pack(game_id, *entry))
+            offset += len(line)
+        if not lines:
+            return 0
+        self._file.write(b''.join(lines))
+        self._file.flush()
+        self._end = offset
+        os.fsync(self._file.fileno())
+        with open(self.index_path, 'ab') as f:
+            f.write(b''.join(records))
+        for game_id, (entry, _) in appended.items():
+            self._entries[game_id] = entry
+        self._by_time = None
+        logger.debug('Appended %d games to %s', len(lines), self.path)
+        return len(lines)
@@ -0,0 +1,154 @@
+import collections
+import json
+import logging
+import os
+import threading
+import time
+
+
+logger = logging.getLogger(__name__)
+
+
+DEFAULT_TTLS = {
+    '/profile/settings/decks.json': 24 * 60 * 60,
+    '/profile/stats/': 5 * 60,
+}
+
+
+class CacheEntry:
+    """
+    A cached response body with the validators needed to revalidate it.
+
+    :param str body: The response text
+    :param float expires: Unix time after which the entry must be revalidated
+    :param str etag: The ETag header of the response, if any
+    :param str last_modified: The Last-Modified header of the response, if any
+    """
+    __slots__ = ('body', 'expires', 'etag', 'last_modified')
+
+    def __init__(self, body: str, expires: float, etag: str=None, last_modified: str=None):
+        self.body = body
+        self.expires = expires
+        self.etag = etag
+        self.last_modified = last_modified
+
+    def fresh(self, now: float=None) -> bool:
+        return (time.time() if now is None else now) < self.expires
+
+    def validators(self) -> dict:
+        """Headers that ask the server whether this entry is still current"""
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+
+class ResponseCache:
+    """
+    Size-bounded LRU cache of GET responses, shared safely between threads.
+
+    Each endpoint's responses are kept for the TTL of the longest prefix in
+    ``ttls`` that matches the endpoint; endpoints without a TTL are not
+    cached. Expired entries that carry an ETag or Last-Modified header are
+    kept so they can be revalidated with a conditional request.
+
+    Any object with the same ``ttl()``, ``get()``, ``set()`` and
+    ``invalidate()`` methods can be given to ``Trackobot`` instead.
+
+    :param dict ttls: Mapping of endpoint prefix to seconds. Defaults to DEFAULT_TTLS
+    :param int max_entries: The most responses to keep before evicting the least recently used
+    :param str path: A JSON file to load entries from and save them to with save()
+    """
+    def __init__(self, ttls: dict=None, max_entries: int=256, path: str=None):
+        self._ttls = dict(DEFAULT_TTLS if ttls is None else ttls)
+        self._max_entries = max_entries
+        self._path = path
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+        if path is not None and os.path.exists(path):
+            self.load()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def ttl(self, endpoint: str) -> float:
+        """
+        Get how long responses from an endpoint are cached.
+
+        :param str endpoint: The endpoint path, such as /profile/settings/decks.json
+        :return: Seconds, or 0 if the endpoint is not cached
+        :rtype: float
+        """
+        matches = [prefix for prefix in self._ttls if endpoint.startswith(prefix)]
+        return self._ttls[max(matches, key=len)] if matches else 0
+
+    def get(self, key: str) -> CacheEntry:
+        """
+        Get an entry, marking it as recently used.
+
+        :param str key: The cache key
+        :return: The entry, which may be stale, or None
+        :rtype: CacheEntry
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key: str, entry: CacheEntry):
+        """
+        Store an entry, evicting the least recently used entries if the cache is full.
+
+        :param str key: The cache key
+        :param CacheEntry entry: The entry to store
+        :return: None
+        """
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_entries:
+                evicted, _ = self._entries.popitem(last=False)
+                logger.debug('Evicted %s from the response cache', evicted)
+
+    def invalidate(self, prefix: str=''):
+        """
+        Drop every entry whose key starts with prefix.
+
+        :param str prefix: The key prefix. An empty prefix clears the cache
+        :return: None
+        """
+        with self._lock:
+            for key in [key for key in self._entries if key.startswith(prefix)]:
+                del self._entries[key]
+
+    def load(self):
+        """
+        Replace the cache's entries with those saved in its file.
+
+        :return: None
+        """
+        logger.debug('Loading response cache from %s', self._path)
+        with open(self._path) as f:
+            saved = json.load(f)
+        with self._lock:
+            self._entries = collections.OrderedDict((key, CacheEntry(**value)) for key, value in saved)
+
+    def save(self):
+        """
+        Write the cache's entries to its file. Does nothing if the cache has no file.
+
+        :return: None
+        """
+        if self._path is None:
+            return
+        logger.debug('Saving response cache to %s', self._path)
+        with self._lock:
+            saved = [(key, {name: getattr(entry, name) for name in CacheEntry.__slots__})
+                     for key, entry in self._entries.items()]
+        tmp = self._path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(saved, f)
+        os.replace(tmp, self._path)
@@ -0,0 +1,161 @@
+import datetime
+import json
+import logging
+import os
+
+
+logger = logging.getLogger(__name__)
+
+# Backends in order of preference
+BACKENDS = ('orjson', 'ujson', 'json')
+
+
+def _default(obj):
+    """Encode the objects that JSON has no type for, in the same way for every backend"""
+    if isinstance(obj, (datetime.datetime, datetime.date, datetime.time)):
+        return obj.isoformat()
+    if isinstance(obj, tuple):
+        return list(obj)
+    raise TypeError('Object of type {} is not JSON serializable'.format(type(obj).__name__))
+
+
+class JSONCodec:
+    """
+    Encodes and decodes JSON with one backend.
+    Use ``get_codec()`` to get the fastest installed backend.
+
+    The backends of ``get_codec()`` accept the same objects and encode
+    them the same way, whichever is installed: dictionary keys may be
+    str, int, float, bool or None, dates and times are written with
+    ``isoformat()``, and named tuples as arrays. Anything else raises
+    TypeError. The exceptions are integers wider than 64 bits, which only
+    json encodes, and NaN, which orjson writes as null.
+
+    :param str name: The name of the backend
+    :param loads: A function decoding str or bytes into Python objects
+    :param dumps: A function encoding a Python object into a compact str
+    """
+    def __init__(self, name: str, loads, dumps):
+        self.name = name
+        self.loads = loads
+        self.dumps = dumps
+
+    def __repr__(self):
+        return '<JSONCodec {}>'.format(self.name)
+
+    def load(self, f):
+        """Decode the JSON document in file f"""
+        return self.loads(f.read())
+
+    def dump(self, obj, f):
+        """Encode obj into file f"""
+        f.write(self.dumps(obj))
+
+    def dump_array(self, items, f) -> int:
+        """
+        Write an iterable as one JSON array, encoding an element at a time so
+        the whole document is never held in memory. Lists in the iterable,
+        such as pages of history, are written as consecutive elements of the
+        one array, and the file is flushed after each of them.
+
+        :param items: Iterable of objects or lists of objects
+        :param f: A text file to write to
+        :return: The number of elements written
+        :rtype: int
+        """
+        dumps = self.dumps
+        count = 0
+        f.write('[')
+        for chunk in _chunks(items):
+            for element in chunk:
+                if count:
+                    f.write(',')
+                f.write(dumps(element))
+                count += 1
+            f.flush()
+        f.write(']')
+        return count
+
+    def dump_lines(self, items, f) -> int:
+        """
+        Write an iterable as newline-delimited JSON, one element per line.
+        Lists are expanded and the file flushed as in dump_array().
+
+        :param items: Iterable of objects or lists of objects
+        :param f: A text file to write to
+        :return: The number of lines written
+        :rtype: int
+        """
+        dumps = self.dumps
+        count = 0
+        for chunk in _chunks(items):
+            f.write(''.join(dumps(element) + '\n' for element in chunk))
+            f.flush()
+            count += len(chunk)
+        return count
+
+
+def _chunks(items):
+    """Yield lists as they are and wrap anything else in a one-element list"""
+    for item in items:
+        yield item if isinstance(item, list) else [item]
+
+
+def _orjson():
+    import orjson
+    # Keys like json's, and dates and times through _default() so they are written as json writes them
+    option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+
+    def dumps(obj):
+        return orjson.dumps(obj, default=_default, option=option).decode()
+    return JSONCodec('orjson', orjson.loads, dumps)
+
+
+def _ujson():
+    import ujson
+
+    def dumps(obj):
+        return ujson.dumps(obj, ensure_ascii=False, escape_forward_slashes=False, default=_default)
+    return JSONCodec('ujson', ujson.loads, dumps)
+
+
+def _stdlib():
+    encoder = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'), default=_default)
+    return JSONCodec('json', json.loads, encoder.encode)
+
+
+_factories = {'orjson': _orjson, 'ujson': _ujson, 'json': _stdlib}
+_codecs = {}
+
+
+def get_codec(name: str=None) -> JSONCodec:
+    """
+    Get a JSON codec by backend name.
+    With no name, the TRACKOPY_JSON environment variable is used if it is
+    set, and otherwise the first installed backend of orjson, ujson and the
+    standard library json module.
+
+    :param str name: One of "orjson", "ujson" or "json"
+    :return: The codec
+    :rtype: JSONCodec
+    :raises: ValueError if the name is not a known backend
+    :raises: ImportError if the named backend is not installed
+    """
+    if name is None:
+        name = os.environ.get('TRACKOPY_JSON') or None
+    if name is not None and name not in _factories:
+        logger.error('%s is not a JSON backend', name)
+        raise ValueError('JSON backend must be one of ' + ', '.join(BACKENDS))
+    if name in _codecs:
+        return _codecs[name]
+    if name is not None:
+        codec = _codecs[name] = _factories[name]()
+        return codec
+    for backend in BACKENDS:
+        try:
+            codec = _factories[backend]()
+        except ImportError:
+            continue
+        logger.debug('Using %s for JSON', backend)
+        _codecs[None] = _codecs[backend] = codec
+        return codec
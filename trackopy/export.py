@@ -0,0 +1,241 @@
+import csv
+import logging
+import os
+
+from .models import Game, _parse_time
+
+
+logger = logging.getLogger(__name__)
+
+# The optional pyarrow dependency, set by _import_pyarrow() when a parquet or arrow file is first written.
+# It is slow to import, so it is not imported with this module
+pyarrow = None
+
+
+def _import_pyarrow():
+    """Import pyarrow if it has not been imported yet. Return None if it is not installed"""
+    global pyarrow
+    if pyarrow is None:
+        try:
+            import pyarrow.ipc
+            import pyarrow.parquet
+        except ImportError:
+            return None
+    return pyarrow
+
+FORMATS = ('csv', 'parquet', 'arrow')
+
+# Column names and types of the games table, one row per game
+GAME_COLUMNS = (('id', 'int'), ('added', 'timestamp'), ('mode', 'str'), ('hero', 'str'),
+                ('hero_deck', 'str'), ('hero_deck_id', 'int'), ('opponent', 'str'),
+                ('opponent_deck', 'str'), ('opponent_deck_id', 'int'), ('win', 'bool'),
+                ('coin', 'bool'), ('rank', 'int'), ('legend', 'int'), ('duration', 'int'),
+                ('note', 'str'))
+
+# Column names and types of the card plays table, one row per card played, linked by game_id
+CARD_COLUMNS = (('game_id', 'int'), ('index', 'int'), ('turn', 'int'), ('player', 'str'),
+                ('card_id', 'str'), ('card_name', 'str'), ('mana', 'int'))
+
+
+def _int(value):
+    if value is None or value == '':
+        return None
+    return int(value)
+
+
+def _bool(value):
+    if value is None or isinstance(value, bool):
+        return value
+    return str(value).lower() in ('1', 'true', 'yes', 'win')
+
+
+def _str(value):
+    return None if value is None else str(value)
+
+
+def _timestamp(value):
+    return None if not value else _parse_time(value)
+
+
+_CONVERTERS = {'int': _int, 'bool': _bool, 'str': _str, 'timestamp': _timestamp}
+
+
+def game_row(game: dict) -> dict:
+    """
+    Flatten a game into a row of the games table.
+    Missing fields are None. ``win`` is read from either the "win" or the
+    "result" field, since uploaded games use the former and history the latter.
+
+    :param dict game: A game as returned by Trackobot.history()
+    :return: Mapping of GAME_COLUMNS names to typed values
+    :rtype: dict
+    """
+    values = dict(game)
+    if 'win' not in values and 'result' in values:
+        values['win'] = values['result'] == 'win'
+    values.setdefault('hero_deck_id', values.get('deck_id'))
+    return {name: _CONVERTERS[kind](values.get(name)) for name, kind in GAME_COLUMNS}
+
+
+def card_rows(game: dict) -> list:
+    """
+    Flatten the card history of a game into rows of the card plays table.
+    Cards may be given as nested {"card": {"id", "name", "mana"}} objects,
+    as in history, or with a flat "card_id", as in uploads.
+
+    :param dict game: A game as returned by Trackobot.history()
+    :return: List of mappings of CARD_COLUMNS names to typed values
+    :rtype: list
+    """
+    rows = []
+    for index, play in enumerate(game.get('card_history') or ()):
+        card = play.get('card') or {}
+        rows.append({'game_id': _int(game.get('id')), 'index': index, 'turn': _int(play.get('turn')),
+                     'player': _str(play.get('player')), 'card_id': _str(card.get('id', play.get('card_id'))),
+                     'card_name': _str(card.get('name')), 'mana': _int(card.get('mana'))})
+    return rows
+
+
+def cards_path(path: str) -> str:
+    """The default card plays file for a games file, e.g. history.cards.csv for history.csv"""
+    root, ext = os.path.splitext(path)
+    return root + '.cards' + ext
+
+
+class _CSVTable:
+    def __init__(self, path, columns):
+        self._file = open(path, 'w', newline='')
+        self._writer = csv.writer(self._file)
+        self._writer.writerow([name for name, _ in columns])
+        self._names = [name for name, _ in columns]
+
+    def write(self, rows):
+        self._writer.writerows([self._format(row[name]) for name in self._names] for row in rows)
+        self._file.flush()
+
+    @staticmethod
+    def _format(value):
+        if value is None:
+            return ''
+        if hasattr(value, 'isoformat'):
+            return value.isoformat()
+        return value
+
+    def close(self):
+        self._file.close()
+
+
+class _ArrowTable:
+    types = {'int': 'int64', 'bool': 'bool_', 'str': 'string'}
+
+    def __init__(self, path, columns, fmt):
+        fields = []
+        for name, kind in columns:
+            if kind == 'timestamp':
+                fields.append(pyarrow.field(name, pyarrow.timestamp('ms', tz='UTC')))
+            else:
+                fields.append(pyarrow.field(name, getattr(pyarrow, self.types[kind])()))
+        self._schema = pyarrow.schema(fields)
+        if fmt == 'parquet':
+            self._writer = pyarrow.parquet.ParquetWriter(path, self._schema)
+        else:
+            self._writer = pyarrow.ipc.new_file(path, self._schema)
+
+    def write(self, rows):
+        if rows:
+            self._writer.write_table(pyarrow.Table.from_pylist(rows, schema=self._schema))
+
+    def close(self):
+        self._writer.close()
+
+
+class HistoryExporter:
+    """
+    Write games as two flat tables: one row per game, and one row per card
+    played, linked to its game by ``game_id``. Games are written as they are
+    given, so a history of any length is exported in bounded memory.
+
+    The csv format needs nothing extra. The parquet and arrow formats need
+    the optional ``pyarrow`` dependency. Arrow files use the Arrow IPC file
+    format, also known as Feather version 2.
+
+    Use as a context manager, or call ``close()`` when done::
+
+        with HistoryExporter('history.parquet') as exporter:
+            for games in trackobot.iter_history_pages(prefetch=4):
+                exporter.write(games)
+
+    :param str path: The file to write games to
+    :param str fmt: One of csv, parquet or arrow. Defaults to the extension of path
+    :param str cards: The file to write card plays to. Defaults to path with ".cards" before the extension
+    :raises: ValueError if the format is unknown
+    :raises: ImportError if the format needs pyarrow and it is not installed
+    """
+    def __init__(self, path: str, fmt: str=None, cards: str=None):
+        if fmt is None:
+            fmt = os.path.splitext(path)[1].lstrip('.').lower()
+        if fmt not in FORMATS:
+            logger.error('%s is not an export format', fmt)
+            raise ValueError('fmt must be one of ' + ', '.join(FORMATS))
+        if fmt != 'csv' and _import_pyarrow() is None:
+            raise ImportError('Exporting to {} requires pyarrow. Install it with "pip install pyarrow"'.format(fmt))
+        logger.info('Exporting history to %s', path)
+        self.path = path
+        self.cards_path = cards if cards is not None else cards_path(path)
+        self.games = 0
+        self.cards = 0
+        if fmt == 'csv':
+            self._games = _CSVTable(self.path, GAME_COLUMNS)
+            self._cards = _CSVTable(self.cards_path, CARD_COLUMNS)
+        else:
+            self._games = _ArrowTable(self.path, GAME_COLUMNS, fmt)
+            self._cards = _ArrowTable(self.cards_path, CARD_COLUMNS, fmt)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def write(self, games):
+        """
+        Write a batch of games, such as one page of history.
+
+        :param games: Iterable of game dictionaries or trackopy.models.Game records
+        :return: None
+        """
+        games = [game.to_dict() if isinstance(game, Game) else game for game in games]
+        cards = [row for game in games for row in card_rows(game)]
+        self._games.write([game_row(game) for game in games])
+        self._cards.write(cards)
+        self.games += len(games)
+        self.cards += len(cards)
+
+    def close(self):
+        """
+        Finish and close both files.
+
+        :return: None
+        """
+        self._games.close()
+        self._cards.close()
+
+
+def export_history(pages, path: str, fmt: str=None, cards: str=None) -> tuple:
+    """
+    Export pages of games, such as from Trackobot.iter_history_pages(),
+    with a HistoryExporter. Each page is written before the next is read.
+
+    :param pages: Iterable of lists of game dictionaries
+    :param str path: The file to write games to
+    :param str fmt: One of csv, parquet or arrow. Defaults to the extension of path
+    :param str cards: The file to write card plays to
+    :return: The number of games and of card plays written
+    :rtype: tuple
+    :raises: ValueError if the format is unknown
+    :raises: ImportError if the format needs pyarrow and it is not installed
+    """
+    with HistoryExporter(path, fmt, cards) as exporter:
+        for games in pages:
+            exporter.write(games)
+    return exporter.games, exporter.cards
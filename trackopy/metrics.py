@@ -0,0 +1,243 @@
+import bisect
+import collections
+import logging
+import re
+import threading
+import time
+
+import requests
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+
+logger = logging.getLogger(__name__)
+
+_ID_SEGMENT = re.compile(r'/\d+(?=/|$)')
+
+
+def endpoint_template(path: str) -> str:
+    """Replace numeric path segments with :id so that per-game URLs share one label"""
+    return _ID_SEGMENT.sub('/:id', path)
+
+
+class RequestEvent:
+    """
+    Timing and size information about one request, passed to every hook.
+    Times are in seconds. ``connect`` is the time spent opening TCP and TLS
+    connections, which is 0 when a pooled connection was reused and None
+    when the client does not own its session and so cannot measure it.
+    ``ttfb`` is the time until the response headers arrived, ``total``
+    includes reading the body, and ``decode`` is the time spent decoding
+    JSON, or None if the body was not decoded. All of these describe the
+    last attempt; ``retries`` counts the attempts before it.
+    ``status`` is None and ``error`` is set if no response was received.
+    """
+    __slots__ = ('method', 'endpoint', 'status', 'connect', 'ttfb', 'total', 'size',
+                 'retries', 'decode', 'error')
+
+    def __init__(self, method: str, endpoint: str):
+        self.method = method
+        self.endpoint = endpoint_template(endpoint)
+        self.status = None
+        self.connect = None
+        self.ttfb = None
+        self.total = None
+        self.size = 0
+        self.retries = 0
+        self.decode = None
+        self.error = None
+
+    def __repr__(self):
+        return '<RequestEvent {} {} {}>'.format(self.method, self.endpoint, self.status)
+
+
+_connect_time = threading.local()
+
+
+def _reset_connect_time():
+    _connect_time.value = 0.0
+
+
+def _read_connect_time():
+    return getattr(_connect_time, 'value', 0.0)
+
+
+class _TimedHTTPConnection(HTTPConnection):
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            super().connect()
+        finally:
+            _connect_time.value = _read_connect_time() + time.perf_counter() - start
+
+
+class _TimedHTTPSConnection(HTTPSConnection):
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            super().connect()
+        finally:
+            _connect_time.value = _read_connect_time() + time.perf_counter() - start
+
+
+class _TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _TimedHTTPConnection
+
+
+class _TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _TimedHTTPSConnection
+
+
+class TimedHTTPAdapter(requests.adapters.HTTPAdapter):
+    """HTTPAdapter that records how long each thread spends opening connections"""
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {'http': _TimedHTTPConnectionPool,
+                                                   'https': _TimedHTTPSConnectionPool}
+
+
+def _percentile(ordered, fraction):
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class LatencySummary:
+    """
+    Hook that keeps every request's latency, grouped by method and endpoint,
+    and summarises them as percentiles.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._samples = collections.defaultdict(lambda: {'total': [], 'ttfb': [], 'connect': [],
+                                                         'decode': [], 'bytes': 0, 'errors': 0,
+                                                         'retries': 0})
+
+    def __call__(self, event: RequestEvent):
+        with self._lock:
+            samples = self._samples[(event.method, event.endpoint)]
+            for name in ('total', 'ttfb', 'connect', 'decode'):
+                value = getattr(event, name)
+                if value is not None:
+                    samples[name].append(value)
+            samples['bytes'] += event.size
+            samples['retries'] += event.retries
+            if event.error is not None or (event.status or 0) >= 400:
+                samples['errors'] += 1
+
+    def summary(self) -> dict:
+        """
+        Summarise the requests seen so far.
+
+        :return: Mapping of "METHOD endpoint" to counts and p50/p90/p99/max of total latency,
+            plus the median connect, TTFB and decode times, in seconds
+        :rtype: dict
+        """
+        with self._lock:
+            result = {}
+            for (method, endpoint), samples in sorted(self._samples.items(), key=lambda item: item[0][1]):
+                total = sorted(samples['total'])
+                result['{} {}'.format(method, endpoint)] = {
+                    'count': len(total), 'errors': samples['errors'], 'retries': samples['retries'],
+                    'bytes': samples['bytes'],
+                    'p50': _percentile(total, 0.5), 'p90': _percentile(total, 0.9),
+                    'p99': _percentile(total, 0.99), 'max': total[-1] if total else 0.0,
+                    'connect_p50': _percentile(sorted(samples['connect']), 0.5),
+                    'ttfb_p50': _percentile(sorted(samples['ttfb']), 0.5),
+                    'decode_p50': _percentile(sorted(samples['decode']), 0.5),
+                }
+            return result
+
+    def report(self) -> str:
+        """
+        Format the summary as a table with latencies in milliseconds.
+
+        :return: The table
+        :rtype: str
+        """
+        lines = ['{:<40} {:>6} {:>6} {:>8} {:>8} {:>8} {:>8} {:>8} {:>8}'.format(
+            'request', 'count', 'errors', 'p50', 'p90', 'p99', 'max', 'connect', 'ttfb')]
+        for name, row in self.summary().items():
+            lines.append('{:<40} {:>6} {:>6} {:>8.1f} {:>8.1f} {:>8.1f} {:>8.1f} {:>8.1f} {:>8.1f}'.format(
+                name, row['count'], row['errors'], row['p50'] * 1000, row['p90'] * 1000, row['p99'] * 1000,
+                row['max'] * 1000, row['connect_p50'] * 1000, row['ttfb_p50'] * 1000))
+        return '\n'.join(lines)
+
+
+class PrometheusCollector:
+    """
+    Hook that aggregates requests into Prometheus metrics.
+    Call ``exposition()`` to get them in the Prometheus text format.
+
+    :param tuple buckets: Upper bounds, in seconds, of the request duration histogram buckets
+    """
+    default_buckets = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    def __init__(self, buckets: tuple=None):
+        self._buckets = tuple(sorted(buckets or self.default_buckets))
+        self._lock = threading.Lock()
+        self._requests = collections.Counter()
+        self._bytes = collections.Counter()
+        self._retries = collections.Counter()
+        self._durations = {}
+        self._decode = {}
+
+    def __call__(self, event: RequestEvent):
+        labels = (event.method, event.endpoint)
+        status = str(event.status) if event.status is not None else 'error'
+        with self._lock:
+            self._requests[labels + (status,)] += 1
+            self._bytes[labels] += event.size
+            self._retries[labels] += event.retries
+            if event.total is not None:
+                counts, total, observed = self._durations.get(labels, ([0] * len(self._buckets), 0.0, 0))
+                index = bisect.bisect_left(self._buckets, event.total)
+                if index < len(counts):
+                    counts[index] += 1
+                self._durations[labels] = (counts, total + event.total, observed + 1)
+            if event.decode is not None:
+                count, total = self._decode.get(labels, (0, 0.0))
+                self._decode[labels] = (count + 1, total + event.decode)
+
+    def exposition(self) -> str:
+        """
+        Render the metrics in the Prometheus text exposition format.
+
+        :return: The metrics text
+        :rtype: str
+        """
+        def label(method, endpoint, **extra):
+            pairs = [('method', method), ('endpoint', endpoint)] + sorted(extra.items())
+            return '{' + ','.join('{}="{}"'.format(k, v) for k, v in pairs) + '}'
+
+        with self._lock:
+            lines = ['# HELP trackopy_requests_total Requests sent to Trackobot.',
+                     '# TYPE trackopy_requests_total counter']
+            for (method, endpoint, status), value in sorted(self._requests.items()):
+                lines.append('trackopy_requests_total{} {}'.format(label(method, endpoint, status=status), value))
+            lines += ['# HELP trackopy_request_duration_seconds Time to receive the whole response.',
+                      '# TYPE trackopy_request_duration_seconds histogram']
+            for (method, endpoint), (counts, total, observed) in sorted(self._durations.items()):
+                cumulative = 0
+                for bound, count in zip(self._buckets, counts):
+                    cumulative += count
+                    lines.append('trackopy_request_duration_seconds_bucket{} {}'.format(
+                        label(method, endpoint, le=repr(bound)), cumulative))
+                lines.append('trackopy_request_duration_seconds_bucket{} {}'.format(
+                    label(method, endpoint, le='+Inf'), observed))
+                lines.append('trackopy_request_duration_seconds_sum{} {}'.format(label(method, endpoint), total))
+                lines.append('trackopy_request_duration_seconds_count{} {}'.format(label(method, endpoint), observed))
+            lines += ['# HELP trackopy_response_bytes_total Response body bytes received.',
+                      '# TYPE trackopy_response_bytes_total counter']
+            for (method, endpoint), value in sorted(self._bytes.items()):
+                lines.append('trackopy_response_bytes_total{} {}'.format(label(method, endpoint), value))
+            lines += ['# HELP trackopy_request_retries_total Requests retried after a failure.',
+                      '# TYPE trackopy_request_retries_total counter']
+            for (method, endpoint), value in sorted(self._retries.items()):
+                lines.append('trackopy_request_retries_total{} {}'.format(label(method, endpoint), value))
+            lines += ['# HELP trackopy_decode_seconds Time spent decoding JSON responses.',
+                      '# TYPE trackopy_decode_seconds summary']
+            for (method, endpoint), (count, total) in sorted(self._decode.items()):
+                lines.append('trackopy_decode_seconds_sum{} {}'.format(label(method, endpoint), total))
+                lines.append('trackopy_decode_seconds_count{} {}'.format(label(method, endpoint), count))
+            return '\n'.join(lines) + '\n'
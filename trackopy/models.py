@@ -0,0 +1,154 @@
+import datetime
+import sys
+
+
+def _parse_time(value) -> datetime.datetime:
+    """Parse the "added" timestamp of a game into an aware UTC datetime"""
+    if isinstance(value, datetime.datetime):
+        parsed = value
+    else:
+        parsed = datetime.datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=datetime.timezone.utc)
+    return parsed
+
+
+def _intern(value):
+    """Intern strings so that every game shares one copy of each hero, mode, deck and card"""
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+def _win(game):
+    if 'win' in game:
+        return bool(game['win'])
+    if 'result' in game:
+        return game['result'] == 'win'
+    return None
+
+
+class CardPlay:
+    """
+    One card played during a game.
+
+    :param int turn: The turn the card was played on
+    :param str player: "me" or "opponent"
+    :param str card_id: The card's ID, such as "CS2_029"
+    :param str card_name: The card's name, if known
+    :param int mana: The card's mana cost, if known
+    """
+    __slots__ = ('turn', 'player', 'card_id', 'card_name', 'mana')
+
+    def __init__(self, turn: int, player: str, card_id: str, card_name: str=None, mana: int=None):
+        self.turn = turn
+        self.player = player
+        self.card_id = card_id
+        self.card_name = card_name
+        self.mana = mana
+
+    @classmethod
+    def from_dict(cls, play: dict) -> 'CardPlay':
+        """
+        Create a CardPlay from an entry of a game's card_history, either with a
+        nested "card" object, as in history, or with a "card_id", as in uploads.
+
+        :param dict play: The card history entry
+        :return: The card play
+        :rtype: CardPlay
+        """
+        card = play.get('card') or {}
+        return cls(play.get('turn'), _intern(play.get('player')), _intern(card.get('id', play.get('card_id'))),
+                   _intern(card.get('name')), card.get('mana'))
+
+    def to_dict(self) -> dict:
+        """
+        Convert back to a card history entry as found in history.
+
+        :return: The card history entry
+        :rtype: dict
+        """
+        return {'player': self.player, 'turn': self.turn,
+                'card': {'id': self.card_id, 'name': self.card_name, 'mana': self.mana}}
+
+    def __eq__(self, other):
+        if not isinstance(other, CardPlay):
+            return NotImplemented
+        return all(getattr(self, name) == getattr(other, name) for name in self.__slots__)
+
+    def __repr__(self):
+        return '<CardPlay turn {} {} {}>'.format(self.turn, self.player, self.card_name or self.card_id)
+
+
+class Game:
+    """
+    A game from the user's history, stored compactly.
+
+    Games use ``__slots__`` instead of a dict per game, hero, mode, deck and
+    card names are interned so they are shared between games, ``added`` is
+    parsed into an aware datetime, ``win`` is a bool read from either the
+    "win" or the "result" field, and the card history is a tuple of
+    CardPlay. Use ``Game.from_dict()`` to convert a game from ``history()``
+    and ``to_dict()`` to convert it back.
+    """
+    __slots__ = ('id', 'added', 'mode', 'hero', 'hero_deck', 'opponent', 'opponent_deck', 'win', 'coin',
+                 'rank', 'legend', 'duration', 'note', 'card_history')
+
+    def __init__(self, id: int, added, mode: str, hero: str, opponent: str, win: bool,
+                 hero_deck: str=None, opponent_deck: str=None, coin: bool=None, rank: int=None,
+                 legend: int=None, duration: int=None, note: str=None, card_history: tuple=()):
+        self.id = id
+        self.added = added
+        self.mode = mode
+        self.hero = hero
+        self.hero_deck = hero_deck
+        self.opponent = opponent
+        self.opponent_deck = opponent_deck
+        self.win = win
+        self.coin = coin
+        self.rank = rank
+        self.legend = legend
+        self.duration = duration
+        self.note = note
+        self.card_history = card_history
+
+    @classmethod
+    def from_dict(cls, game: dict) -> 'Game':
+        """
+        Create a Game from a game dictionary as returned by history().
+
+        :param dict game: The game
+        :return: The typed game
+        :rtype: Game
+        """
+        added = game.get('added')
+        return cls(game.get('id'), _parse_time(added) if added else None, _intern(game.get('mode')),
+                   _intern(game.get('hero')), _intern(game.get('opponent')), _win(game),
+                   hero_deck=_intern(game.get('hero_deck')), opponent_deck=_intern(game.get('opponent_deck')),
+                   coin=game.get('coin'), rank=game.get('rank'), legend=game.get('legend'),
+                   duration=game.get('duration'), note=game.get('note'),
+                   card_history=tuple(CardPlay.from_dict(play) for play in game.get('card_history') or ()))
+
+    def to_dict(self) -> dict:
+        """
+        Convert back to a game dictionary in the format returned by history().
+
+        :return: The game
+        :rtype: dict
+        """
+        added = None
+        if self.added is not None:
+            utc = self.added.astimezone(datetime.timezone.utc)
+            added = utc.strftime('%Y-%m-%dT%H:%M:%S.') + '{:03d}Z'.format(utc.microsecond // 1000)
+        return {'id': self.id, 'added': added, 'mode': self.mode, 'hero': self.hero, 'hero_deck': self.hero_deck,
+                'opponent': self.opponent, 'opponent_deck': self.opponent_deck,
+                'result': None if self.win is None else ('win' if self.win else 'loss'), 'coin': self.coin,
+                'rank': self.rank, 'legend': self.legend, 'duration': self.duration, 'note': self.note,
+                'card_history': [play.to_dict() for play in self.card_history]}
+
+    def __eq__(self, other):
+        if not isinstance(other, Game):
+            return NotImplemented
+        return all(getattr(self, name) == getattr(other, name) for name in self.__slots__)
+
+    def __repr__(self):
+        return '<Game {} {} {} vs {} {}>'.format(self.id, self.mode, self.hero, self.opponent,
+                                                 'win' if self.win else 'loss')
@@ -0,0 +1,282 @@
+import concurrent.futures
+import csv
+import datetime
+import logging
+import queue
+import threading
+
+import requests
+
+from .codec import JSONCodec, get_codec
+from .metrics import TimedHTTPAdapter
+from .scheduler import RequestScheduler
+from .trackobot import DEFAULT_URL, BulkResult, Trackobot, _stats_request
+
+
+logger = logging.getLogger(__name__)
+
+# Put on the results queue of iter_history_all() by each account when it has no more pages
+_DONE = object()
+
+
+class TrackobotPool:
+    """
+    Many Trackobot accounts used together.
+
+    Every account gets its own Trackobot client and session, so logins and
+    cookies stay separate, but all of the sessions are mounted on one
+    connection pool, and so share kept-alive connections to the server.
+    They also share one RequestScheduler, so a rate limit applies to all
+    accounts together, and an optional ResponseCache, whose keys already
+    include the username.
+
+    Fan-out calls such as ``login()``, ``map_stats()`` and ``map()`` run
+    every account at once over a pool of ``concurrency`` threads, which is
+    the most accounts that are ever sending requests at the same time
+    across all calls. Their results are dictionaries keyed by username of
+    trackopy.trackobot.BulkResult, so a failing account does not stop the
+    others::
+
+        with TrackobotPool.from_csv('creds.csv') as pool:
+            for username, result in pool.map_stats(stats_type='classes').items():
+                print(username, result.result if result.ok else result.error)
+
+    :param accounts: A mapping of username to password, or an iterable of (username, password) pairs
+    :param int concurrency: The most accounts to run at once
+    :param int pool_size: The most connections to keep open. Defaults to concurrency
+    :param float timeout: Seconds to wait on the server before giving up. None waits forever
+    :param trackopy.cache.ResponseCache cache: A cache for responses, shared by every account
+    :param trackopy.scheduler.RequestScheduler scheduler: Rate limit and retry policy shared by every account
+    :param list hooks: Functions called with a trackopy.metrics.RequestEvent after every request of every account
+    :param str url: The Trackobot server to talk to
+    :param codec: A trackopy.codec.JSONCodec, or the name of a JSON backend
+    :raises: ValueError if there are no accounts, a username is repeated or concurrency is less than 1
+    """
+    def __init__(self, accounts, concurrency: int=8, pool_size: int=None, timeout: float=None, cache=None,
+                 scheduler: RequestScheduler=None, hooks: list=None, url: str=DEFAULT_URL, codec=None):
+        logger.info('Creating TrackobotPool instance')
+        if concurrency < 1:
+            logger.error('concurrency must be at least 1, got %d', concurrency)
+            raise ValueError('concurrency must be at least 1')
+        if hasattr(accounts, 'items'):
+            accounts = accounts.items()
+        accounts = list(accounts)
+        if not accounts:
+            logger.error('No accounts given')
+            raise ValueError('accounts must contain at least one username and password')
+        usernames = [username for username, _ in accounts]
+        if len(set(usernames)) != len(usernames):
+            logger.error('Repeated usernames given')
+            raise ValueError('Each username may only be given once')
+        self._concurrency = concurrency
+        self._adapter = TimedHTTPAdapter(pool_connections=1, pool_maxsize=pool_size or concurrency)
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=concurrency)
+        codec = codec if isinstance(codec, JSONCodec) else get_codec(codec)
+        scheduler = scheduler if scheduler is not None else RequestScheduler()
+        self._clients = {}
+        for username, password in accounts:
+            session = requests.Session()
+            session.mount('https://', self._adapter)
+            session.mount('http://', self._adapter)
+            self._clients[username] = Trackobot(username, password, timeout=timeout, session=session, cache=cache,
+                                                scheduler=scheduler, hooks=hooks, url=url, codec=codec)
+        logger.debug('Created clients for %d accounts', len(self._clients))
+
+    @classmethod
+    def from_csv(cls, path: str, **kwargs) -> 'TrackobotPool':
+        """
+        Create a pool from a CSV file with "username" and "password" columns.
+        Rows with an empty username are skipped.
+
+        :param str path: The file to read
+        :param kwargs: Any other arguments to pass to the constructor
+        :return: A TrackobotPool instance
+        :rtype: TrackobotPool
+        :raises: OSError if the file cannot be read
+        :raises: ValueError if the file lacks either column or has no accounts
+        """
+        logger.info('Called from_csv()')
+        with open(path, newline='') as f:
+            reader = csv.DictReader(f)
+            if not {'username', 'password'} <= set(reader.fieldnames or ()):
+                logger.error('%s has no username and password columns', path)
+                raise ValueError('{} must have "username" and "password" columns'.format(path))
+            accounts = [(row['username'].strip(), row['password'] or '') for row in reader
+                        if (row['username'] or '').strip()]
+        return cls(accounts, **kwargs)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return len(self._clients)
+
+    def __iter__(self):
+        return iter(self._clients)
+
+    def __contains__(self, username):
+        return username in self._clients
+
+    def __getitem__(self, username) -> Trackobot:
+        return self._clients[username]
+
+    def close(self):
+        """
+        Stop the worker threads and close the shared connections.
+
+        :return: None
+        """
+        logger.debug('Closing TrackobotPool')
+        self._executor.shutdown(wait=True)
+        for client in self._clients.values():
+            client._session.close()
+        self._adapter.close()
+
+    def add_hook(self, hook):
+        """
+        Call hook with a trackopy.metrics.RequestEvent after every request of every account.
+        Hooks run on the pool's worker threads, so they must be thread-safe.
+
+        :param hook: A function taking one RequestEvent
+        :return: None
+        """
+        for client in self._clients.values():
+            client.add_hook(hook)
+
+    def _select(self, accounts):
+        if accounts is None:
+            return list(self._clients)
+        unknown = [username for username in accounts if username not in self._clients]
+        if unknown:
+            logger.error('Unknown accounts %s', unknown)
+            raise ValueError('Not in this pool: ' + ', '.join(unknown))
+        return list(accounts)
+
+    def map(self, func, accounts: list=None) -> dict:
+        """
+        Call func with the Trackobot client of each account, running
+        accounts at the same time up to the pool's concurrency.
+        Request errors and ValueErrors are captured in the results instead of being raised.
+
+        :param func: A function taking a Trackobot instance
+        :param list accounts: The usernames to run func for. Defaults to every account
+        :return: Dictionary of username to BulkResult, in the order of the accounts
+        :rtype: dict
+        :raises: ValueError if an account is not in the pool
+        """
+        usernames = self._select(accounts)
+
+        def call(username):
+            try:
+                return BulkResult(username, func(self._clients[username]), None)
+            except (requests.exceptions.RequestException, ValueError) as e:
+                logger.info('Account %s failed: %s', username, e)
+                return BulkResult(username, None, e)
+
+        futures = [(username, self._executor.submit(call, username)) for username in usernames]
+        return {username: future.result() for username, future in futures}
+
+    def login(self, accounts: list=None) -> dict:
+        """
+        Log in to every account at the same time, to check all of the credentials up front.
+
+        :param list accounts: The usernames to log in. Defaults to every account
+        :return: Dictionary of username to BulkResult, whose error is set if the login failed
+        :rtype: dict
+        """
+        logger.info('Called login()')
+        return self.map(Trackobot.login, accounts)
+
+    def map_stats(self, stats_type: str='decks', time_range: str='all', mode: str='all',
+                  start: datetime.datetime=None, end: datetime.datetime=None,
+                  as_hero: str=None, vs_hero: str=None, as_deck: int=None, vs_deck: int=None,
+                  accounts: list=None) -> dict:
+        """
+        Get the statistics of every account at the same time.
+        Takes the same arguments as Trackobot.stats(), which are checked once before any request is sent.
+
+        :param list accounts: The usernames to get stats for. Defaults to every account
+        :return: Dictionary of username to BulkResult, whose result is the dictionary of stats
+        :rtype: dict
+        :raises: ValueError
+        :raises: TypeError
+        """
+        logger.info('Called map_stats()')
+        _stats_request(stats_type, time_range, mode, start, end, as_hero, vs_hero, as_deck, vs_deck)
+
+        def stats(client):
+            return client.stats(stats_type=stats_type, time_range=time_range, mode=mode, start=start, end=end,
+                                as_hero=as_hero, vs_hero=vs_hero, as_deck=as_deck, vs_deck=vs_deck)
+        return self.map(stats, accounts)
+
+    def iter_history_all(self, query: str=None, arena: bool=False, count: int=None, typed: bool=False,
+                         accounts: list=None):
+        """
+        Page through the history of every account at the same time.
+
+        Yields a BulkResult for each page as it arrives, whose ``item`` is
+        the username and ``result`` the list of games on the page. Pages of
+        one account arrive in order, but pages of different accounts are
+        interleaved. An account whose history fails yields one BulkResult
+        with the error and no more pages. Accounts wait for the consumer
+        once a few pages are waiting, and stop when the generator is closed.
+        Other fan-out calls on the pool wait for these accounts to finish, so
+        do not make them while consuming the generator.
+
+        :param str query: A query string to narrow results. Not supported for arena history
+        :param bool arena: If True, get arena history instead of all history
+        :param int count: The number of pages to get from each account. None gets every page
+        :param bool typed: If True, pages are lists of trackopy.models.Game records
+        :param list accounts: The usernames to get history for. Defaults to every account
+        :return: Generator of BulkResult
+        :raises: ValueError
+        """
+        logger.info('Called iter_history_all()')
+        if arena and query is not None:
+            logger.error('query is not supported for arena history')
+            raise ValueError('query is not supported for arena history')
+        usernames = self._select(accounts)
+        results = queue.Queue(maxsize=2 * self._concurrency)
+        stop = threading.Event()
+
+        def put(item):
+            while not stop.is_set():
+                try:
+                    results.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def page_through(username):
+            try:
+                pages = self._clients[username].iter_history_pages(query=query, arena=arena, count=count,
+                                                                   typed=typed)
+                for games in pages:
+                    if not put(BulkResult(username, games, None)):
+                        return
+            except (requests.exceptions.RequestException, ValueError) as e:
+                logger.info('History of account %s failed: %s', username, e)
+                put(BulkResult(username, None, e))
+            finally:
+                put(_DONE)
+
+        def generate():
+            futures = [self._executor.submit(page_through, username) for username in usernames]
+            remaining = len(futures)
+            try:
+                while remaining:
+                    item = results.get()
+                    if item is _DONE:
+                        remaining -= 1
+                    else:
+                        yield item
+            finally:
+                stop.set()
+                for future in futures:
+                    future.cancel()
+
+        return generate()
@@ -0,0 +1,156 @@
+import email.utils
+import logging
+import random
+import threading
+import time
+
+import requests
+
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket allowing ``rate`` requests per second on
+    average, with bursts of up to ``burst`` requests.
+
+    :param float rate: Tokens added per second
+    :param int burst: The most tokens the bucket holds. Defaults to max(1, rate)
+    :raises: ValueError if rate is not positive or burst is less than 1
+    """
+    def __init__(self, rate: float, burst: int=None):
+        if rate <= 0:
+            logger.error('rate must be positive, got %s', rate)
+            raise ValueError('rate must be positive')
+        if burst is not None and burst < 1:
+            logger.error('burst must be at least 1, got %s', burst)
+            raise ValueError('burst must be at least 1')
+        self._rate = rate
+        self._capacity = burst if burst is not None else max(1, rate)
+        self._tokens = self._capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Take a token, sleeping until one is available.
+
+        :return: None
+        """
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self._capacity, self._tokens + (now - self._updated) * self._rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self._rate
+            time.sleep(wait)
+
+
+class RetryPolicy:
+    """
+    Decides which failed requests are retried and how long to wait first.
+
+    Requests are retried on connection errors, timeouts and the given status
+    codes. POST is not idempotent, so a POST is only retried if
+    ``retry_posts`` is set. The wait doubles on each attempt, starting at
+    ``backoff`` and capped at ``max_backoff``, with full jitter, unless the
+    server sends a Retry-After header, which is obeyed instead.
+
+    :param int retries: The most times to retry one request. 0 disables retries
+    :param float backoff: The base wait in seconds
+    :param float max_backoff: The longest wait in seconds
+    :param tuple statuses: HTTP status codes that are worth retrying
+    :param bool retry_posts: Whether POST requests may be retried
+    """
+    idempotent_methods = frozenset(['GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'])
+
+    def __init__(self, retries: int=3, backoff: float=0.5, max_backoff: float=30.0,
+                 statuses: tuple=(429, 500, 502, 503, 504), retry_posts: bool=False):
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.statuses = frozenset(statuses)
+        self.retry_posts = retry_posts
+
+    def allows(self, method: str) -> bool:
+        """Whether requests with this HTTP method may be retried at all"""
+        return method.upper() in self.idempotent_methods or self.retry_posts
+
+    def delay(self, attempt: int, response: requests.Response=None) -> float:
+        """Seconds to wait before retry number attempt, counting from 1"""
+        if response is not None:
+            retry_after = _parse_retry_after(response.headers.get('Retry-After'))
+            if retry_after is not None:
+                return min(retry_after, self.max_backoff)
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** (attempt - 1)))
+
+
+def _parse_retry_after(value):
+    """Seconds to wait from a Retry-After header given as seconds or as an HTTP date"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when.timestamp() - time.time())
+
+
+class RequestScheduler:
+    """
+    Sends requests through an optional rate limit and retries failures.
+    One scheduler can be shared by several Trackobot instances so that all
+    of their requests count against the same limit.
+
+    :param float rate: The most requests per second to start. None means no limit
+    :param int burst: How many requests may start at once before the rate applies
+    :param RetryPolicy retry: How failed requests are retried. Defaults to RetryPolicy()
+    """
+    def __init__(self, rate: float=None, burst: int=None, retry: RetryPolicy=None):
+        self._bucket = TokenBucket(rate, burst) if rate is not None else None
+        self.retry = retry if retry is not None else RetryPolicy()
+
+    def send(self, method: str, send, force_retry: bool=False, on_retry=None) -> requests.Response:
+        """
+        Call send() to make a request, retrying it according to the policy.
+
+        :param str method: The HTTP method of the request
+        :param send: A function making the request and returning the response
+        :param bool force_retry: Retry even if the method is not idempotent
+        :param on_retry: A function called with the number of the retry about to be made
+        :return: The last response received
+        :rtype: requests.Response
+        :raises: requests.exceptions.RequestException if the last attempt failed to connect
+        """
+        retry = self.retry
+        allowed = force_retry or retry.allows(method)
+        attempt = 0
+        while True:
+            if self._bucket is not None:
+                self._bucket.acquire()
+            try:
+                r = send()
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                attempt += 1
+                if not allowed or attempt > retry.retries:
+                    raise
+                wait = retry.delay(attempt)
+                logger.info('%s failed with %s, retrying in %.2fs', method, e, wait)
+            else:
+                attempt += 1
+                if r.status_code not in retry.statuses or not allowed or attempt > retry.retries:
+                    return r
+                wait = retry.delay(attempt, r)
+                logger.info('%s got %d, retrying in %.2fs', method, r.status_code, wait)
+                r.close()
+            if on_retry is not None:
+                on_retry(attempt)
+            time.sleep(wait)
@@ -1,7 +1,13 @@
-import json
+import concurrent.futures
+import csv
+import datetime
+import glob
 import logging
+import os
 import pprint
+import shlex
 import sys
+import threading
 
 import click
 import trackopy
@@ -10,7 +16,18 @@ import trackopy
 class Config:
     def __init__(self):
         self.logger = None
+        self.context = None
+        self.options = None
         self.trackobot = None
+        self.pool = None
+        self.accounts = None
+        self.failed_logins = []
+        self.accounts_file = None
+        self.response_cache = None
+        self.summary = None
+        self.url = None
+        self.codec = None
+        self.lock = threading.Lock()
 
 
 pass_config = click.make_pass_decorator(Config, ensure=True)
@@ -25,14 +42,71 @@ def _logging(v, logfile):
     return logging.getLogger(__name__)
 
 
+def _url(config):
+    """The server from --url, or trackobot.com. Imports the client only when a command needs it"""
+    return config.url or trackopy.trackobot.DEFAULT_URL
+
+
 def _check_creds(config):
-    """Check if credentials were supplied. Used for commands requiring credentials, which
-    is all of them except for create"""
-    if config.trackobot is None:
+    """Log in with the global options the first time a command needs to. Used for commands requiring
+    credentials, which is all of them except for create, show and query"""
+    if config.accounts_file is not None:
+        click.secho('This command does not support --accounts', fg='red')
+        config.logger.error('--accounts given to a command that needs one account')
+        sys.exit(1)
+    with config.lock:
+        if config.trackobot is None:
+            _login(config)
+    config.logger.debug('Trackobot object properly created')
+
+
+def _setup(config):
+    """Get the response cache and scheduler for the global options, shared by every login of the run"""
+    options = config.options
+    if options['cache'] is not None and config.response_cache is None:
+        config.response_cache = trackopy.ResponseCache(path=options['cache'])
+        config.context.call_on_close(config.response_cache.save)
+    retry = trackopy.RetryPolicy(retries=options['retries'], retry_posts=options['retry_posts'])
+    return config.response_cache, trackopy.RequestScheduler(rate=options['rate'], burst=options['burst'], retry=retry)
+
+
+def _login(config):
+    """Create the Trackobot instance from the global options and log in, or load the saved session"""
+    options = config.options
+    username, password, session_file = options['username'], options['password'], options['session_file']
+    saved = session_file is not None and os.path.exists(session_file) and not (username and password)
+    if not (username and password) and not saved:
         click.secho('Please supply a username and password', fg='red')
         config.logger.error('No username or password supplied')
         sys.exit(1)
-    config.logger.debug('Trackobot object properly created')
+    # The report hook is given to the constructor so that it also times the login and the connection it opens
+    hooks = [_stats_report(config)] if options['stats_report'] else None
+    try:
+        response_cache, scheduler = _setup(config)
+        if saved:
+            config.logger.debug('Loading saved session from %s', session_file)
+            trackobot = trackopy.Trackobot.from_saved_session(session_file, cache=response_cache, scheduler=scheduler,
+                                                              hooks=hooks, url=_url(config), codec=config.codec)
+        else:
+            trackobot = trackopy.Trackobot(username, password, cache=response_cache, scheduler=scheduler,
+                                           hooks=hooks, url=_url(config), codec=config.codec)
+            trackobot.login()
+    except ValueError as e:
+        click.secho(str(e), fg='red')
+        sys.exit(1)
+    ctx = config.context
+    ctx.call_on_close(trackobot.close)
+    if session_file is not None:
+        ctx.call_on_close(lambda: trackobot.save_session(session_file))
+    config.trackobot = trackobot
+
+
+def _stats_report(config):
+    """Get the LatencySummary for --stats-report, created the first time and printed when the run finishes"""
+    if config.summary is None:
+        config.summary = trackopy.LatencySummary()
+        config.context.call_on_close(lambda: click.echo(config.summary.report(), err=True))
+    return config.summary
 
 
 @click.group()
@@ -40,62 +114,356 @@ def _check_creds(config):
 @click.option('-u', '--username', help='Your Trackobot username')
 @click.option('-p', '--password', help='Your Trackobot password')
 @click.option('-l', '--log', help='The name of your desired log file. Defaults to tb.log', default='tb.log')
-@pass_config
-def cli(config, verbose, username, password, log):
+@click.option('-c', '--cache', default=None,
+              help='A file to cache deck and stats responses in between runs')
+@click.option('-s', '--session-file', default=None,
+              help='A file to remember your login in. Once saved, later runs need no username or password')
+@click.option('--rate', type=float, default=None, help='The most requests per second to send. Unlimited by default')
+@click.option('--burst', type=click.IntRange(min=1), default=None,
+              help='How many requests may be sent at once before --rate applies')
+@click.option('--retries', type=click.IntRange(min=0), default=3,
+              help='How many times to retry a request that failed with a connection error, 429 or 5xx')
+@click.option('--retry-posts/--no-retry-posts', default=False,
+              help='Whether to also retry POST requests, such as uploads, which may then be applied twice')
+@click.option('--stats-report', is_flag=True, default=False,
+              help='Print request latency percentiles for each endpoint when the command finishes')
+@click.option('--url', envvar='TRACKOBOT_URL', default=None,
+              help='The Trackobot server to use. Defaults to https://trackobot.com. Can also be set with TRACKOBOT_URL')
+@click.option('--json-backend', type=click.Choice(trackopy.codec.BACKENDS), default=None,
+              help='The library to read and write JSON with. Defaults to the fastest installed, '
+                   'or TRACKOPY_JSON if set')
+@click.option('--accounts', default=None, type=click.Path(exists=True, dir_okay=False),
+              help='A CSV file with "username" and "password" columns. history and stats then run for '
+                   'every account at once, instead of for -u and -p')
+@click.option('--concurrency', default=8, type=click.IntRange(min=1),
+              help='With --accounts, the most accounts to run at once')
+@click.pass_context
+def cli(ctx, verbose, username, password, log, cache, session_file, rate, burst, retries, retry_posts,
+        stats_report, url, json_backend, accounts, concurrency):
+    config = ctx.ensure_object(Config)
     v = int(verbose)
     config.logger = _logging(v, log)
-    if username and password:
-        try:
-            config.trackobot = trackopy.Trackobot(username, password)
-        except ValueError as e:
-            click.secho(str(e), fg='red')
-            sys.exit(1)
+    config.context = ctx
+    config.url = url
+    try:
+        config.codec = trackopy.codec.get_codec(json_backend)
+    except (ImportError, ValueError) as e:
+        click.secho('Cannot use JSON backend {}: {}'.format(json_backend, e), fg='red')
+        sys.exit(1)
+    config.logger.debug('Using %s for JSON', config.codec.name)
+    # Nothing is logged in here. Commands that talk to trackobot.com log in when they start, with
+    # _check_creds() or _open_pool(), so commands that only read local files never wait on a login
+    config.accounts_file = accounts
+    config.options = {'username': username, 'password': password, 'session_file': session_file, 'cache': cache,
+                      'rate': rate, 'burst': burst, 'retries': retries, 'retry_posts': retry_posts,
+                      'stats_report': stats_report, 'concurrency': concurrency}
+
+
+def _open_pool(config):
+    """Create a TrackobotPool from the --accounts file and log every account in at once, the first time a
+    command needs to. Exits if no account could log in"""
+    with config.lock:
+        if config.pool is None:
+            _login_pool(config)
+    if not config.accounts:
+        sys.exit(1)
+
+
+def _login_pool(config):
+    """Create the TrackobotPool from the global options and log in every account"""
+    options = config.options
+    hooks = [_stats_report(config)] if options['stats_report'] else None
+    try:
+        response_cache, scheduler = _setup(config)
+        pool = trackopy.TrackobotPool.from_csv(config.accounts_file, concurrency=options['concurrency'],
+                                               cache=response_cache, scheduler=scheduler, hooks=hooks,
+                                               url=_url(config), codec=config.codec)
+    except ValueError as e:
+        click.secho(str(e), fg='red')
+        sys.exit(1)
+    config.context.call_on_close(pool.close)
+    config.logger.debug('Logging in %d accounts', len(pool))
+    results = pool.login()
+    config.accounts = [username for username, result in results.items() if result.ok]
+    config.failed_logins = [username for username, result in results.items() if not result.ok]
+    for username, result in results.items():
+        if not result.ok:
+            config.logger.error('Could not log in %s: %s', username, result.error)
+            click.secho('Could not log in {}: {}'.format(username, result.error), fg='red', err=True)
+    config.pool = pool
+
+
+def _account_path(path, username):
+    """The file for one account's output, e.g. history.alice.json for history.json"""
+    root, ext = os.path.splitext(path)
+    return '{}.{}{}'.format(root, username, ext)
 
 
 @cli.command()
 @pass_config
 def create(config):
     """Create a new user on trackobot.com"""
-    user = trackopy.Trackobot.create_user()
+    user = trackopy.Trackobot.create_user(_url(config))
     click.echo('Username: {}\nPassword: {}'.format(user['username'], user['password']))
 
 
+_DATE_FORMATS = ['%Y-%m-%d', '%Y-%m-%dT%H:%M:%S', '%Y-%m-%d %H:%M:%S']
+
+
+def _batches(items, size=1000):
+    """Group an iterable into lists of up to size items, so that archive reads stream like pages"""
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
 @cli.command()
-@click.option('-n', '--num-pages', default=1, help='The number of pages of history to get')
+@click.option('-n', '--num-pages', default=1, help='The number of pages of history to get. 0 gets every page')
 @click.option('-s', '--start', default=1, help='The page to start from')
-@click.option('-o', '--output', help='The file to write game history to', default='history.json')
+@click.option('-o', '--output', default=None,
+              help='The file to write game history to. Defaults to history.json, or history.csv etc. for other formats')
+@click.option('-w', '--workers', default=4, type=click.IntRange(min=1),
+              help='The number of pages to download at the same time')
 @click.option('--arena/--no-arena', default=False, help='Whether to get all history or only arena')
+@click.option('-f', '--format', 'fmt',
+              type=click.Choice(['json', 'ndjson', 'archive'] + list(trackopy.export.FORMATS)), default='json',
+              help='json writes one array of games. ndjson writes one game per line. archive appends new games '
+                   'to an indexed archive that "tb show" and --from-archive can read. csv, parquet and arrow '
+                   'write a table of games and a table of card plays. parquet and arrow need pyarrow. '
+                   'Every format is written page by page as pages arrive')
+@click.option('--cards-output', default=None,
+              help='The file to write card plays to for csv, parquet and arrow. '
+                   'Defaults to the output file with .cards before its extension')
+@click.option('--from-archive', default=None, type=click.Path(exists=True, dir_okay=False),
+              help='Read games from an archive written with -f archive instead of from trackobot.com')
+@click.option('--since', default=None, type=click.DateTime(_DATE_FORMATS),
+              help='With --from-archive, only games added at or after this UTC time')
+@click.option('--until', default=None, type=click.DateTime(_DATE_FORMATS),
+              help='With --from-archive, only games added before this UTC time')
 @pass_config
-def history(config, num_pages, start, output, arena):
+def history(config, num_pages, start, output, workers, arena, fmt, cards_output, from_archive, since, until):
     """Get your game history"""
-    _check_creds(config)
-    games = []
-    count = 0
-    while count != num_pages:
-        config.logger.debug('Getting page %d of history', start)
-        if arena:
-            history = config.trackobot.arena_history(page=start)
-        else:
-            history = config.trackobot.history(page=start)
-        config.logger.debug('Extending games list')
-        games.extend(history['history'])
-        count += 1
-        start += 1
-        if start > history['meta']['total_pages']:
-            config.logger.info('Hit max pages on account')
-            break
-    config.logger.debug('Dumping game history to %s', output)
+    if output is None:
+        output = 'history.' + fmt
+    if config.accounts_file is not None:
+        _pool_history(config, num_pages, start, workers, arena, fmt, output, cards_output, from_archive, since, until)
+        return
+    if from_archive is not None:
+        archive = trackopy.HistoryArchive(from_archive, codec=config.codec)
+        click.get_current_context().call_on_close(archive.close)
+        config.logger.debug('Reading games from %s between %s and %s', from_archive, since, until)
+        pages = _batches(archive.between(since, until))
+    elif since is not None or until is not None:
+        click.secho('--since and --until can only be used with --from-archive', fg='red')
+        sys.exit(1)
+    else:
+        _check_creds(config)
+        count = num_pages if num_pages > 0 else None
+        config.logger.debug('Getting %d page(s) of history from page %d', num_pages, start)
+        pages = config.trackobot.iter_history_pages(arena=arena, start=start, count=count, prefetch=workers)
+    try:
+        click.secho(_write_history(config, pages, fmt, output, cards_output), fg='green')
+    except ImportError as e:
+        click.secho(str(e), fg='red')
+        sys.exit(1)
+
+
+def _write_history(config, pages, fmt, output, cards_output):
+    """Write pages of games to output in format fmt and return a message saying what was written"""
+    if fmt == 'archive':
+        added = 0
+        with trackopy.HistoryArchive(output, codec=config.codec) as archive:
+            for games in pages:
+                added += archive.append(games)
+            total = len(archive)
+        return 'Added {} new games to {}, {} in total'.format(added, output, total)
+    if fmt in trackopy.export.FORMATS:
+        total, cards = trackopy.export_history(pages, output, fmt, cards_output)
+        return 'Wrote {} games to {} and {} card plays to {}'.format(
+            total, output, cards, cards_output or trackopy.export.cards_path(output))
     with open(output, 'w') as f:
-        json.dump(games, f)
-    click.secho('Wrote {} games to {}'.format(len(games), output), fg='green')
+        if fmt == 'ndjson':
+            total = config.codec.dump_lines(pages, f)
+        else:
+            total = config.codec.dump_array(pages, f)
+    return 'Wrote {} games to {}'.format(total, output)
+
+
+def _pool_history(config, num_pages, start, workers, arena, fmt, output, cards_output, from_archive, since, until):
+    """Write the history of every --accounts account to its own file, running accounts at once"""
+    if from_archive is not None or since is not None or until is not None:
+        click.secho('--from-archive, --since and --until cannot be used with --accounts', fg='red')
+        sys.exit(1)
+    _open_pool(config)
+    count = num_pages if num_pages > 0 else None
+
+    def write(trackobot):
+        pages = trackobot.iter_history_pages(arena=arena, start=start, count=count, prefetch=workers)
+        cards = _account_path(cards_output, trackobot.username) if cards_output is not None else None
+        return _write_history(config, pages, fmt, _account_path(output, trackobot.username), cards)
+
+    try:
+        results = config.pool.map(write, config.accounts)
+    except ImportError as e:
+        click.secho(str(e), fg='red')
+        sys.exit(1)
+    _report_accounts(config, results)
+    for result in results.values():
+        if result.ok:
+            click.secho('{}: {}'.format(result.item, result.result), fg='green')
+    if _accounts_failed(config, results):
+        sys.exit(1)
+
+
+def _report_accounts(config, results):
+    """Print the accounts of a fan-out call that failed"""
+    for username, result in results.items():
+        if not result.ok:
+            config.logger.error('Failed for %s: %s', username, result.error)
+            click.secho('Failed for {}: {}'.format(username, result.error), fg='red', err=True)
+
+
+def _accounts_failed(config, results) -> bool:
+    """Whether any account of a fan-out call failed, counting those that could not log in"""
+    return bool(config.failed_logins) or not all(result.ok for result in results.values())
+
+
+@cli.command()
+@click.argument('game_id', type=int)
+@click.option('-a', '--archive', default='history.archive', type=click.Path(exists=True, dir_okay=False),
+              help='The archive written by "tb history -f archive" to look in. Defaults to history.archive')
+@pass_config
+def show(config, game_id, archive):
+    """Print the game with ID <GAME_ID> from a history archive"""
+    with trackopy.HistoryArchive(archive, codec=config.codec) as games:
+        game = games.get(game_id)
+    if game is None:
+        click.secho('Game {} is not in {}'.format(game_id, archive), fg='red')
+        sys.exit(1)
+    click.echo(config.codec.dumps(game))
+
+
+@cli.command()
+@click.option('-a', '--archive', default=None, type=click.Path(exists=True, dir_okay=False),
+              help='Search an archive written by "tb history -f archive"')
+@click.option('-d', '--database', default='history.db',
+              help='Search a history database made by "tb sync", unless --archive is given. Defaults to history.db')
+@click.option('-m', '--mode', multiple=True, help='The game mode, such as ranked. May be given more than once')
+@click.option('-h', '--hero', multiple=True, help='Your class, such as shaman. May be given more than once')
+@click.option('-o', '--opponent', multiple=True, help="The opponent's class. May be given more than once")
+@click.option('--deck', type=int, multiple=True, help='The ID of your deck. May be given more than once')
+@click.option('--versus-deck', type=int, multiple=True,
+              help="The ID of the opponent's deck. May be given more than once")
+@click.option('--win/--loss', default=None, help='Only wins or only losses')
+@click.option('--coin/--no-coin', default=None, help='Only games on the coin or only games without it')
+@click.option('--days', type=click.FloatRange(min=0), default=None, help='Only games from the last this many days')
+@click.option('--since', default=None, type=click.DateTime(_DATE_FORMATS),
+              help='Only games added at or after this UTC time')
+@click.option('--until', default=None, type=click.DateTime(_DATE_FORMATS), help='Only games added before this UTC time')
+@click.option('-n', '--limit', default=20, type=click.IntRange(min=0),
+              help='The most games to print, newest first. 0 prints every match')
+@click.option('-f', '--format', 'fmt', type=click.Choice(['table', 'ndjson']), default='table',
+              help='table prints one line per game. ndjson prints the games as JSON, one per line')
+@pass_config
+def query(config, archive, database, mode, hero, opponent, deck, versus_deck, win, coin, days, since, until,
+          limit, fmt):
+    """Search downloaded games without contacting trackobot.com and print the matches and their record"""
+    if archive is not None:
+        source = trackopy.HistoryArchive(archive, codec=config.codec)
+    elif os.path.exists(database):
+        source = trackopy.HistoryStore(database, codec=config.codec)
+    else:
+        click.secho('{} does not exist. Run "tb sync" first, or pass --archive'.format(database), fg='red')
+        sys.exit(1)
+    with source:
+        local = trackopy.LocalQuery(source)
+    filters = {'mode': list(mode) or None, 'hero': list(hero) or None, 'opponent': list(opponent) or None,
+               'as_deck': list(deck) or None, 'vs_deck': list(versus_deck) or None, 'win': win, 'coin': coin,
+               'start': since, 'end': until, 'days': days}
+    try:
+        record = local.record(**filters)
+        games = local.find(limit=limit or None, **filters)
+    except ValueError as e:
+        click.secho(str(e), fg='red')
+        config.logger.error(str(e))
+        sys.exit(1)
+    for game in games:
+        if fmt == 'ndjson':
+            click.echo(config.codec.dumps(game))
+            continue
+        result = game.get('result') or ('win' if game.get('win') else 'loss')
+        click.echo('{:>10}  {}  {:<8} {:>8} vs {:<8} {:<4} {}'.format(
+            game['id'], game['added'], game.get('mode') or '', game.get('hero') or '', game.get('opponent') or '',
+            result, 'coin' if game.get('coin') else ''))
+    click.secho('{total} of {size} games match: {wins} wins, {losses} losses, {winrate}% winrate'.format(
+        size=len(local), **record), fg='green', err=fmt == 'ndjson')
+
+
+@cli.command()
+@click.option('-d', '--database', default='history.db', help='The SQLite file to keep history in')
+@pass_config
+def sync(config, database):
+    """Download new games into a local history database. Default file name is history.db"""
+    _check_creds(config)
+    with trackopy.HistoryStore(database, codec=config.codec) as store:
+        config.logger.debug('Syncing history into %s', database)
+        added = store.sync(config.trackobot)
+        total = len(store)
+    config.logger.info('Stored %d new games', added)
+    click.secho('Stored {} new games, {} in total, in {}'.format(added, total, database), fg='green')
+
+
+def _lines(file):
+    """Yield the stripped, non-empty lines of file, or of stdin when file is -"""
+    with click.open_file(file) as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield line
+
+
+def _report(config, results, describe):
+    """Print a line for each failed BulkResult and exit with an error if there were any"""
+    done = failed = 0
+    for result in results:
+        if result.ok:
+            done += 1
+            continue
+        failed += 1
+        reason = result.error if result.error is not None else 'rejected by trackobot'
+        config.logger.error('Failed on %s: %s', describe(result.item), reason)
+        click.secho('Failed on {}: {}'.format(describe(result.item), reason), fg='red')
+    click.secho('{} succeeded'.format(done), fg='green')
+    if failed:
+        click.secho('{} failed'.format(failed), fg='red')
+        sys.exit(1)
 
 
 @cli.command()
 @click.option('-i', '--id', help='The ID of the game to delete', type=int)
+@click.option('-f', '--file', default=None,
+              help='A file of game IDs to delete, one per line. Use - to read them from stdin')
+@click.option('-w', '--workers', default=4, type=click.IntRange(min=1),
+              help='The number of games to delete at the same time when deleting from a file')
 @pass_config
-def delete(config, id):
+def delete(config, id, file, workers):
     """Delete the specified game from trackobot"""
     _check_creds(config)
+    if file is not None:
+        try:
+            ids = [int(line) for line in _lines(file)]
+        except ValueError as e:
+            click.secho('Bad game ID: {}'.format(e), fg='red')
+            sys.exit(1)
+        config.logger.debug('Deleting %d games', len(ids))
+        results = config.trackobot.delete_games(ids, workers=workers)
+        _report(config, results, lambda game_id: 'game {}'.format(game_id))
+        return
     if not id:
         click.secho('You need to specify an ID!', fg='red')
         sys.exit(1)
@@ -115,7 +483,7 @@ def decks(config, output):
     config.logger.debug('Getting decks list')
     decks = config.trackobot.decks()
     with open(output, 'w') as f:
-        json.dump(decks, f)
+        config.codec.dump(decks, f)
     config.logger.info('Wrote decks to %s', output)
     click.secho('Wrote decks to {}'.format(output), fg='green')
 
@@ -167,17 +535,34 @@ def toggle(config, track):
 
 
 @cli.command()
-@click.option('-i', '--id', type=int, help='The ID of the game to modify', required=True)
-@click.option('-p', '--param', required=True,
+@click.option('-i', '--id', type=int, help='The ID of the game to modify')
+@click.option('-p', '--param',
               help='The name of the game metadata variable to change, i.e. "rank", "win", etc.',
               type=click.Choice(['added', 'mode', 'win', 'hero', 'opponent',
                                  'coin', 'duration', 'rank', 'legend', 'deck_id',
                                  'opponent_deck_id', 'note']))
-@click.option('-v', '--value', help='The new value for the given parameter', required=True)
+@click.option('-v', '--value', help='The new value for the given parameter')
+@click.option('-f', '--file', default=None,
+              help='A CSV file of id,param,value rows to apply. Use - to read them from stdin')
+@click.option('-w', '--workers', default=4, type=click.IntRange(min=1),
+              help='The number of games to modify at the same time when modifying from a file')
 @pass_config
-def modify(config, id, param, value):
+def modify(config, id, param, value, file, workers):
     """Modify the game metadata for the specified game"""
     _check_creds(config)
+    if file is not None:
+        try:
+            updates = [(int(row[0]), row[1], row[2]) for row in csv.reader(_lines(file))]
+            results = config.trackobot.modify_metadata_many(updates, workers=workers)
+        except (ValueError, IndexError) as e:
+            click.secho('Bad update: {}'.format(e), fg='red')
+            config.logger.error(str(e))
+            sys.exit(1)
+        _report(config, results, lambda update: 'game {} {}'.format(update[0], update[1]))
+        return
+    if id is None or param is None or value is None:
+        click.secho('You need to specify an ID, param and value, or a file!', fg='red')
+        sys.exit(1)
     try:
         config.logger.debug('Submitting modify request...')
         ret = config.trackobot.modify_metadata(id, param, value)
@@ -191,11 +576,35 @@ def modify(config, id, param, value):
         click.secho('Failed :(', fg='red')
 
 
+@cli.command()
+@click.argument('file')
+@click.option('-w', '--workers', default=4, type=click.IntRange(min=1),
+              help='The number of games to modify at the same time')
+@pass_config
+def patch(config, file, workers):
+    """Modify many fields of many games from the CSV <FILE>, one request per game.
+
+    The first row names the columns: "id" and any of the fields accepted by modify.
+    Empty cells are left unchanged. Use - to read the CSV from stdin."""
+    _check_creds(config)
+    try:
+        with click.open_file(file) as f:
+            patches = [(int(row.pop('id')), {k: v for k, v in row.items() if v})
+                       for row in csv.DictReader(f)]
+        patches = [p for p in patches if p[1]]
+        results = config.trackobot.patch_metadata_many(patches, workers=workers)
+    except (ValueError, KeyError, TypeError) as e:
+        click.secho('Bad patch: {}'.format(e), fg='red')
+        config.logger.error(str(e))
+        sys.exit(1)
+    _report(config, results, lambda patch: 'game {}'.format(patch[0]))
+
+
 @cli.command()
 @click.option('-t', '--type', type=click.Choice(['classes', 'decks', 'arena']), help='The type of stats',
               default='decks')
-@click.option('-r', '--range', type=click.Choice(['current_month', 'all', 'last_3_days', 'last_24_hours']),
-              help='The range of time to grab', default='current_month')
+@click.option('-r', '--range', type=click.Choice(['current_month', 'all', 'last_3_days', 'last_24_hours', 'custom']),
+              help='The range of time to grab. custom needs --since and --until', default='current_month')
 @click.option('-m', '--mode', type=click.Choice(['ranked', 'arena', 'casual', 'friendly', 'all']),
               help='The game mode to check', default='ranked')
 @click.option('-h', '--hero', type=click.Choice(['rogue', 'paladin', 'warrior', 'warlock',
@@ -208,39 +617,394 @@ def modify(config, id, param, value):
 @click.option('-v', '--versus-deck', type=int, help='The opponent deck ID to get stats for', default=None)
 @click.option('-f', '--file', help='The name of the file to write the stats to. Defaults to stats.json',
               default='stats.json')
+@click.option('--database', default=None,
+              help='Compute the stats from a history database made by "tb sync" instead of asking trackobot.com')
+@click.option('--matrix', is_flag=True, default=False,
+              help='Get the record of every class against every other, or of every deck with -t decks. For classes '
+                   'the winrates are also printed as a table. Rows are requested at the same time. --hero, '
+                   '--opponent, --deck and --versus-deck are ignored')
+@click.option('--series', is_flag=True, default=False,
+              help='Get your record for each day or week from --since to --until, and print it as a table. '
+                   'Days are requested at the same time. With -c, days and weeks that are over are only '
+                   'requested once. --range is ignored')
+@click.option('--bucket', type=click.Choice(['day', 'week']), default='day',
+              help='With --series, the length of each step')
+@click.option('--since', default=None, type=click.DateTime(_DATE_FORMATS),
+              help='The first day for -r custom or --series. --series defaults to 29 days before --until')
+@click.option('--until', default=None, type=click.DateTime(_DATE_FORMATS),
+              help='The last day for -r custom or --series. --series defaults to today')
+@click.option('-w', '--workers', default=9, type=click.IntRange(min=1),
+              help='With --matrix or --series, the number of requests to send at the same time')
 @pass_config
-def stats(config, type, range, mode, hero, opponent, deck, versus_deck, file):
-    """Retrieve player stats. Note that a custom date range is not supported in this application"""
-    _check_creds(config)
+def stats(config, type, range, mode, hero, opponent, deck, versus_deck, file, database, matrix, series, bucket,
+          since, until, workers):
+    """Retrieve player stats"""
+    if series:
+        _stats_series(config, type, mode, hero, opponent, deck, versus_deck, file, database, bucket, since, until,
+                      workers)
+        return
+    if range == 'custom' and (since is None or until is None):
+        click.secho('-r custom needs --since and --until', fg='red')
+        sys.exit(1)
+    if matrix:
+        _stats_matrix(config, type, range, mode, since, until, file, database, workers)
+        return
+    if config.accounts_file is not None:
+        if database is not None:
+            click.secho('--database cannot be used with --accounts', fg='red')
+            sys.exit(1)
+        _open_pool(config)
+        try:
+            results = config.pool.map_stats(stats_type=type, time_range=range, mode=mode, start=since, end=until,
+                                            as_hero=hero, vs_hero=opponent, as_deck=deck, vs_deck=versus_deck,
+                                            accounts=config.accounts)
+        except ValueError as e:
+            click.secho(str(e), fg='red')
+            config.logger.error(str(e))
+            sys.exit(1)
+        _report_accounts(config, results)
+        with open(file, 'w') as f:
+            config.codec.dump({username: result.result for username, result in results.items() if result.ok}, f)
+        click.secho('Wrote stats of {} accounts to {}'.format(sum(r.ok for r in results.values()), file),
+                    fg='green')
+        if _accounts_failed(config, results):
+            sys.exit(1)
+        return
+    if database is not None:
+        with trackopy.HistoryStore(database, codec=config.codec) as store:
+            source = trackopy.LocalStats(store)
+    else:
+        _check_creds(config)
+        source = config.trackobot
     try:
         config.logger.debug('Getting player stats')
-        stats = config.trackobot.stats(stats_type=type, time_range=range, mode=mode, as_hero=hero,
-                                       vs_hero=opponent, as_deck=deck, vs_deck=versus_deck)
+        stats = source.stats(stats_type=type, time_range=range, mode=mode, start=since, end=until, as_hero=hero,
+                             vs_hero=opponent, as_deck=deck, vs_deck=versus_deck)
     except ValueError as e:
         click.secho(str(e), fg='red')
         config.logger.error(str(e))
         sys.exit(1)
     with open(file, 'w') as f:
-        json.dump(stats, f)
+        config.codec.dump(stats, f)
     click.secho('Wrote stats to {}'.format(file), fg='green')
 
 
+def _stats_matrix(config, stats_type, time_range, mode, since, until, file, database, workers):
+    """Write a matchup matrix, or one per account with --accounts, and print the winrates"""
+    if database is not None:
+        click.secho('--database cannot be used with --matrix', fg='red')
+        sys.exit(1)
+
+    def get(trackobot):
+        return trackobot.stats_matrix(stats_type=stats_type, time_range=time_range, mode=mode, start=since, end=until,
+                                      workers=workers)
+
+    try:
+        if config.accounts_file is not None:
+            _open_pool(config)
+            results = config.pool.map(get, config.accounts)
+        else:
+            _check_creds(config)
+            config.logger.debug('Getting the %s matrix', stats_type)
+            matrices = {None: get(config.trackobot)}
+    except ValueError as e:
+        click.secho(str(e), fg='red')
+        config.logger.error(str(e))
+        sys.exit(1)
+    if config.accounts_file is not None:
+        _report_accounts(config, results)
+        matrices = {username: result.result for username, result in results.items() if result.ok}
+    for username, result in matrices.items():
+        if stats_type != 'classes':
+            break
+        if username is not None:
+            click.echo(username)
+        click.echo(_matrix_table(result['matrix']))
+    with open(file, 'w') as f:
+        config.codec.dump(matrices[None] if config.accounts_file is None else matrices, f)
+    click.secho('Wrote the {} matrix to {}'.format(stats_type, file), fg='green')
+    if config.accounts_file is not None and _accounts_failed(config, results):
+        sys.exit(1)
+
+
+def _stats_series(config, stats_type, mode, hero, opponent, deck, versus_deck, file, database, bucket, since, until,
+                  workers):
+    """Write the record for each bucket from since to until, or one series per account with --accounts"""
+    if database is not None:
+        click.secho('--database cannot be used with --series', fg='red')
+        sys.exit(1)
+    until = until.date() if until is not None else datetime.datetime.now(datetime.timezone.utc).date()
+    since = since.date() if since is not None else until - datetime.timedelta(days=29)
+
+    def get(trackobot):
+        return trackobot.stats_timeseries(since, until, bucket=bucket, stats_type=stats_type, mode=mode,
+                                          as_hero=hero, vs_hero=opponent, as_deck=deck, vs_deck=versus_deck,
+                                          workers=workers)
+
+    try:
+        if config.accounts_file is not None:
+            _open_pool(config)
+            results = config.pool.map(get, config.accounts)
+        else:
+            _check_creds(config)
+            config.logger.debug('Getting stats by %s from %s to %s', bucket, since, until)
+            series = {None: get(config.trackobot)}
+    except ValueError as e:
+        click.secho(str(e), fg='red')
+        config.logger.error(str(e))
+        sys.exit(1)
+    if config.accounts_file is not None:
+        _report_accounts(config, results)
+        series = {username: result.result for username, result in results.items() if result.ok}
+    for username, records in series.items():
+        if username is not None:
+            click.echo(username)
+        click.echo('{:<10}  {:<10} {:>6} {:>6} {:>6} {:>8}'.format('start', 'end', 'wins', 'losses', 'total',
+                                                                  'winrate'))
+        for record in records:
+            click.echo('{start:<10}  {end:<10} {wins:>6} {losses:>6} {total:>6} {winrate:>8.1f}'.format(**record))
+    with open(file, 'w') as f:
+        config.codec.dump(series[None] if config.accounts_file is None else series, f)
+    click.secho('Wrote stats by {} to {}'.format(bucket, file), fg='green')
+    if config.accounts_file is not None and _accounts_failed(config, results):
+        sys.exit(1)
+
+
+def _matrix_table(matrix):
+    """Format a stats matrix as a table of winrates, rows playing as and columns playing against"""
+    columns = sorted({name for row in matrix.values() for name in row})
+    width = max([len(name) for name in list(matrix) + columns] + [5])
+    lines = [' ' * width + ''.join(' {:>{}}'.format(name, width) for name in columns)]
+    for name, row in matrix.items():
+        cells = ['{:.1f}'.format(row[column]['winrate']) if row.get(column, {}).get('total') else '-'
+                 for column in columns]
+        lines.append('{:<{}}'.format(name, width) + ''.join(' {:>{}}'.format(cell, width) for cell in cells))
+    return '\n'.join(lines)
+
+
+def _game_paths(source):
+    """The JSON files to read for a directory or glob of them, or None when source is NDJSON.
+    Exits with an error if source does not exist or matches no files"""
+    if source == '-' or source.endswith(('.ndjson', '.jsonl')):
+        if source != '-' and not os.path.isfile(source):
+            click.secho('{} does not exist'.format(source), fg='red')
+            sys.exit(1)
+        return None
+    if os.path.isdir(source):
+        paths = sorted(glob.glob(os.path.join(source, '*.json')))
+    elif any(char in source for char in '*?['):
+        paths = sorted(glob.glob(source))
+    else:
+        click.secho('{} does not exist'.format(source), fg='red')
+        sys.exit(1)
+    if not paths:
+        click.secho('No JSON files match {}'.format(source), fg='red')
+        sys.exit(1)
+    return paths
+
+
+def _read_games(source, paths, codec):
+    """Yield (label, game, error) for each game in the JSON files paths, or when paths is None, each line of
+    the NDJSON file source, or of stdin when source is -. A game that cannot be read has error set instead"""
+    if paths is None:
+        f = sys.stdin if source == '-' else open(source)
+        try:
+            for number, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    yield 'line {}'.format(number), codec.loads(line), None
+                except ValueError as e:
+                    yield 'line {}'.format(number), None, e
+        finally:
+            if f is not sys.stdin:
+                f.close()
+        return
+    for path in paths:
+        try:
+            with open(path) as f:
+                game = codec.load(f)
+        except (OSError, ValueError) as e:
+            yield path, None, e
+            continue
+        yield path, game, None
+
+
 @cli.command()
 @click.argument('file')
 @click.option('-o', '--output', default='game.json', help='The file to write the resulting game JSON to')
+@click.option('-w', '--workers', default=4, type=click.IntRange(min=1),
+              help='The number of games to upload at the same time when uploading many')
 @pass_config
-def upload(config, file, output):
-    """Upload a new game for the player using information specified in <FILE>"""
-    _check_creds(config)
-    with open(file) as f:
-        game = json.load(f)
+def upload(config, file, output, workers):
+    """Upload a new game for the player using information specified in <FILE>.
+
+    <FILE> may also be a directory or glob of JSON files, an .ndjson file, or - to read NDJSON
+    from stdin. The created games are then written to <OUTPUT> one per line as they finish."""
+    if os.path.isfile(file) and file.endswith('.json'):
+        try:
+            with open(file) as f:
+                game = config.codec.load(f)
+        except ValueError as e:
+            click.secho('Cannot read {}: {}'.format(file, e), fg='red')
+            sys.exit(1)
         config.logger.debug('Loaded the game data')
-    config.logger.debug('Uploading...')
-    data = config.trackobot.upload_game(game)
+        _check_creds(config)
+        config.logger.debug('Uploading...')
+        data = config.trackobot.upload_game(game)
+        with open(output, 'w') as f:
+            config.codec.dump(data, f)
+            config.logger.debug('Wrote the game')
+        click.secho('Done!', fg='green')
+        return
+    paths = _game_paths(file)
+    _check_creds(config)
+    labels = {}
+    failed = []
+
+    def fail(label, error):
+        config.logger.error('Failed to upload %s: %s', label, error)
+        click.secho('Failed to upload {}: {}'.format(label, error), fg='red')
+        failed.append(label)
+
+    def games():
+        for label, game, error in _read_games(file, paths, config.codec):
+            if error is not None:
+                fail(label, error)
+                continue
+            labels[id(game)] = label
+            yield game
+
+    uploaded = 0
     with open(output, 'w') as f:
-        json.dump(data, f)
-        config.logger.debug('Wrote the game')
-    click.secho('Done!', fg='green')
+        for result in config.trackobot.upload_games(games(), workers=workers):
+            label = labels.pop(id(result.item))
+            if result.ok:
+                f.write(config.codec.dumps(result.result) + '\n')
+                uploaded += 1
+            else:
+                fail(label, result.error)
+    click.secho('Uploaded {} games to {}'.format(uploaded, output), fg='green')
+    if failed:
+        click.secho('{} games failed'.format(len(failed)), fg='red')
+        sys.exit(1)
+
+
+def _run_line(ctx, line):
+    """Run one line of tb command arguments as a command of the group context ctx.
+    Return True if the command succeeded"""
+    config = ctx.find_object(Config)
+    try:
+        args = shlex.split(line, comments=True)
+    except ValueError as e:
+        click.secho('Cannot read {!r}: {}'.format(line, e), fg='red', err=True)
+        return False
+    if not args:
+        return True
+    if args[0] in ('batch', 'shell'):
+        click.secho('{} cannot be run from a batch or the shell'.format(args[0]), fg='red', err=True)
+        return False
+    config.logger.debug('Running %s', args)
+    try:
+        name, command, rest = ctx.command.resolve_command(ctx, args)
+        with command.make_context(name, rest, parent=ctx) as sub_ctx:
+            command.invoke(sub_ctx)
+    except click.exceptions.Exit as e:
+        return e.exit_code == 0
+    except click.ClickException as e:
+        e.show()
+        return False
+    except click.Abort:
+        click.secho('Aborted', fg='red', err=True)
+        return False
+    except SystemExit as e:
+        return not e.code
+    except Exception as e:
+        config.logger.exception('%s failed', args[0])
+        click.secho('{} failed: {}'.format(args[0], e), fg='red', err=True)
+        return False
+    return True
+
+
+@cli.command()
+@click.argument('script')
+@click.option('-j', '--jobs', default=1, type=click.IntRange(min=1),
+              help='The number of lines to run at the same time. A line reading "wait" waits for the '
+                   'lines before it to finish')
+@click.option('-k', '--keep-going', is_flag=True, default=False,
+              help='Run the remaining lines after a line fails, instead of stopping')
+@click.option('-x', '--echo', is_flag=True, default=False, help='Print each line before running it')
+@click.pass_context
+def batch(ctx, script, jobs, keep_going, echo):
+    """Run the tb commands in <SCRIPT>, one per line, in this process with one login.
+
+    Lines hold a command and its options as they would follow "tb" and the global options, such as
+    "stats -t classes -f classes.json". Blank lines and # comments are skipped. Use - to read the script
+    from stdin. Exits with status 1 if any line failed."""
+    group = ctx.parent
+    failed = []
+    running = {}
+
+    def finish(wait):
+        done, _ = concurrent.futures.wait(running, return_when=wait)
+        for future in done:
+            if not future.result():
+                failed.append(running[future])
+            del running[future]
+
+    with click.open_file(script) as f, concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as pool:
+        for number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            if line == 'wait':
+                finish(concurrent.futures.ALL_COMPLETED)
+            elif len(running) >= jobs:
+                finish(concurrent.futures.FIRST_COMPLETED)
+            if failed and not keep_going:
+                break
+            if line == 'wait':
+                continue
+            if echo:
+                click.secho('+ {}'.format(line), err=True, bold=True)
+            running[pool.submit(_run_line, group, line)] = number
+        finish(concurrent.futures.ALL_COMPLETED)
+    if failed:
+        click.secho('Line(s) {} of {} failed'.format(', '.join(str(n) for n in sorted(failed)), script),
+                    fg='red', err=True)
+        sys.exit(1)
+
+
+@cli.command()
+@click.pass_context
+def shell(ctx):
+    """Read tb commands interactively and run them in this process with one login.
+
+    Type a command and its options as they would follow "tb", such as "stats -t classes".
+    Type "help" to list the commands, and "exit" or press Ctrl-D to leave."""
+    try:
+        import readline  # Gives input() line editing and history
+    except ImportError:
+        pass
+    group = ctx.parent
+    while True:
+        try:
+            line = input('tb> ').strip()
+        except EOFError:
+            click.echo()
+            return
+        except KeyboardInterrupt:
+            click.echo()
+            continue
+        if line in ('exit', 'quit'):
+            return
+        if line == 'help':
+            click.echo(group.get_help())
+            continue
+        try:
+            _run_line(group, line)
+        except KeyboardInterrupt:
+            click.secho('Interrupted', fg='red', err=True)
 
 
 if __name__ == '__main__':
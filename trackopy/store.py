@@ -0,0 +1,153 @@
+import logging
+import sqlite3
+
+from .codec import JSONCodec, get_codec
+
+
+logger = logging.getLogger(__name__)
+
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS games (
+    id INTEGER PRIMARY KEY,
+    added TEXT,
+    mode TEXT,
+    hero TEXT,
+    opponent TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS games_added ON games (added);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+'''
+
+
+class HistoryStore:
+    """
+    Local SQLite copy of a user's game history, keyed by game ID.
+
+    Games are stored as the JSON returned by ``Trackobot.history()``,
+    alongside a few columns that are useful for ordering and filtering.
+    Use ``sync()`` to bring the store up to date with trackobot.com.
+
+    :param str path: The database file. Use ":memory:" for a throwaway store
+    :param codec: A trackopy.codec.JSONCodec, or the name of a JSON backend. Defaults to the fastest one installed
+    """
+    def __init__(self, path: str, codec=None):
+        logger.info('Opening history store %s', path)
+        self._codec = codec if isinstance(codec, JSONCodec) else get_codec(codec)
+        self._db = sqlite3.connect(path)
+        self._db.executescript(_SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return self._db.execute('SELECT COUNT(*) FROM games').fetchone()[0]
+
+    def __contains__(self, game_id):
+        row = self._db.execute('SELECT 1 FROM games WHERE id = ?', (game_id,)).fetchone()
+        return row is not None
+
+    def __iter__(self):
+        return self.games()
+
+    def close(self):
+        """
+        Close the database.
+
+        :return: None
+        """
+        self._db.close()
+
+    def get(self, game_id: int) -> dict:
+        """
+        Get a stored game by ID.
+
+        :param int game_id: The ID of the game
+        :return: The game dictionary, or None if it is not stored
+        :rtype: dict
+        """
+        row = self._db.execute('SELECT data FROM games WHERE id = ?', (game_id,)).fetchone()
+        return self._codec.loads(row[0]) if row is not None else None
+
+    def games(self):
+        """
+        Iterate over every stored game, newest first.
+
+        :return: Generator of game dictionaries
+        """
+        loads = self._codec.loads
+        cursor = self._db.execute('SELECT data FROM games ORDER BY id DESC')
+        for row in cursor:
+            yield loads(row[0])
+
+    def missing(self, game_ids) -> set:
+        """
+        Find which of the given game IDs are not stored.
+
+        :param game_ids: An iterable of game IDs
+        :return: The IDs that are not in the store
+        :rtype: set
+        """
+        ids = set(game_ids)
+        if not ids:
+            return ids
+        query = 'SELECT id FROM games WHERE id IN ({})'.format(', '.join('?' * len(ids)))
+        stored = {row[0] for row in self._db.execute(query, list(ids))}
+        return ids - stored
+
+    def upsert(self, games) -> int:
+        """
+        Insert games, replacing any stored games with the same ID.
+
+        :param games: An iterable of game dictionaries
+        :return: The number of games written
+        :rtype: int
+        """
+        dumps = self._codec.dumps
+        rows = [(g['id'], g.get('added'), g.get('mode'), g.get('hero'), g.get('opponent'), dumps(g))
+                for g in games]
+        with self._db:
+            self._db.executemany('INSERT OR REPLACE INTO games (id, added, mode, hero, opponent, data) '
+                                 'VALUES (?, ?, ?, ?, ?, ?)', rows)
+        logger.debug('Upserted %d games', len(rows))
+        return len(rows)
+
+    def _get_meta(self, key):
+        row = self._db.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return row[0] if row is not None else None
+
+    def _set_meta(self, key, value):
+        with self._db:
+            self._db.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', (key, value))
+
+    def sync(self, trackobot) -> int:
+        """
+        Download games that are not yet stored.
+        History is walked from the newest page to the oldest, stopping at
+        the first page that contains a game that is already stored. Until
+        one sync has reached the oldest page, later syncs keep walking past
+        stored games so an interrupted first sync is completed.
+
+        :param trackopy.Trackobot trackobot: The client to download history with
+        :return: The number of new games stored
+        :rtype: int
+        :raises: requests.exceptions.HTTPError on error
+        """
+        logger.info('Called sync()')
+        complete = self._get_meta('complete') == '1'
+        added = 0
+        for games in trackobot.iter_history_pages():
+            new_ids = self.missing(g['id'] for g in games)
+            added += self.upsert(g for g in games if g['id'] in new_ids)
+            if complete and len(new_ids) < len(games):
+                logger.debug('Reached games that are already stored')
+                return added
+        self._set_meta('complete', '1')
+        return added
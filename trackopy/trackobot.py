@@ -1,43 +1,499 @@
+import collections
+import concurrent.futures
+import copy
 import datetime
+import json
 import logging
+import os
+import tempfile
+import threading
+import time
 
 import requests
 
+from .cache import CacheEntry
+from .codec import JSONCodec, get_codec
+from .models import Game
+from .metrics import RequestEvent, TimedHTTPAdapter, _read_connect_time, _reset_connect_time
+from .scheduler import RequestScheduler
+
 
 logger = logging.getLogger(__name__)
 
+DEFAULT_URL = 'https://trackobot.com'
+
+# Endpoints whose responses change when a game is added, modified or deleted
+_GAME_ENDPOINTS = ('/profile.json', '/profile/arena.json', '/profile/stats/')
+
+# How long stats of a time series bucket that has ended are cached. They only change if old games are edited
+_CLOSED_BUCKET_TTL = 30 * 24 * 60 * 60
+
+# The classes as named in stats requests
+HEROES = ('druid', 'hunter', 'mage', 'paladin', 'priest', 'rogue', 'shaman', 'warlock', 'warrior')
+
+
+class BulkResult(collections.namedtuple('BulkResult', ['item', 'result', 'error'])):
+    """
+    The outcome of one item of a bulk operation.
+    ``item`` is the input, ``result`` is what the single-item method
+    returned, and ``error`` is the exception it raised, if any. ``ok`` is
+    False if there was an error or the method returned False.
+    """
+    __slots__ = ()
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None and self.result is not False
+
+
+def _bulk(func, items, workers):
+    """
+    Apply func to each item over a pool of workers, yielding a BulkResult per
+    item in input order. Items are read lazily and at most twice as many as
+    there are workers are held at once. Request failures are captured in the
+    result instead of being raised.
+    """
+    if workers < 1:
+        logger.error('workers must be at least 1, got %d', workers)
+        raise ValueError('workers must be at least 1')
+
+    def call(item):
+        try:
+            return BulkResult(item, func(item), None)
+        except (requests.exceptions.RequestException, ValueError) as e:
+            logger.info('Bulk operation failed on %r: %s', item, e)
+            return BulkResult(item, None, e)
+
+    def results():
+        pool = concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+        pending = collections.deque()
+        try:
+            for item in items:
+                pending.append(pool.submit(call, item))
+                if len(pending) >= 2 * workers:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            for future in pending:
+                future.cancel()
+            pool.shutdown(wait=False)
+
+    return results()
+
+
+def _new_session(pool_size: int) -> requests.Session:
+    """Create a keep-alive session whose connection pool holds up to pool_size connections"""
+    session = requests.Session()
+    adapter = TimedHTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def _check_metadata_param(param):
+    """Raise ValueError if param is not a game metadata field that can be modified"""
+    allowed_params = ['added', 'mode', 'win', 'hero', 'opponent',
+                      'coin', 'duration', 'rank', 'legend', 'deck_id',
+                      'opponent_deck_id', 'note']
+    if param not in allowed_params:
+        logger.error('Parameter %s is not an approved value', param)
+        raise ValueError('param must be one of ' + ', '.join(allowed_params))
+
+
+def _check_patch(game_id, changes):
+    """Raise ValueError unless changes is a non-empty mapping of modifiable metadata fields"""
+    if not changes:
+        logger.error('No changes given for game %s', game_id)
+        raise ValueError('changes must contain at least one parameter')
+    for param in changes:
+        _check_metadata_param(param)
+
+
+def _stats_request(stats_type, time_range, mode, start, end, as_hero, vs_hero, as_deck, vs_deck):
+    """Validate the arguments to stats() and return the endpoint and query parameters to request"""
+    allowed_endpoints = ['classes', 'decks', 'arena']
+    allowed_range = ['current_month', 'all', 'last_3_days', 'last_24_hours', 'custom']
+    allowed_modes = ['ranked', 'arena', 'casual', 'friendly', 'all']
+    if stats_type not in allowed_endpoints:
+        logger.error('%s is not an allowed stats_type', stats_type)
+        raise ValueError('stats_type must be one of ' + ', '.join(allowed_endpoints))
+    if time_range not in allowed_range:
+        logger.error('%s is not an allowed time_range', time_range)
+        raise ValueError('time_range must be one of ' + ', '.join(allowed_range))
+    if mode not in allowed_modes:
+        logger.error('%s is not an allowed mode', mode)
+        raise ValueError('mode must be one of ' + ', '.join(allowed_modes))
+    if time_range == 'custom' and \
+        (start is None or end is None or type(start) != datetime.datetime or type(end) != datetime.datetime):
+        logger.error('start and end must be of type datetime.datetime when using custom time_range')
+        raise TypeError('If using "custom" mode then you must specify a datetime.datetime for start and end')
+    endpoint = '/profile/stats/{}.json'.format(stats_type)
+    params = {'mode': mode, 'time_range': time_range}
+    if 'custom' == time_range:
+        params.update({'start': start.strftime('%Y-%m-%d'), 'end': end.strftime('%Y-%m-%d')})
+    if stats_type == 'decks':
+        params.update({'as_deck': as_deck, 'vs_deck': vs_deck})
+    elif stats_type == 'classes':
+        params.update({'as_hero': as_hero, 'vs_hero': vs_hero})
+    return endpoint, params
+
+
+def _deck_names(decks):
+    """Map each deck ID in a decks() response to its name. Decks are listed by class, or in one list"""
+    listed = decks.get('decks', decks)
+    if isinstance(listed, dict):
+        listed = [deck for by_class in listed.values() for deck in by_class]
+    return {deck['id']: deck['name'] for deck in listed if isinstance(deck, dict) and 'id' in deck}
+
+
+def _buckets(start, end, bucket):
+    """The first and last day of each bucket from the one holding start to the one holding end"""
+    if bucket not in ('day', 'week'):
+        logger.error('%s is not a bucket', bucket)
+        raise ValueError('bucket must be one of day, week')
+    first = start - datetime.timedelta(days=start.weekday()) if bucket == 'week' else start
+    length = datetime.timedelta(days=7 if bucket == 'week' else 1)
+    buckets = []
+    while first <= end:
+        buckets.append((first, first + length - datetime.timedelta(days=1)))
+        first += length
+    return buckets
+
+
+def _reset_modes(modes):
+    """Validate the modes given to reset(), defaulting to every mode"""
+    allowed = ['ranked', 'casual', 'practice', 'arena', 'friendly']
+    if modes is None:
+        modes = allowed
+    if any(mode not in allowed for mode in modes):
+        logger.error('Invalid mode(s) given')
+        raise ValueError('modes list can only contain ' + ', '.join(allowed))
+    return modes
+
 
 class Trackobot:
-    def __init__(self, username, password):
+    """
+    Client for the Trackobot API.
+
+    All requests made by an instance go through a single pooled
+    ``requests.Session`` so connections to trackobot.com are kept alive
+    and reused between calls. The session's connection pool is sized by
+    ``pool_size``; set it to at least the number of threads that will
+    share the instance. An instance may be shared between threads. Call
+    ``close()`` when done, or use the instance as a context manager.
+
+    :param str username: Your Trackobot username
+    :param str password: Your Trackobot password
+    :param int pool_size: The maximum number of pooled connections to keep open
+    :param float timeout: Seconds to wait on the server before giving up. None waits forever
+    :param requests.Session session: An existing session to use instead of creating one
+    :param trackopy.cache.ResponseCache cache: A cache for responses to history, stats and decks requests
+    :param trackopy.scheduler.RequestScheduler scheduler: Rate limit and retry policy for every request.
+        Defaults to retrying failed requests other than POST with no rate limit
+    :param list hooks: Functions called with a trackopy.metrics.RequestEvent after every request
+    :param str url: The Trackobot server to talk to, such as a local stand-in for testing
+    :param codec: A trackopy.codec.JSONCodec, or the name of a JSON backend, to encode and decode
+        request and response bodies with. Defaults to the fastest one installed
+    """
+    def __init__(self, username, password, pool_size: int=10, timeout: float=None,
+                 session: requests.Session=None, cache=None, scheduler: RequestScheduler=None,
+                 hooks: list=None, url: str=DEFAULT_URL, codec=None):
         logger.info('Creating Trackobot instance')
-        self._url = 'https://trackobot.com'
+        self._url = url.rstrip('/')
+        self._codec = codec if isinstance(codec, JSONCodec) else get_codec(codec)
+        self._timeout = timeout
+        self._cache = cache
+        self._scheduler = scheduler if scheduler is not None else RequestScheduler()
+        self._hooks = list(hooks or [])
+        self._owns_session = session is None
+        self._session = session if session is not None else _new_session(pool_size)
+        # Connect times are only recorded by sessions mounted on a TimedHTTPAdapter, such as our own
+        self._timed = isinstance(self._session.get_adapter(self._url), TimedHTTPAdapter)
+        self._auth = requests.auth.HTTPBasicAuth(username, password)
+        self._username = username
+        self._password = password
+        self._logged_in = False
+        self._login_lock = threading.Lock()
+        # GET requests being sent, by cache key, as [future of the decoded response, number of other waiters]
+        self._inflight = {}
+        self._inflight_lock = threading.Lock()
+
+    @property
+    def username(self) -> str:
+        """The username of the account this instance uses"""
+        return self._username
+
+    @classmethod
+    def from_saved_session(cls, path: str, **kwargs) -> 'Trackobot':
+        """
+        Create an instance from a file written by save_session().
+        The saved cookies are reused, so no login request is made unless
+        the server has expired them.
+
+        :param str path: The file to read
+        :param kwargs: Any other arguments to pass to the constructor
+        :return: A Trackobot instance
+        :rtype: Trackobot
+        :raises: OSError if the file cannot be read
+        :raises: ValueError if the file is not a saved session
+        """
+        logger.info('Called from_saved_session()')
+        with open(path) as f:
+            try:
+                saved = json.load(f)
+                username, password, cookies = saved['username'], saved['password'], saved['cookies']
+            except (ValueError, KeyError, TypeError):
+                logger.error('%s is not a saved session', path)
+                raise ValueError('{} is not a saved session'.format(path))
+        trackobot = cls(username, password, **kwargs)
+        for cookie in cookies:
+            trackobot._session.cookies.set(**cookie)
+        trackobot._logged_in = True
+        return trackobot
+
+    def save_session(self, path: str):
+        """
+        Save the credentials and session cookies of this instance so that
+        from_saved_session() can skip logging in.
+        The file contains your password, so it is only made readable by you,
+        even if it already exists with wider permissions.
+
+        :param str path: The file to write
+        :return: None
+        """
+        logger.info('Called save_session()')
+        cookies = [{'name': c.name, 'value': c.value, 'domain': c.domain, 'path': c.path,
+                    'expires': c.expires, 'secure': c.secure}
+                   for c in self._session.cookies]
+        saved = {'username': self._username, 'password': self._password, 'cookies': cookies}
+        # mkstemp() creates the file readable only by you, and replacing the old file drops its permissions
+        fd, tmp = tempfile.mkstemp(prefix=os.path.basename(path) + '.', suffix='.tmp',
+                                   dir=os.path.dirname(os.path.abspath(path)))
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(saved, f)
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+    def login(self):
+        """
+        Log in to Trackobot with the instance's credentials.
+        This happens automatically before the first request and whenever
+        the server reports that the session has expired, so it rarely needs
+        to be called directly. Calling it checks the credentials up front.
+
+        :return: None
+        :raises: requests.exceptions.HTTPError on error
+        :raises: ValueError if the credentials are rejected
+        """
+        logger.info('Called login()')
+        with self._login_lock:
+            self._login()
+
+    def _login(self):
         endpoint = '/sessions'
         logger.debug('POST on %s', endpoint)
-        r = requests.post(self._url+endpoint, data={'username': username, 'password': password})
+        data = {'username': self._username, 'password': self._password}
+        r, event = self._send('POST', endpoint, force_retry=True, data=data)
+        self._emit(event)
         r.raise_for_status()
         if 'Invalid credentials' in r.text:
             logger.error('Invalid credentials supplied')
             raise ValueError('Incorrect username or password. API token is not supported.')
-        self._username = username
-        self._password = password
-        self._auth = requests.auth.HTTPBasicAuth(username, password)
+        self._logged_in = True
+
+    def add_hook(self, hook):
+        """
+        Call hook with a trackopy.metrics.RequestEvent after every request.
+        Hooks run on the thread that made the request, so they must be thread-safe
+        if the instance is shared between threads.
+
+        :param hook: A function taking one RequestEvent
+        :return: None
+        """
+        self._hooks.append(hook)
+
+    def _emit(self, event):
+        for hook in self._hooks:
+            try:
+                hook(event)
+            except Exception:
+                logger.exception('Request hook %r failed', hook)
+
+    def _send(self, method, endpoint, force_retry=False, **kwargs):
+        """
+        Send one request through the scheduler and return the response along
+        with a RequestEvent describing it, which the caller passes to _emit()
+        once it is done with the response. If no response is received the
+        event is emitted here before the exception is raised.
+        """
+        url = self._url + endpoint
+        event = RequestEvent(method, endpoint)
+
+        def send():
+            _reset_connect_time()
+            start = time.perf_counter()
+            r = self._session.request(method, url, timeout=self._timeout, **kwargs)
+            event.total = time.perf_counter() - start
+            event.ttfb = r.elapsed.total_seconds()
+            event.connect = _read_connect_time() if self._timed else None
+            return r
+
+        def on_retry(attempt):
+            event.retries = attempt
+
+        try:
+            r = self._scheduler.send(method, send, force_retry=force_retry, on_retry=on_retry)
+        except requests.exceptions.RequestException as e:
+            event.error = e
+            self._emit(event)
+            raise
+        event.status = r.status_code
+        event.size = len(r.content)
+        return r, event
+
+    def _send_as_user(self, method, endpoint, **kwargs):
+        """Like _send, but authenticated, logging in first if needed and again once if the server answers 401"""
+        if not self._logged_in:
+            with self._login_lock:
+                if not self._logged_in:
+                    self._login()
+        logger.debug('%s on %s', method, endpoint)
+        r, event = self._send(method, endpoint, auth=self._auth, **kwargs)
+        if r.status_code == 401:
+            self._emit(event)
+            logger.info('Not logged in, logging in and retrying %s on %s', method, endpoint)
+            self.login()
+            r, event = self._send(method, endpoint, auth=self._auth, **kwargs)
+        return r, event
+
+    def _request(self, method, endpoint, **kwargs):
+        """Send a request as the user and return the response"""
+        r, event = self._send_as_user(method, endpoint, **kwargs)
+        self._emit(event)
+        return r
+
+    def _request_json(self, method, endpoint, **kwargs):
+        """Send a request as the user, raise if it failed, and return the decoded JSON response"""
+        r, event = self._send_as_user(method, endpoint, **kwargs)
+        try:
+            r.raise_for_status()
+            return self._decode(r, event)
+        finally:
+            self._emit(event)
+
+    def _decode(self, r, event):
+        start = time.perf_counter()
+        data = self._codec.loads(r.content)
+        event.decode = time.perf_counter() - start
+        return data
+
+    def _json_body(self, obj):
+        """Request arguments sending obj as a JSON body encoded by the instance's codec"""
+        return {'data': self._codec.dumps(obj).encode(), 'headers': {'Content-Type': 'application/json'}}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        """
+        Close the pooled connections held by this instance.
+        A session passed in by the caller is left open.
+
+        :return: None
+        """
+        if self._owns_session:
+            logger.debug('Closing HTTP session')
+            self._session.close()
+
+    def _get_json(self, endpoint, params=None, ttl=None):
+        """
+        GET endpoint and decode the JSON response. If the same request is
+        already being sent by another thread, wait for its response instead
+        of sending it again. Every caller gets its own copy of the response.
+        ttl overrides how long the response cache keeps the response.
+        """
+        params = {k: v for k, v in (params or {}).items() if v is not None}
+        key = '{} {}?{}'.format(self._username, endpoint, '&'.join(
+            '{}={}'.format(k, params[k]) for k in sorted(params)))
+        with self._inflight_lock:
+            call = self._inflight.get(key)
+            if call is not None:
+                call[1] += 1
+            else:
+                future = concurrent.futures.Future()
+                self._inflight[key] = [future, 0]
+        if call is not None:
+            logger.debug('Waiting for the GET on %s already in flight', endpoint)
+            return copy.deepcopy(call[0].result())
+        try:
+            data = self._get_json_uncoalesced(endpoint, params, key, ttl)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._inflight_lock:
+                waiters = self._inflight.pop(key)[1]
+        future.set_result(data)
+        return copy.deepcopy(data) if waiters else data
+
+    def _get_json_uncoalesced(self, endpoint, params, key, ttl=None):
+        """GET endpoint and decode the JSON response, going through the response cache if there is one"""
+        if self._cache is None:
+            ttl = 0
+        elif ttl is None:
+            ttl = self._cache.ttl(endpoint)
+        if not ttl:
+            return self._request_json('GET', endpoint, params=params)
+        entry = self._cache.get(key)
+        if entry is not None and entry.fresh():
+            logger.debug('Cache hit for %s', endpoint)
+            return self._codec.loads(entry.body)
+        headers = entry.validators() if entry is not None else {}
+        r, event = self._send_as_user('GET', endpoint, params=params, headers=headers)
+        try:
+            if r.status_code == 304 and entry is not None:
+                logger.debug('Cached response for %s is still current', endpoint)
+                entry.expires = time.time() + ttl
+                self._cache.set(key, entry)
+                return self._codec.loads(entry.body)
+            r.raise_for_status()
+            self._cache.set(key, CacheEntry(r.text, time.time() + ttl, r.headers.get('ETag'),
+                                            r.headers.get('Last-Modified')))
+            return self._decode(r, event)
+        finally:
+            self._emit(event)
+
+    def _invalidate(self, *endpoints):
+        """Drop cached responses for endpoints changed by a write"""
+        if self._cache is None:
+            return
+        for endpoint in endpoints:
+            self._cache.invalidate('{} {}'.format(self._username, endpoint))
 
     @staticmethod
-    def create_user() -> dict:
+    def create_user(url: str=DEFAULT_URL) -> dict:
         """
         Create a new username and password in Trackobot.
         Returns JSON of the format {'username': 'newuser', 'password': 'password}
 
+        :param str url: The Trackobot server to create the user on
         :return: Dictionary of new user data
         :raises: requests.exceptions.HTTPError on error
         """
         logger.info('Called create_user()')
         endpoint = '/users.json'
-        url = 'https://trackobot.com' + endpoint
+        url = url.rstrip('/') + endpoint
         logger.debug('POST on %s', endpoint)
         r = requests.post(url)
         r.raise_for_status()
-        return r.json()
+        return get_codec().loads(r.content)
 
     def rename_user(self, name: str):
         """
@@ -48,14 +504,12 @@ class Trackobot:
         """
         logger.info('Called rename_user()')
         logger.debug('GET on /profile to get user\'s ID')
-        r = requests.get('https://trackobot.com/profile', auth=self._auth)
+        r = self._request('GET', '/profile')
         user_id = r.text.split('edit_user_',1)[1].split('"')[0]
         logger.debug('User ID is %s', user_id)
         endpoint = '/users/{}/rename'.format(user_id)
-        url = self._url + endpoint
         data = {'_method': 'patch', 'user[displayname]': name}
-        logger.debug('POST on %s', endpoint)
-        r = requests.post(url, auth=self._auth, data=data)
+        r = self._request('POST', endpoint, data=data)
         r.raise_for_status()
 
     def one_time_auth(self) -> str:
@@ -67,12 +521,8 @@ class Trackobot:
         :raises: requests.exceptions.HTTPError on error
         """
         logger.info('Called one_time_auth()')
-        endpoint = '/one_time_auth.json'
-        url = self._url + endpoint
-        logger.debug('POST on %s', endpoint)
-        r = requests.post(url, auth=self._auth)
-        r.raise_for_status()
-        return r.json()['url'] if 'error' not in r.json() else r.json()['error']
+        data = self._request_json('POST', '/one_time_auth.json')
+        return data['url'] if 'error' not in data else data['error']
 
     def modify_metadata(self, game_id: int, param: str, value: str) -> bool:
         """
@@ -91,17 +541,24 @@ class Trackobot:
         :raises: ValueError
         """
         logger.info('Called modify_metadata()')
-        allowed_params = ['added', 'mode', 'win', 'hero', 'opponenet',
-                          'coin', 'duration', 'rank', 'legend', 'deck_id',
-                          'opponent_deck_id', 'note']
-        if param not in allowed_params:
-            logger.error('Parameter %s is not an approved value', param)
-            raise ValueError('param must be one of ' + ', '.join(allowed_params))
-        endpoint = '/profile/results/'
-        url = self._url + endpoint + str(game_id)
-        data = {param: value}
-        logger.debug('PUT on %s', endpoint)
-        r = requests.put(url, auth=self._auth, json=data)
+        return self.patch_metadata(game_id, {param: value})
+
+    def patch_metadata(self, game_id: int, changes: dict) -> bool:
+        """
+        Modify several metadata fields of a specified game in one request.
+        The fields that can be changed are the same as for modify_metadata().
+
+        :param int game_id: The ID of the game to be modified
+        :param dict changes: Mapping of parameter name to its new value
+        :return: True if successfully changed, False otherwise
+        :rtype: bool
+        :raises: ValueError
+        """
+        logger.info('Called patch_metadata()')
+        _check_patch(game_id, changes)
+        endpoint = '/profile/results/' + str(game_id)
+        r = self._request('PUT', endpoint, **self._json_body(dict(changes)))
+        self._invalidate(*_GAME_ENDPOINTS)
         if r.status_code == 204:
             logger.info('Modify succeeded')
             return True
@@ -134,35 +591,144 @@ class Trackobot:
         :raises: TypeError
         """
         logger.info('Called stats()')
-        allowed_endpoints = ['classes', 'decks', 'arena']
-        allowed_range = ['current_month', 'all', 'last_3_days', 'last_24_hours', 'custom']
-        allowed_modes = ['ranked', 'arena', 'casual', 'friendly', 'all']
-        if stats_type not in allowed_endpoints:
-            logger.error('%s is not an allowed stats_type', stats_type)
-            raise ValueError('stats_type must be one of ' + ', '.join(allowed_endpoints))
-        if time_range not in allowed_range:
-            logger.error('%s is not an allowed time_range', time_range)
-            raise ValueError('time_range must be one of ' + ', '.join(allowed_range))
-        if mode not in allowed_modes:
-            logger.error('%s is not an allowed mode', mode)
-            raise ValueError('mode must be one of ' + ', '.join(allowed_modes))
-        if time_range == 'custom' and \
-            (start is None or end is None or type(start) != datetime.datetime or type(end) != datetime.datetime):
-            logger.error('start and end must be of type datetime.datetime when using custom time_range')
-            raise TypeError('If using "custom" mode then you must specify a datetime.datetime for start and end')
-        endpoint = '/profile/stats/{}.json'.format(stats_type)
-        params = {'mode': mode, 'time_range': time_range}
-        if 'custom' == time_range:
-            params.update({'start': start.strftime('%Y-%m-%d'), 'end': start.strftime('%Y-%m-%d')})
-        if stats_type == 'decks':
-            params.update({'as_deck': as_deck, 'vs_deck': vs_deck})
-        elif stats_type == 'classes':
-            params.update({'as_hero': as_hero, 'vs_hero': vs_hero})
-        url = self._url + endpoint
-        logger.debug('GET on %s', endpoint)
-        r = requests.get(url, auth=self._auth, params=params)
-        r.raise_for_status()
-        return r.json()
+        endpoint, params = _stats_request(stats_type, time_range, mode, start, end,
+                                          as_hero, vs_hero, as_deck, vs_deck)
+        return self._get_json(endpoint, params)
+
+    def stats_matrix(self, stats_type: str='classes', time_range: str='all', mode: str='all',
+                     start: datetime.datetime=None, end: datetime.datetime=None, rows: list=None,
+                     workers: int=9) -> dict:
+        """
+        Get the record of every class against every other class, or of
+        every deck against every other deck, as a matchup matrix.
+
+        Each stats response for one class, or deck, already breaks its games
+        down by opponent, so one request is made per row of the matrix, not
+        one per cell. The rows are requested concurrently over a pool of at
+        most ``workers`` threads, and identical requests already in flight,
+        such as from another thread refreshing the same matrix, are only
+        sent once. Returns::
+
+            {'matrix': {'Shaman': {'Warrior': {'wins': 3, 'losses': 1, 'total': 4, 'winrate': 75.0}, ...}, ...},
+             'overall': {'Shaman': {'wins': ..., 'losses': ..., 'total': ..., 'winrate': ...}, ...}}
+
+        Classes are named as in the stats responses. For decks, rows and
+        columns are named by deck name.
+
+        :param str stats_type: classes or decks
+        :param str time_range: A time range to get stats for. One of current_month, all, last_3_days, last_24_hours, custom
+        :param str mode: The game mode to get stats for. One of ranked, arena, casual, friendly, all
+        :param datetime.datetime start: If using "custom" for time_range, a starting datetime.datetime date
+        :param datetime.datetime end: If using "custom" for time_range, an ending datetime.datetime date
+        :param list rows: The classes, or deck IDs, to get rows for. Defaults to every class, or every deck in decks()
+        :param int workers: The maximum number of rows to request at the same time
+        :return: Dictionary with the matrix and the overall record of each row
+        :rtype: dict
+        :raises: requests.exceptions.HTTPError on error
+        :raises: ValueError
+        :raises: TypeError
+        """
+        logger.info('Called stats_matrix()')
+        if stats_type not in ('classes', 'decks'):
+            logger.error('%s is not a matrix stats_type', stats_type)
+            raise ValueError('stats_type must be one of classes, decks')
+        if workers < 1:
+            logger.error('workers must be at least 1, got %d', workers)
+            raise ValueError('workers must be at least 1')
+        _stats_request(stats_type, time_range, mode, start, end, None, None, None, None)
+        names = {}
+        if rows is None and stats_type == 'classes':
+            rows = HEROES
+        elif rows is None:
+            names = _deck_names(self.decks())
+            rows = names
+        rows = list(rows)
+        if not rows:
+            return {'matrix': {}, 'overall': {}}
+        as_key, vs_key = ('as_class', 'vs_class') if stats_type == 'classes' else ('as_deck', 'vs_deck')
+
+        def row(value):
+            filters = {'as_hero': value} if stats_type == 'classes' else {'as_deck': value}
+            return self.stats(stats_type=stats_type, time_range=time_range, mode=mode, start=start, end=end,
+                              **filters)['stats']
+
+        logger.debug('Fetching %d rows with %d workers', len(rows), workers)
+        matrix, overall = {}, {}
+        with concurrent.futures.ThreadPoolExecutor(max_workers=min(workers, len(rows))) as pool:
+            for value, stats in zip(rows, pool.map(row, rows)):
+                found = list(stats.get(as_key) or ())
+                if len(found) == 1:
+                    name = found[0]
+                elif stats_type == 'classes':
+                    name = value.capitalize()
+                else:
+                    name = names.get(value, str(value))
+                matrix[name] = stats.get(vs_key) or {}
+                overall[name] = stats['overall']
+        return {'matrix': matrix, 'overall': overall}
+
+    def stats_timeseries(self, start, end, bucket: str='day', stats_type: str='classes', mode: str='all',
+                         as_hero: str=None, vs_hero: str=None, as_deck: int=None, vs_deck: int=None,
+                         workers: int=4, now: datetime.datetime=None) -> list:
+        """
+        Get the user's record for each day or week from start to end, such
+        as to plot a winrate trend. One custom time range stats request is
+        made per bucket, and the buckets are requested concurrently over a
+        pool of at most ``workers`` threads. Weeks run from Monday to Sunday,
+        so the first and last week may reach past start and end.
+
+        With a response cache, the stats of buckets that ended more than a
+        day ago, which allows for the server's time zone, are kept for 30
+        days instead of the cache's usual TTL, so that repeated calls only
+        request the buckets that are still open. Changing games through
+        this instance clears them as usual.
+
+        Returns a list ordered by time::
+
+            [{'start': '2017-03-01', 'end': '2017-03-01', 'wins': 3, 'losses': 1, 'total': 4, 'winrate': 75.0}, ...]
+
+        :param start: The first day to include, as a datetime.date or datetime.datetime
+        :param end: The last day to include, as a datetime.date or datetime.datetime
+        :param str bucket: day or week
+        :param str stats_type: The type of stats to get each record from. One of decks, classes, arena
+        :param str mode: The game mode to get stats for. One of ranked, arena, casual, friendly, all
+        :param str as_hero: If getting by class, only count games played as the specified hero
+        :param str vs_hero: If getting by class, only count games played against the specified hero
+        :param int as_deck: If getting by deck, only count games played as the specified deck
+        :param int vs_deck: If getting by deck, only count games played against the specified deck
+        :param int workers: The maximum number of buckets to request at the same time
+        :param datetime.datetime now: The time buckets are judged open or closed at. Defaults to the current time
+        :return: List of records, one per bucket
+        :rtype: list
+        :raises: requests.exceptions.HTTPError on error
+        :raises: ValueError
+        """
+        logger.info('Called stats_timeseries()')
+        if workers < 1:
+            logger.error('workers must be at least 1, got %d', workers)
+            raise ValueError('workers must be at least 1')
+        start = start.date() if isinstance(start, datetime.datetime) else start
+        end = end.date() if isinstance(end, datetime.datetime) else end
+        if end < start:
+            logger.error('end %s is before start %s', end, start)
+            raise ValueError('end must not be before start')
+        buckets = _buckets(start, end, bucket)
+        midnight = datetime.datetime.combine(start, datetime.time())
+        _stats_request(stats_type, 'custom', mode, midnight, midnight, as_hero, vs_hero, as_deck, vs_deck)
+        now = now or datetime.datetime.now(datetime.timezone.utc)
+        closed_before = now.date() - datetime.timedelta(days=1)
+
+        def record(days):
+            first, last = (datetime.datetime.combine(day, datetime.time()) for day in days)
+            endpoint, params = _stats_request(stats_type, 'custom', mode, first, last,
+                                              as_hero, vs_hero, as_deck, vs_deck)
+            ttl = _CLOSED_BUCKET_TTL if days[1] < closed_before else None
+            overall = self._get_json(endpoint, params, ttl=ttl)['stats']['overall']
+            return dict({'start': first.strftime('%Y-%m-%d'), 'end': last.strftime('%Y-%m-%d')}, **overall)
+
+        logger.debug('Fetching %d %s buckets with %d workers', len(buckets), bucket, workers)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=min(workers, len(buckets))) as pool:
+            return list(pool.map(record, buckets))
 
     def decks(self) -> dict:
         """
@@ -173,12 +739,7 @@ class Trackobot:
         :raises: requests.exceptions.HTTPError on error
         """
         logger.info('Called decks()')
-        endpoint = '/profile/settings/decks.json'
-        url = self._url + endpoint
-        logger.debug('GET on %s', endpoint)
-        r = requests.get(url, auth=self._auth)
-        r.raise_for_status()
-        return r.json()
+        return self._get_json('/profile/settings/decks.json')
 
     def reset(self, modes: list=None):
         """
@@ -192,18 +753,11 @@ class Trackobot:
         :raises: ValueError
         """
         logger.info('Called reset()')
-        allowed = ['ranked', 'casual', 'practice', 'arena', 'friendly']
-        if modes is None:
-            modes = allowed
-        if any(mode not in allowed for mode in modes):
-            logger.error('Invalid mode(s) given')
-            raise ValueError('modes list can only contain ' + ', '.join(allowed))
-        endpoint = '/profile/settings/account/reset'
-        url = self._url + endpoint
+        modes = _reset_modes(modes)
         data = {'reset_modes[]': modes}
-        logger.debug('POST on %s', endpoint)
-        r = requests.post(url, auth=self._auth, data=data)
+        r = self._request('POST', '/profile/settings/account/reset', data=data)
         r.raise_for_status()
+        self._invalidate(*_GAME_ENDPOINTS)
 
     def history(self, page: int=1, query: str=None) -> dict:
         """
@@ -219,15 +773,7 @@ class Trackobot:
         :raises: requests.exceptions.HTTPError on error
         """
         logger.info('Called history()')
-        endpoint = '/profile.json' 
-        url = self._url + endpoint
-        params = {'page': page}
-        if query is not None:
-            params['query'] = query
-        logger.debug('GET on %s', endpoint)
-        r = requests.get(url, auth=self._auth, params=params)
-        r.raise_for_status()
-        return r.json()
+        return self._get_json('/profile.json', {'page': page, 'query': query})
 
     def arena_history(self, page: int=1) -> dict:
         """
@@ -240,13 +786,159 @@ class Trackobot:
         :raises: requests.exceptions.HTTPError on error
         """
         logger.info('Called arena_history()')
-        endpoint = '/profile/arena.json' 
-        url = self._url + endpoint
-        params = {'page': page}
-        logger.debug('GET on %s', endpoint)
-        r = requests.get(url, auth=self._auth, params=params)
-        r.raise_for_status()
-        return r.json()
+        return self._get_json('/profile/arena.json', {'page': page})
+
+    def fetch_history_pages(self, start: int=1, count: int=None, workers: int=4,
+                            arena: bool=False, query: str=None) -> list:
+        """
+        Get the games on several pages of history at once.
+        The first page is fetched on its own to learn the total number of
+        pages; the rest are fetched concurrently over a pool of at most
+        ``workers`` threads. Games are returned in page order.
+
+        :param int start: The page to start from
+        :param int count: The number of pages to get. None gets every page from start onwards
+        :param int workers: The maximum number of pages to fetch at the same time
+        :param bool arena: If True, get arena history instead of all history
+        :param str query: A query string to narrow results. Not supported for arena history
+        :return: List of game dictionaries
+        :rtype: list
+        :raises: requests.exceptions.HTTPError on error
+        :raises: ValueError
+        """
+        logger.info('Called fetch_history_pages()')
+        if workers < 1:
+            logger.error('workers must be at least 1, got %d', workers)
+            raise ValueError('workers must be at least 1')
+        if arena and query is not None:
+            logger.error('query is not supported for arena history')
+            raise ValueError('query is not supported for arena history')
+        if count is not None and count < 1:
+            return []
+        key = 'arena' if arena else 'history'
+
+        def fetch(page):
+            return self._fetch_page(page, arena, query)
+
+        first = fetch(start)
+        last = first['meta']['total_pages']
+        if count is not None:
+            last = min(last, start + count - 1)
+        games = list(first[key])
+        pages = range(start + 1, last + 1)
+        if not pages:
+            return games
+        logger.debug('Fetching pages %d to %d with %d workers', start + 1, last, workers)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=min(workers, len(pages))) as pool:
+            for data in pool.map(fetch, pages):
+                games.extend(data[key])
+        return games
+
+    def iter_history(self, query: str=None, arena: bool=False, start: int=1, count: int=None,
+                     prefetch: int=0, typed: bool=False):
+        """
+        Lazily iterate over the user's games.
+        Pages are requested one at a time as the previous page is used up,
+        so only a single page of games is held in memory.
+        With ``prefetch`` set, up to that many of the following pages are
+        downloaded in the background while the current page is consumed.
+        With ``typed`` set, games are yielded as trackopy.models.Game
+        records, which take far less memory than dictionaries when many
+        games are kept.
+
+        :param str query: A query string to narrow results. Not supported for arena history
+        :param bool arena: If True, iterate over arena history instead of all history
+        :param int start: The page to start from
+        :param int count: The number of pages to get. None gets every page from start onwards
+        :param int prefetch: The number of pages to download ahead of the consumer. 0 disables prefetching
+        :param bool typed: If True, yield Game records instead of dictionaries
+        :return: Generator of game dictionaries, or of Game records if typed is set
+        :raises: requests.exceptions.HTTPError on error
+        :raises: ValueError
+        """
+        logger.info('Called iter_history()')
+        pages = self.iter_history_pages(query=query, arena=arena, start=start, count=count,
+                                        prefetch=prefetch, typed=typed)
+        return (game for games in pages for game in games)
+
+    def iter_history_pages(self, query: str=None, arena: bool=False, start: int=1, count: int=None,
+                           prefetch: int=0, typed: bool=False):
+        """
+        Lazily iterate over pages of the user's history.
+        Like iter_history(), but yields the list of games on each page.
+        Pages still being prefetched are cancelled when the generator is
+        closed or garbage collected.
+
+        :param str query: A query string to narrow results. Not supported for arena history
+        :param bool arena: If True, iterate over arena history instead of all history
+        :param int start: The page to start from
+        :param int count: The number of pages to get. None gets every page from start onwards
+        :param int prefetch: The number of pages to download ahead of the consumer. 0 disables prefetching
+        :param bool typed: If True, yield lists of Game records instead of dictionaries
+        :return: Generator of lists of game dictionaries, or of Game records if typed is set
+        :raises: requests.exceptions.HTTPError on error
+        :raises: ValueError
+        """
+        logger.info('Called iter_history_pages()')
+        if arena and query is not None:
+            logger.error('query is not supported for arena history')
+            raise ValueError('query is not supported for arena history')
+        if prefetch < 0:
+            logger.error('prefetch must not be negative, got %d', prefetch)
+            raise ValueError('prefetch must not be negative')
+        if prefetch:
+            pages = self._prefetch_pages(start, count, arena, query, prefetch)
+        else:
+            pages = self._iter_pages(start, count, arena, query)
+        if typed:
+            return ([Game.from_dict(game) for game in games] for games in pages)
+        return pages
+
+    def _fetch_page(self, page, arena, query):
+        logger.debug('Getting page %d of history', page)
+        if arena:
+            return self.arena_history(page=page)
+        return self.history(page=page, query=query)
+
+    def _iter_pages(self, start, count, arena, query):
+        """Yield the list of games on each page in order, one request per page"""
+        key = 'arena' if arena else 'history'
+        page = start
+        while count is None or page < start + count:
+            data = self._fetch_page(page, arena, query)
+            yield data[key]
+            if page >= data['meta']['total_pages']:
+                logger.debug('Hit max pages on account')
+                return
+            page += 1
+
+    def _prefetch_pages(self, start, count, arena, query, depth):
+        """Like _iter_pages, but keep up to depth later pages downloading in the background"""
+        if count is not None and count < 1:
+            return
+        key = 'arena' if arena else 'history'
+        first = self._fetch_page(start, arena, query)
+        last = first['meta']['total_pages']
+        if count is not None:
+            last = min(last, start + count - 1)
+        pool = concurrent.futures.ThreadPoolExecutor(max_workers=depth)
+        pending = collections.deque()
+        next_page = start + 1
+        try:
+            while next_page <= last and len(pending) < depth:
+                pending.append(pool.submit(self._fetch_page, next_page, arena, query))
+                next_page += 1
+            yield first[key]
+            while pending:
+                data = pending.popleft().result()
+                if next_page <= last:
+                    pending.append(pool.submit(self._fetch_page, next_page, arena, query))
+                    next_page += 1
+                yield data[key]
+        finally:
+            for future in pending:
+                future.cancel()
+            pool.shutdown(wait=False)
 
     def toggle_tracking(self, enabled: bool=True):
         """
@@ -257,12 +949,9 @@ class Trackobot:
         :raises: requests.exceptions.HTTPError on error
         """
         logger.info('Called toggle_tracking()')
-        endpoint = '/profile/settings/decks/toggle'
-        url = self._url + endpoint
         val = 'true' if enabled else 'false'
         data = {'user[deck_tracking]': val, '_method': 'put'}
-        logger.debug('POST on %s', endpoint)
-        r = requests.post(url, auth=self._auth, data=data)
+        r = self._request('POST', '/profile/settings/decks/toggle', data=data)
         r.raise_for_status()
 
     def delete_game(self, game_id: int):
@@ -273,11 +962,9 @@ class Trackobot:
         :return: None
         """
         logger.info('Called delete_game()')
-        endpoint = '/profile/results/' + str(game_id)
-        url = self._url + endpoint
-        logger.debug('DELETE on %s', endpoint)
-        r = requests.delete(url, auth=self._auth)
+        r = self._request('DELETE', '/profile/results/' + str(game_id))
         r.raise_for_status()
+        self._invalidate(*_GAME_ENDPOINTS)
 
     def upload_game(self, game_data: dict) -> dict:
         """
@@ -293,10 +980,73 @@ class Trackobot:
         :raises: requests.exceptions.HTTPError on error
         """
         logger.info('Called upload_game()')
-        endpoint = '/profile/results.json'
-        url = self._url + endpoint
-        logger.debug('POST on %s', endpoint)
-        r = requests.post(url, auth=self._auth, json=game_data)
-        r.raise_for_status()
-        return r.json()
+        data = self._request_json('POST', '/profile/results.json', **self._json_body(game_data))
+        self._invalidate(*_GAME_ENDPOINTS)
+        return data
+
+    def upload_games(self, games, workers: int=4):
+        """
+        Upload many games concurrently.
+        Games are read from the iterable as workers become free, and a
+        BulkResult is yielded for each one in the order given. A failed
+        upload is reported in its result's ``error`` rather than raised, so
+        the remaining games are still uploaded.
+
+        :param games: An iterable of game dictionaries, as accepted by upload_game()
+        :param int workers: The maximum number of uploads to run at the same time
+        :return: Generator of BulkResult whose result is the newly created game
+        :raises: ValueError if workers is less than 1
+        """
+        logger.info('Called upload_games()')
+        return _bulk(self.upload_game, games, workers)
 
+    def delete_games(self, game_ids, workers: int=4):
+        """
+        Delete many games concurrently.
+        Yields a BulkResult for each game ID in the order given, with any
+        failure reported in its ``error`` rather than raised.
+
+        :param game_ids: An iterable of the IDs of the games to delete
+        :param int workers: The maximum number of deletes to run at the same time
+        :return: Generator of BulkResult whose item is the game ID
+        :raises: ValueError if workers is less than 1
+        """
+        logger.info('Called delete_games()')
+        return _bulk(self.delete_game, game_ids, workers)
+
+    def modify_metadata_many(self, updates, workers: int=4):
+        """
+        Modify the metadata of many games concurrently.
+        Each update is a (game_id, param, value) tuple as passed to
+        modify_metadata(). Every update is validated before any request is
+        sent. Yields a BulkResult for each update in the order given; its
+        ``ok`` is False if the server refused the change.
+
+        :param updates: An iterable of (game_id, param, value) tuples
+        :param int workers: The maximum number of modifications to run at the same time
+        :return: Generator of BulkResult whose item is the update tuple
+        :raises: ValueError if a param is not allowed or workers is less than 1
+        """
+        logger.info('Called modify_metadata_many()')
+        updates = list(updates)
+        for _, param, _ in updates:
+            _check_metadata_param(param)
+        return _bulk(lambda update: self.modify_metadata(*update), updates, workers)
+
+    def patch_metadata_many(self, patches, workers: int=4):
+        """
+        Apply patch_metadata() to many games concurrently.
+        Every patch is validated before any request is sent. Yields a
+        BulkResult for each patch in the order given; its ``ok`` is False
+        if the server refused the change.
+
+        :param patches: An iterable of (game_id, changes) tuples
+        :param int workers: The maximum number of games to modify at the same time
+        :return: Generator of BulkResult whose item is the (game_id, changes) tuple
+        :raises: ValueError if a param is not allowed, a patch is empty or workers is less than 1
+        """
+        logger.info('Called patch_metadata_many()')
+        patches = list(patches)
+        for game_id, changes in patches:
+            _check_patch(game_id, changes)
+        return _bulk(lambda patch: self.patch_metadata(*patch), patches, workers)